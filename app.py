@@ -1,10 +1,32 @@
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from flask import Flask, Response, request, jsonify, render_template, send_from_directory, stream_with_context, g, has_request_context
 from flask_cors import CORS
 import pandas as pd
 import json
+import hmac
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from utils.analyse import DataAnalyzer
+from utils.correlation import CorrelationEngine
 from utils.prompt import GeminiService
+from utils.proposal_cache import ProposalCache
+from utils.llm_client import LLMClient
+from utils.prompt_builder import PromptBuilder
+from utils.proposal_stream import validate_proposal
+from utils.cache import AnalysisCache, DatasetFingerprint, ResultCache
+from utils.store import DatasetStore
+from utils.persistence import DatasetPersistence
+from utils.registry import DatasetRegistry
+from utils.streaming import StreamingAnalyzer, read_csv_streaming
+from utils.schema import infer_schema, fit_schema, apply_schema
+from utils.shared_work import SharedWork
+from utils.jobs import JobQueue
+from utils.query import create_engine
+from utils.cube import GroupCube
+from utils.metrics import MetricsRegistry, SIZE_BUCKETS
+from utils.profiling import RequestProfile, ProfileStore
+from utils.encoding import to_columnar, to_arrow, dumps, negotiate_encoding, compress, ARROW_TYPES, ARROW_MIMETYPE
 from dotenv import load_dotenv
 load_dotenv()
 app = Flask(__name__)
@@ -13,13 +35,342 @@ CORS(app)
 # Configuration
 UPLOAD_FOLDER = 'data'
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+# Uploads bigger than this are parsed and analyzed chunk by chunk
+STREAMING_THRESHOLD_MB = int(os.getenv('STREAMING_THRESHOLD_MB', 50))
+STREAMING_CHUNK_ROWS = int(os.getenv('STREAMING_CHUNK_ROWS', 100000))
+
+# LLM proposals are cached per question and dataset context, in memory and on disk
+PROPOSAL_CACHE_TTL = int(os.getenv('PROPOSAL_CACHE_TTL', 7 * 24 * 3600))
+
+# Per-stage latencies, payload sizes, token usage and cache/dataset state, at /api/metrics
+metrics = MetricsRegistry()
+stage_seconds = metrics.histogram(
+    'dataviz_stage_seconds', 'Time spent in each stage of a request', labels=('route', 'stage')
+)
+request_seconds = metrics.histogram(
+    'dataviz_request_seconds', 'Request latency up to the response headers', labels=('route', 'status')
+)
+response_bytes = metrics.histogram(
+    'dataviz_response_bytes', 'Response body size', labels=('route',), buckets=SIZE_BUCKETS
+)
+llm_tokens = metrics.counter(
+    'dataviz_llm_tokens_total', 'LLM tokens used, as reported by the provider', labels=('kind',)
+)
+
+def current_route():
+    if has_request_context() and request.endpoint:
+        return request.endpoint
+    return 'background'
+
+def stage(name, route=None):
+    """Time a stage of the current request (or of `route` outside of one)"""
+    return stage_seconds.time(route=route or current_route(), stage=name)
+
+def record_llm_usage(usage):
+    for kind in ('prompt', 'completion'):
+        llm_tokens.inc(usage.get(f'{kind}_tokens') or 0, kind=kind)
 
 # Initialize services
-data_analyzer = DataAnalyzer()
-gemini_service = GeminiService(api_key=os.getenv('GROQ_API_KEY'))
+# Correlations of datasets longer than this are estimated from a row sample (0: always exact)
+CORRELATION_SAMPLE_ROWS = int(os.getenv('CORRELATION_SAMPLE_ROWS', 0))
+# Engine of the bar and pie aggregations: pandas, polars (multithreaded, in memory) or
+# duckdb (SQL over the stored dataset files); all give the results of pandas
+QUERY_ENGINE = os.getenv('QUERY_ENGINE', 'pandas')
+data_analyzer = DataAnalyzer(
+    CorrelationEngine(sample_rows=CORRELATION_SAMPLE_ROWS or None),
+    create_engine(QUERY_ENGINE)
+)
+proposal_cache = ProposalCache(
+    os.path.join(UPLOAD_FOLDER, 'proposal_cache'),
+    ttl=PROPOSAL_CACHE_TTL
+)
+llm_client = LLMClient(
+    "https://api.groq.com/openai/v1/chat/completions",
+    api_key=os.getenv('GROQ_API_KEY'),
+    timeout=float(os.getenv('LLM_TIMEOUT', 60)),
+    max_retries=int(os.getenv('LLM_MAX_RETRIES', 3)),
+    max_concurrency=int(os.getenv('LLM_MAX_CONCURRENCY', 8))
+)
+prompt_builder = PromptBuilder(token_budget=int(os.getenv('PROMPT_TOKEN_BUDGET', 2000)))
+gemini_service = GeminiService(
+    api_key=os.getenv('GROQ_API_KEY'),
+    cache=proposal_cache,
+    client=llm_client,
+    prompt_builder=prompt_builder,
+    timer=stage,
+    on_usage=record_llm_usage
+)
+analysis_cache = AnalysisCache()
+# Larger uploads are first analyzed on a sample sized to the latency target,
+# the exact analysis replacing it in the background
+APPROX_ANALYSIS_ROWS = int(os.getenv('APPROX_ANALYSIS_ROWS', 1000000))
+ANALYSIS_LATENCY_TARGET = float(os.getenv('ANALYSIS_LATENCY_TARGET', 2.0))
+analysis_executor = ThreadPoolExecutor(max_workers=1)
+pending_upgrades = set()
+upgrades_lock = threading.Lock()
+# Prepared chart payloads, bounded by their encoded size
+RESULT_CACHE_MB = int(os.getenv('RESULT_CACHE_MB', 256))
+result_cache = ResultCache(max_bytes=RESULT_CACHE_MB * 1024 * 1024)
+
+# Uploads are persisted as Parquet in the data folder and kept in memory
+# within a RAM budget, least recently used datasets being reloaded from disk
+DATASET_MEMORY_BUDGET_MB = int(os.getenv('DATASET_MEMORY_BUDGET_MB', 1024))
+# Requests must name their dataset; only a single-client (dev) setup may fall
+# back to the latest upload, which could be another client's in a shared store
+SINGLE_CLIENT_MODE = os.getenv('SINGLE_CLIENT_MODE', '0') == '1'
+# Charts of a batch are prepared concurrently on this pool
+BATCH_WORKERS = int(os.getenv('BATCH_WORKERS', 4))
+batch_executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS)
+# Uploads are parsed and analyzed by a background pool; each one reserves an
+# estimate of its peak memory (CSV size times UPLOAD_MEMORY_FACTOR, one chunk
+# for streamed files) and waits until that fits in the upload memory budget
+UPLOAD_WORKERS = int(os.getenv('UPLOAD_WORKERS', 2))
+UPLOAD_MAX_PENDING = int(os.getenv('UPLOAD_MAX_PENDING', 8))
+UPLOAD_MEMORY_BUDGET_MB = int(os.getenv('UPLOAD_MEMORY_BUDGET_MB', 2048))
+UPLOAD_MEMORY_FACTOR = float(os.getenv('UPLOAD_MEMORY_FACTOR', 4))
+UPLOAD_SPOOL = os.path.join(UPLOAD_FOLDER, 'uploads')
+
+# Datasets and upload jobs are listed in a SQLite registry shared by every
+# worker process, so any worker can serve any dataset. DATASET_FORMAT=arrow
+# stores datasets as Arrow IPC files that workers memory-map and share
+# instead of each decoding its own copy (parquet: smaller files)
+DATASET_FORMAT = os.getenv('DATASET_FORMAT', 'parquet')
+# After an upload, numeric columns are summarized per category of every column with
+# at most this many categories, and bar/pie charts are answered from that (0: off)
+CUBE_MAX_CATEGORIES = int(os.getenv('CUBE_MAX_CATEGORIES', 50))
+JOB_STATE_TTL = int(os.getenv('JOB_STATE_TTL', 24 * 3600))
+# Seconds a dataset confirmed by the registry is served without asking it again:
+# the delay before a worker sees a dataset removed by another one
+DATASET_REGISTRY_TTL = float(os.getenv('DATASET_REGISTRY_TTL', 1.0))
+dataset_registry = DatasetRegistry(os.path.join(UPLOAD_FOLDER, 'registry.sqlite'))
+dataset_registry.forget_jobs(older_than=JOB_STATE_TTL)
+
+def publish_job(job):
+    """Mirror a job's state in the registry for workers polled about it"""
+    try:
+        dataset_registry.save_job(job.id, job.to_dict())
+    except Exception as e:
+        print(f"Error publishing job {job.id}: {e}")
+
+upload_jobs = JobQueue(
+    workers=UPLOAD_WORKERS,
+    memory_budget=UPLOAD_MEMORY_BUDGET_MB * 1024 * 1024,
+    max_pending=UPLOAD_MAX_PENDING,
+    on_change=publish_job
+)
+persistence = DatasetPersistence(UPLOAD_FOLDER, format=DATASET_FORMAT)
+dataset_store = DatasetStore(
+    persistence,
+    memory_budget=DATASET_MEMORY_BUDGET_MB * 1024 * 1024,
+    registry=dataset_registry,
+    registry_ttl=DATASET_REGISTRY_TTL
+)
+
+def resolve_dataset_id(data):
+    """Dataset ID of a request and None, or None and the error response"""
+    dataset_id = (data or {}).get('dataset_id')
+    if not dataset_id and SINGLE_CLIENT_MODE:
+        dataset_id = dataset_store.latest_id
+    if not dataset_id:
+        return None, (jsonify({'error': 'No dataset_id provided'}), 400)
+    if dataset_id not in dataset_store:
+        return None, (jsonify({'error': 'Dataset not found'}), 404)
+    return dataset_id, None
+
+def dataset_analysis(dataset_id):
+    """Analysis of a dataset: memory cache, then the persisted copy, then a full analysis"""
+    def compute():
+        meta = persistence.load_meta(dataset_id) or {}
+        if meta.get('analysis') is not None:
+            return meta['analysis']
+        analysis = data_analyzer.analyze_dataset(
+            dataset_store.get(dataset_id),
+            schema=dataset_store.schema(dataset_id),
+            version=dataset_store.version(dataset_id)
+        )
+        persistence.update_meta(dataset_id, analysis=analysis)
+        return analysis
+    analysis = analysis_cache.get_or_compute(dataset_store.version(dataset_id), compute)
+    if 'approximate' in analysis:
+        schedule_exact_analysis(dataset_id)
+    return analysis
+
+def schedule_exact_analysis(dataset_id):
+    """Replace the approximate analysis of a dataset by the exact one, in the background"""
+    version = dataset_store.version(dataset_id)
+    with upgrades_lock:
+        if version in pending_upgrades:
+            return
+        pending_upgrades.add(version)
+
+    def upgrade():
+        try:
+            analysis = data_analyzer.analyze_dataset(
+                dataset_store.get(dataset_id),
+                schema=dataset_store.schema(dataset_id),
+                version=version
+            )
+            analysis_cache.put(version, analysis)
+            # The dataset may have been replaced meanwhile
+            if dataset_id in dataset_store:
+                persistence.update_meta(dataset_id, analysis=analysis)
+        except Exception as e:
+            print(f"Error computing exact analysis of {dataset_id}: {e}")
+        finally:
+            with upgrades_lock:
+                pending_upgrades.discard(version)
+
+    analysis_executor.submit(upgrade)
+
+def ingest_streaming(file, job=None):
+    """Parse a CSV chunk by chunk straight into Parquet, analyzing it in the same pass"""
+    dataset_id = dataset_store.new_id()
+    writer = persistence.writer(dataset_id)
+    fingerprint = DatasetFingerprint()
+    analyzer = StreamingAnalyzer()
+    schema = None
+    rekinded = False
+    nbytes = 0
+    
+    def prepare(chunk):
+        # Column kinds come from the first chunk and widen when a later one does not
+        # fit them (integers to floats, numbers to text); widths are not downcast
+        nonlocal schema, rekinded
+        if schema is None:
+            schema = infer_schema(chunk, downcast=False)
+        else:
+            schema, changed = fit_schema(chunk, schema)
+            rekinded = rekinded or bool(changed)
+        return apply_schema(chunk, schema, categories=False)
+    
+    def on_chunk(chunk, rows):
+        nonlocal nbytes
+        writer.write(chunk)
+        fingerprint.update(chunk)
+        nbytes += int(chunk.memory_usage(deep=True).sum())
+        if job is not None:
+            job.update(rows=rows)
+    
+    try:
+        analysis = read_csv_streaming(
+            file,
+            chunksize=STREAMING_CHUNK_ROWS,
+            analyzer=analyzer,
+            on_chunk=on_chunk,
+            prepare=prepare
+        )
+    finally:
+        writer.close()
+    
+    if rekinded:
+        # Earlier chunks were analyzed as numbers: analyze the stored copy again
+        analyzer = StreamingAnalyzer()
+        for chunk in persistence.chunks(dataset_id):
+            analyzer.update(apply_schema(chunk, schema, categories=False))
+        analysis = analyzer.result()
+    
+    version = fingerprint.hexdigest()
+    persistence.save_meta(dataset_id, {
+        'version': version,
+        'rows': analyzer.total_rows,
+        'columns': analyzer.columns,
+        'nbytes': nbytes,
+        'schema': schema,
+        'analysis': analysis
+    })
+    analysis_cache.put(version, analysis)
+    return dataset_store.add_persisted(dataset_id)
+
+def cache_counts():
+    counts = {}
+    for name, cache in (('analysis', analysis_cache), ('proposals', proposal_cache), ('results', result_cache)):
+        stats = cache.stats()
+        counts[(name, 'hit')] = stats['hits']
+        counts[(name, 'miss')] = stats['misses']
+    return counts
+
+metrics.collected(
+    'dataviz_cache_requests_total', 'Cache lookups by outcome', cache_counts,
+    labels=('cache', 'result'), kind='counter'
+)
+metrics.collected(
+    'dataviz_result_cache_bytes', 'Encoded chart payloads held by the result cache',
+    lambda: {(): result_cache.stats()['bytes']}
+)
+metrics.collected(
+    'dataviz_datasets', 'Datasets known to this process, and those resident in memory',
+    lambda: {('known',): dataset_store.stats()['datasets'], ('resident',): dataset_store.stats()['resident']},
+    labels=('state',)
+)
+metrics.collected(
+    'dataviz_dataset_resident_bytes', 'Memory used by the datasets resident in this process',
+    lambda: {(): dataset_store.resident_bytes()}
+)
+metrics.collected(
+    'dataviz_upload_jobs', 'Upload jobs by status', lambda: {
+        (status,): count for status, count in upload_jobs.stats().items() if status in ('queued', 'running')
+    },
+    labels=('status',)
+)
+metrics.collected(
+    'dataviz_upload_reserved_bytes', 'Memory reserved by running upload jobs',
+    lambda: {(): upload_jobs.stats()['reserved_bytes']}
+)
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    # Streamed bodies are still being produced here: their time is to the headers, size unknown
+    start = g.get('request_start')
+    if start is not None and request.endpoint:
+        route = request.endpoint
+        request_seconds.observe(time.perf_counter() - start, route=route, status=response.status_code)
+        if not response.is_streamed:
+            response_bytes.observe(response.content_length or 0, route=route)
+    return response
 
-# Store uploaded data in memory
-current_dataset = None
+# Requests sent with this token in an X-Profile header (or ?profile=) run under
+# the profiler; their report is stored and its ID returned in X-Profile-Id.
+# Unset, no profiling hook is even installed
+PROFILE_ADMIN_TOKEN = os.getenv('PROFILE_ADMIN_TOKEN')
+profile_store = ProfileStore(os.path.join(UPLOAD_FOLDER, 'profiles'))
+
+def profiling_authorized():
+    token = request.headers.get('X-Profile') or request.args.get('profile')
+    return bool(PROFILE_ADMIN_TOKEN and token) and hmac.compare_digest(token, PROFILE_ADMIN_TOKEN)
+
+if PROFILE_ADMIN_TOKEN:
+    @app.before_request
+    def start_profile():
+        if profiling_authorized():
+            g.profile = RequestProfile()
+            g.profile.start()
+
+    @app.after_request
+    def stop_profile(response):
+        # Streamed bodies are produced after this point and are not covered
+        profile = g.pop('profile', None)
+        if profile is not None:
+            profile.stop()
+            profile_id = profile_store.save(profile, {
+                'method': request.method,
+                'path': request.path,
+                'endpoint': request.endpoint,
+                'status': response.status_code
+            })
+            response.headers['X-Profile-Id'] = profile_id
+            response.headers['X-Profile-Seconds'] = f'{profile.seconds:.6f}'
+        return response
+
+    @app.teardown_request
+    def discard_profile(error=None):
+        # The request failed before after_request: stop profiling anyway
+        profile = g.pop('profile', None)
+        if profile is not None:
+            profile.stop()
 
 # Routes for HTML pages
 @app.route('/')
@@ -27,11 +378,97 @@ def index():
     return render_template('index.html')
 
 # API Routes
+def process_upload(job, path, streaming, exact, replaced_id, strata=None):
+    """Parse, analyze and store an uploaded CSV; runs on the upload pool and returns the upload response"""
+    try:
+        with open(path, 'rb') as handle:
+            job.track(handle)
+            job.update(stage='parsing')
+            try:
+                if streaming:
+                    # Analysis and persistence happen chunk by chunk while parsing
+                    with stage('stream_ingest', route='upload'):
+                        dataset_id = ingest_streaming(handle, job)
+                else:
+                    # Read CSV, then give every column a compact dtype once
+                    with stage('parse', route='upload'):
+                        df = pd.read_csv(handle)
+            finally:
+                job.untrack()
+        
+        if not streaming:
+            job.update(stage='analyzing', rows=len(df))
+            with stage('schema', route='upload'):
+                schema = infer_schema(df)
+                df = apply_schema(df, schema)
+                version = analysis_cache.fingerprint(df)
+            
+            # Analyze dataset, on a sample first when it is large (analysis=exact opts out),
+            # stratified on the `strata` column when the upload names one
+            approximate = len(df) > APPROX_ANALYSIS_ROWS and not exact
+            with stage('analyze', route='upload'):
+                analysis = analysis_cache.get_or_compute(
+                    version,
+                    lambda: data_analyzer.analyze_dataset(
+                        df,
+                        schema=schema,
+                        version=version,
+                        mode='approximate' if approximate else 'exact',
+                        latency_target=ANALYSIS_LATENCY_TARGET,
+                        strata=strata
+                    )
+                )
+            job.update(stage='saving')
+            with stage('save', route='upload'):
+                dataset_id = dataset_store.put(df, version=version, analysis=analysis, schema=schema)
+    finally:
+        os.remove(path)
+    
+    version = dataset_store.version(dataset_id)
+    analysis = dataset_analysis(dataset_id)
+    
+    if CUBE_MAX_CATEGORIES:
+        job.update(stage='indexing')
+        with stage('cube', route='upload'):
+            build_cube(dataset_id, analysis)
+    
+    # The client may replace its previous dataset: drop it and its cached analysis
+    if replaced_id and replaced_id != dataset_id:
+        replaced_version = dataset_store.remove(replaced_id)
+        if replaced_version is not None and replaced_version != version:
+            analysis_cache.invalidate(replaced_version)
+            result_cache.invalidate(replaced_version)
+            data_analyzer.correlation_engine.invalidate(replaced_version)
+    
+    meta = persistence.load_meta(dataset_id)
+    return {
+        'success': True,
+        'message': 'Dataset uploaded successfully',
+        'rows': meta['rows'],
+        'columns': meta['columns'],
+        'dataset_id': dataset_id,
+        'dataset_version': version,
+        'analysis': analysis
+    }
+
+def build_cube(dataset_id, analysis):
+    """Pre-aggregate the numeric columns per category of the low-cardinality columns"""
+    keys = [col for col, info in analysis.get('categorical_info', {}).items()
+            if info.get('unique_count', 0) <= CUBE_MAX_CATEGORIES]
+    if not keys:
+        return
+    schema = dataset_store.schema(dataset_id) or {}
+    numeric = [col for col, spec in schema.items() if spec['kind'] == 'numeric']
+    try:
+        df = dataset_store.get(dataset_id, columns=keys + numeric)
+        dataset_store.put_cube(dataset_id, GroupCube.build(df, keys, numeric, CUBE_MAX_CATEGORIES))
+    except Exception as e:
+        # Charts are then aggregated from the rows
+        print(f"Error building the group-by cube of {dataset_id}: {e}")
+
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
-    """Upload and analyze CSV file"""
-    global current_dataset
-    
+    """Queue a CSV upload for parsing and analysis; progress is polled at /api/jobs/<job_id>"""
     if 'file' not in request.files:
         return jsonify({'error': 'No file provided'}), 400
     
@@ -39,61 +476,161 @@ def upload_file():
     if file.filename == '':
         return jsonify({'error': 'No file selected'}), 400
     
+    if upload_jobs.full():
+        return jsonify({'error': 'Too many uploads in progress, try again later'}), 503
+    
     try:
-        # Read CSV
-        df = pd.read_csv(file)
-        current_dataset = df
+        # The request body does not outlive the request: keep the file for the worker
+        os.makedirs(UPLOAD_SPOOL, exist_ok=True)
+        path = os.path.join(UPLOAD_SPOOL, f'{dataset_store.new_id()}.csv')
+        file.save(path)
+        size = os.path.getsize(path)
         
-        # Analyze dataset
-        analysis = data_analyzer.analyze_dataset(df)
+        # Files whose in-memory parse would not fit the budget are streamed too
+        streaming = request.form.get('mode') == 'stream' or (
+            size > STREAMING_THRESHOLD_MB * 1024 * 1024
+        ) or size * UPLOAD_MEMORY_FACTOR > upload_jobs.memory_budget
+        memory = min(size, STREAMING_THRESHOLD_MB * 1024 * 1024) if streaming else size
+        # Read now, the worker runs outside of this request
+        exact = request.form.get('analysis') == 'exact'
+        strata = request.form.get('strata') or None
+        replaced_id = request.form.get('replaces')
+        
+        job = upload_jobs.submit(
+            lambda job: process_upload(job, path, streaming, exact, replaced_id, strata),
+            total_bytes=size,
+            memory=int(memory * UPLOAD_MEMORY_FACTOR)
+        )
+        if job is None:
+            os.remove(path)
+            return jsonify({'error': 'Too many uploads in progress, try again later'}), 503
+        
+        # Scripts may wait for the result instead of polling
+        if request.form.get('wait'):
+            job.wait()
+            if job.status == 'error':
+                return jsonify({'error': job.error}), 500
+            return jsonify(job.result)
         
         return jsonify({
             'success': True,
-            'message': 'Dataset uploaded successfully',
-            'rows': len(df),
-            'columns': list(df.columns),
-            'analysis': analysis
-        })
+            'job_id': job.id,
+            'status_url': f'/api/jobs/{job.id}'
+        }), 202
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Stage, rows parsed and ETA of a background job, with its result once done"""
+    job = upload_jobs.get(job_id)
+    if job is not None:
+        return jsonify(job.to_dict())
+    # Running or run by another worker process
+    state = dataset_registry.load_job(job_id)
+    if state is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(state)
+
 @app.route('/api/generate-visualizations', methods=['POST'])
 def generate_visualizations():
     """Generate 3 visualization proposals using Gemini"""
-    global current_dataset
+    data = request.json
+    dataset_id, error = resolve_dataset_id(data)
     
-    if current_dataset is None:
-        return jsonify({'error': 'No dataset uploaded'}), 400
+    if error:
+        return error
     
-    data = request.json
     user_question = data.get('question', '')
     
     if not user_question:
         return jsonify({'error': 'No question provided'}), 400
     
     try:
-        # Get dataset analysis
-        analysis = data_analyzer.analyze_dataset(current_dataset)
+        # Get dataset analysis (computed once per dataset version)
+        with stage('analysis'):
+            analysis = dataset_analysis(dataset_id)
         
-        # Generate proposals with Gemini
-        proposals = gemini_service.generate_visualization_proposals(
+        # Generate proposals with Gemini; errors and token counts are this call's own
+        outcome = gemini_service.generate(
             question=user_question,
             dataset_info=analysis,
-            columns=list(current_dataset.columns)
+            columns=dataset_store.columns(dataset_id),
+            use_cache=not data.get('bypass_cache', False)
         )
         
-        # Get the raw response for debugging
-        raw_response = gemini_service.get_last_raw_response()
-        
-        return jsonify({
-            'success': True,
-            'proposals': proposals,
-            'raw_response': raw_response  # Include raw response in API response
-        })
+        with stage('encode'):
+            return jsonify({
+                'success': True,
+                'proposals': outcome['proposals'],
+                'fallback': outcome['error'] is not None,
+                'llm_error': outcome['error'],
+                'prompt_tokens': outcome['prompt_tokens'],
+                'raw_response': outcome['raw_response']  # Include raw response in API response
+            })
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/generate-visualizations/stream', methods=['POST'])
+def generate_visualizations_stream():
+    """Stream proposals as NDJSON, one line per proposal as soon as the LLM has written it"""
+    data = request.json
+    dataset_id, error = resolve_dataset_id(data)
+    
+    if error:
+        return error
+    
+    user_question = data.get('question', '')
+    
+    if not user_question:
+        return jsonify({'error': 'No question provided'}), 400
+    
+    try:
+        with stage('analysis'):
+            analysis = dataset_analysis(dataset_id)
+        columns = dataset_store.columns(dataset_id)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    def events():
+        sent = 0
+        outcome = {'error': None, 'prompt_tokens': None}
+        try:
+            for kind, value in gemini_service.stream_visualization_proposals(
+                question=user_question,
+                dataset_info=analysis,
+                columns=columns,
+                use_cache=not data.get('bypass_cache', False)
+            ):
+                if kind == 'done':
+                    outcome = value
+                    continue
+                proposal = value
+                reason = validate_proposal(proposal, columns)
+                if reason:
+                    yield json.dumps({'event': 'rejected', 'proposal': proposal, 'reason': reason}) + '\n'
+                    continue
+                sent += 1
+                yield json.dumps({'event': 'proposal', 'proposal': proposal}) + '\n'
+        except Exception as e:
+            yield json.dumps({'event': 'error', 'error': str(e)}) + '\n'
+        yield json.dumps({
+            'event': 'done',
+            'count': sent,
+            'fallback': outcome['error'] is not None,
+            'llm_error': outcome['error'],
+            'prompt_tokens': outcome['prompt_tokens']
+        }) + '\n'
+
+    return Response(
+        stream_with_context(events()),
+        mimetype='application/x-ndjson',
+        # Proxies must not hold lines back until the response is complete
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/api/get-raw-response', methods=['GET'])
 def get_raw_response():
     """Get the last raw response from Gemini for debugging"""
@@ -110,38 +647,133 @@ def get_raw_response():
         'raw_response': raw_response
     })
 
+def dataset_source(dataset_id):
+    """Stored file of a dataset, for query engines that aggregate files instead of frames"""
+    if not data_analyzer.query_engine.reads_files or not persistence.exists(dataset_id):
+        return None
+    return persistence.data_path(dataset_id, persistence.stored_format(dataset_id))
+
+def prepare_chart(dataset_id, version, viz_type, viz_config, arrays=False):
+    """Prepared data of one chart, reading only the columns it touches when the dataset is not in memory"""
+    with stage('load'):
+        columns = data_analyzer.required_columns(viz_type, viz_config, dataset_store.columns(dataset_id))
+        dataset = dataset_store.get(dataset_id, columns=columns)
+    
+    # Prepare data based on visualization type
+    with stage('prepare'):
+        return data_analyzer.prepare_visualization_data(
+            dataset, 
+            viz_type, 
+            viz_config,
+            schema=dataset_store.schema(dataset_id),
+            version=version,
+            arrays=arrays,
+            source=dataset_source(dataset_id),
+            cube=dataset_store.cube(dataset_id)
+        )
+
+def prepared_json(dataset_id, version, viz_type, viz_config):
+    """Encoded prepared data of one chart from the result cache, preparing it on a miss; returns (bytes, error)"""
+    key = ResultCache.key(version, viz_type, viz_config)
+    body = result_cache.get(key)
+    if body is not None:
+        return body, None
+    
+    prepared_data = prepare_chart(dataset_id, version, viz_type, viz_config)
+    
+    # Check if there's an error in the prepared data
+    if 'error' in prepared_data:
+        return None, prepared_data['error']
+    
+    with stage('encode'):
+        body = app.json.dumps(prepared_data).encode()
+    result_cache.put(key, version, body)
+    return body, None
+
+def prepared_arrow(dataset_id, version, viz_type, viz_config, key):
+    """Arrow IPC stream of one chart from the result cache, preparing it on a miss; returns (bytes, error)"""
+    body = result_cache.get(key)
+    if body is not None:
+        return body, None
+    
+    # Series stay numpy arrays all the way to the Arrow buffers
+    prepared_data = prepare_chart(dataset_id, version, viz_type, viz_config, arrays=True)
+    if 'error' in prepared_data:
+        return None, prepared_data['error']
+    
+    with stage('encode'):
+        body = to_arrow(prepared_data)
+    result_cache.put(key, version, body)
+    return body, None
+
 @app.route('/api/prepare-visualization', methods=['POST'])
 def prepare_visualization():
     """Prepare data for selected visualization"""
-    global current_dataset
+    data = request.json
+    dataset_id, error = resolve_dataset_id(data)
     
-    if current_dataset is None:
-        return jsonify({'error': 'No dataset uploaded'}), 400
+    if error:
+        return error
     
-    data = request.json
     viz_config = data.get('config', {})
     viz_type = data.get('type', '')
+    columnar = data.get('format') == 'columnar'
+    # Binary series for the chart types that have them, asked for by format or Accept header
+    arrow = viz_type in ARROW_TYPES and (
+        data.get('format') == 'arrow' or request.accept_mimetypes.best == ARROW_MIMETYPE
+    )
     
     try:
-        # Prepare data based on visualization type
-        prepared_data = data_analyzer.prepare_visualization_data(
-            current_dataset, 
-            viz_type, 
-            viz_config
-        )
+        # Same data, type and config: the client copy is still valid, or ours is
+        version = dataset_store.version(dataset_id)
+        etag = ResultCache.key(version, viz_type, viz_config)
+        if arrow:
+            etag = ResultCache.key(version, viz_type, viz_config, variant='arrow')
+        elif columnar:
+            # Every compressed representation gets its own ETag
+            encoding = negotiate_encoding(request.accept_encodings)
+            etag = ResultCache.key(version, viz_type, viz_config, variant=f'columnar/{encoding}')
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
         
-        # Check if there's an error in the prepared data
-        if 'error' in prepared_data:
-            return jsonify({
-                'success': False,
-                'error': prepared_data['error']
-            }), 400
-        
-        return jsonify({
-            'success': True,
-            'data': prepared_data,
-            'config': viz_config
-        })
+        if arrow:
+            body, error = prepared_arrow(dataset_id, version, viz_type, viz_config, etag)
+            if error:
+                return jsonify({'success': False, 'error': error}), 400
+            response = Response(body, mimetype=ARROW_MIMETYPE)
+            response.headers['Vary'] = 'Accept'
+        elif columnar:
+            body = result_cache.get(etag)
+            if body is None:
+                prepared, error = prepared_json(dataset_id, version, viz_type, viz_config)
+                if error:
+                    return jsonify({'success': False, 'error': error}), 400
+                with stage('encode_columnar'):
+                    body = compress(dumps({
+                        'success': True,
+                        'format': 'columnar',
+                        'config': viz_config,
+                        'data': to_columnar(json.loads(prepared))
+                    }), encoding)
+                result_cache.put(etag, version, body)
+            response = Response(body, mimetype='application/json')
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+            response.headers['Vary'] = 'Accept-Encoding'
+        else:
+            prepared, error = prepared_json(dataset_id, version, viz_type, viz_config)
+            if error:
+                return jsonify({'success': False, 'error': error}), 400
+            # The cached payload is spliced in as is, without decoding it again
+            response = Response(
+                b'{"success": true, "config": ' + app.json.dumps(viz_config).encode() + b', "data": ' + prepared + b'}',
+                mimetype='application/json'
+            )
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
     
     except Exception as e:
         import traceback
@@ -149,6 +781,139 @@ def prepare_visualization():
         print(f"Error preparing visualization: {error_details}")
         return jsonify({'error': f'Error: {str(e)}'}), 500
 
+@app.route('/api/prepare-visualizations', methods=['POST'])
+def prepare_visualizations():
+    """Prepare several visualizations at once, sharing intermediate work between them"""
+    data = request.json
+    dataset_id, error = resolve_dataset_id(data)
+    
+    if error:
+        return error
+    
+    items = data.get('items') or data.get('proposals') or []
+    if not items:
+        return jsonify({'error': 'No visualization requested'}), 400
+    
+    try:
+        # One read for the whole batch: the union of the columns every chart needs
+        available = dataset_store.columns(dataset_id)
+        columns = []
+        for item in items:
+            needed = data_analyzer.required_columns(item.get('type', ''), item.get('config') or {}, available)
+            if needed is None:
+                columns = None
+                break
+            columns.extend(needed)
+        if columns is not None:
+            columns = list(dict.fromkeys(columns))
+        with stage('load'):
+            dataset = dataset_store.get(dataset_id, columns=columns)
+        schema = dataset_store.schema(dataset_id)
+        source = dataset_source(dataset_id)
+        cube = dataset_store.cube(dataset_id)
+    except Exception as e:
+        return jsonify({'error': f'Error: {str(e)}'}), 500
+
+    shared = SharedWork()
+    version = dataset_store.version(dataset_id)
+    columnar = data.get('format') == 'columnar'
+    encoding = negotiate_encoding(request.accept_encodings)
+
+    def prepare(item):
+        viz_config = item.get('config') or {}
+        result = {'id': item.get('id'), 'type': item.get('type', ''), 'config': viz_config}
+        key = ResultCache.key(version, result['type'], viz_config)
+        # The ETag of the representation the client revalidates with /api/prepare-visualization
+        result['etag'] = key
+        if columnar:
+            result['etag'] = ResultCache.key(version, result['type'], viz_config, variant=f'columnar/{encoding}')
+        body = result_cache.get(key)
+        if body is not None:
+            result.update(success=True, data=json.loads(body))
+            return result
+        try:
+            # Runs on the batch pool, outside of the request context
+            with stage('prepare', route='prepare_visualizations'):
+                prepared_data = data_analyzer.prepare_visualization_data(
+                    dataset,
+                    result['type'],
+                    viz_config,
+                    schema=schema,
+                    shared=shared,
+                    version=version,
+                    source=source,
+                    cube=cube
+                )
+        except Exception as e:
+            print(f"Error preparing visualization {result['id']}: {e}")
+            prepared_data = {'error': f'Error: {str(e)}'}
+
+        # Errors are reported per item, the rest of the batch still succeeds
+        if 'error' in prepared_data:
+            result.update(success=False, error=prepared_data['error'])
+        else:
+            result.update(success=True, data=prepared_data)
+            result_cache.put(key, version, app.json.dumps(prepared_data).encode())
+        return result
+
+    results = list(batch_executor.map(prepare, items))
+    if columnar:
+        for result in results:
+            if result['success']:
+                result['data'] = to_columnar(result['data'])
+        response = Response(compress(dumps({
+            'success': True,
+            'format': 'columnar',
+            'results': results,
+            'shared_work': shared.stats()
+        }), encoding), mimetype='application/json')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+    return jsonify({
+        'success': True,
+        'results': results,
+        'shared_work': shared.stats()
+    })
+
+@app.route('/api/cache-stats', methods=['GET'])
+def cache_stats():
+    """Hit/miss counters of the server-side caches"""
+    return jsonify({
+        'success': True,
+        'analysis': analysis_cache.stats(),
+        'proposals': proposal_cache.stats(),
+        'results': result_cache.stats(),
+        'datasets': dataset_store.stats(),
+        'uploads': upload_jobs.stats()
+    })
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus metrics of this process"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """Report of a profiled request: hot functions and pandas/numpy time per analyzer function"""
+    if not profiling_authorized():
+        return jsonify({'error': 'Not found'}), 404
+    report = profile_store.load(profile_id)
+    if report is None:
+        return jsonify({'error': 'Unknown profile'}), 404
+    return jsonify(report)
+
+@app.route('/api/profiles/<profile_id>/folded', methods=['GET'])
+def get_profile_stacks(profile_id):
+    """Collapsed stacks of a profiled request, for flamegraph tools"""
+    if not profiling_authorized():
+        return jsonify({'error': 'Not found'}), 404
+    stacks = profile_store.load(profile_id, kind='folded')
+    if stacks is None:
+        return jsonify({'error': 'Unknown profile'}), 404
+    return Response(stacks, mimetype='text/plain')
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+
+# Vocabulary of the free-text columns
+WORDS = np.array([
+    'commande', 'livraison', 'retard', 'client', 'produit', 'retour', 'paiement', 'facture',
+    'remise', 'stock', 'colis', 'adresse', 'service', 'avis', 'qualité', 'prix',
+    'rapide', 'abîmé', 'conforme', 'satisfait', 'annulé', 'urgent', 'partiel', 'complet'
+])
+
+
+def synthetic_dataset(rows, numeric=6, categorical=3, cardinality=20, null_ratio=0.0, datetimes=1, text=1, seed=0):
+    """Random dataset with the shape of a typical upload, reproducible from `seed`.
+
+    Numeric columns share a common factor with increasing weight, so their
+    correlations range from none to strong. Categorical columns draw
+    `cardinality` levels with Zipf-like frequencies, datetime columns
+    are sorted timestamps over three years, and free-text columns are
+    short, nearly unique comments kept as plain object strings. `null_ratio`
+    of the numeric, categorical and text values are missing.
+    """
+    rng = np.random.default_rng(seed)
+    rows = int(rows)
+    columns = {}
+
+    factor = rng.standard_normal(rows)
+    for i in range(numeric):
+        weight = i / max(numeric - 1, 1)
+        values = weight * factor + (1 - weight) * rng.standard_normal(rows)
+        columns[f'num_{i}'] = values * 10 ** (i % 4) + 100 * i
+
+    frequencies = 1 / np.arange(1, cardinality + 1)
+    frequencies /= frequencies.sum()
+    for i in range(categorical):
+        codes = rng.choice(cardinality, size=rows, p=frequencies)
+        levels = [f'cat{i}_{level}' for level in range(cardinality)]
+        columns[f'cat_{i}'] = pd.Categorical.from_codes(codes, categories=levels)
+
+    start = pd.Timestamp('2020-01-01').value
+    span = 3 * 365 * 24 * 3600 * 10 ** 9
+    for i in range(datetimes):
+        stamps = np.sort(rng.integers(start, start + span, size=rows))
+        columns[f'date_{i}'] = pd.to_datetime(stamps)
+
+    for i in range(text):
+        picks = rng.integers(len(WORDS), size=(3, rows))
+        ids = rng.integers(0, 10 * rows, size=rows).astype(str)
+        comment = pd.Series(WORDS[picks[0]], dtype=object) + ' ' + WORDS[picks[1]] + ' ' + WORDS[picks[2]]
+        columns[f'text_{i}'] = comment + ' #' + ids
+
+    df = pd.DataFrame(columns)
+    if null_ratio > 0:
+        for col in df.columns:
+            if col.startswith('date_'):
+                continue
+            missing = rng.random(rows) < null_ratio
+            df.loc[missing, col] = np.nan
+    return df
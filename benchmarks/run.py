@@ -0,0 +1,242 @@
+"""Time the dataset analysis and every chart preparer on synthetic data.
+
+    python -m benchmarks.run                          # 1e3 .. 1e7 rows, compared to benchmarks/baseline.json
+    python -m benchmarks.run --sizes 1e3,1e5 --save-baseline
+    python -m benchmarks.run --categorical 5 --cardinality 200 --null-ratio 0.1
+    python -m benchmarks.run --engine duckdb --only prepare/
+
+Each case records its best wall time over `--repeat` runs, the peak memory
+it allocated (tracemalloc, measured on a separate run) and the size of its
+JSON payload. Compared to a baseline, a case regresses when its time or
+memory grows by more than `--tolerance` (times under `--min-time` are
+ignored as noise) or its payload by more than 1% and 256 bytes; the exit
+status is then 1.
+
+benchmarks/baseline.json holds the results of the tree before the
+optimizations, from 1e3 to 1e6 rows (its scatter and line preparers
+iterate over rows, 1e7 does not fit in memory).
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.generate import synthetic_dataset
+from utils.analyse import DataAnalyzer
+from utils.cube import GroupCube
+from utils.encoding import dumps
+from utils.query import create_engine
+from utils.schema import infer_schema, apply_schema
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+DEFAULT_SIZES = '1e3,1e4,1e5,1e6,1e7'
+# Payloads are deterministic: a field added here and there is fine, not more
+PAYLOAD_TOLERANCE = 0.01
+PAYLOAD_SLACK = 256
+
+
+def cases(df):
+    """(name, function) pairs covering the analysis and every chart type"""
+    numeric = [c for c in df.columns if c.startswith('num_')]
+    categorical = [c for c in df.columns if c.startswith('cat_')]
+    dates = [c for c in df.columns if c.startswith('date_')]
+    texts = [c for c in df.columns if c.startswith('text_')]
+    x, y = numeric[0], numeric[-1]
+    category = categorical[0] if categorical else None
+
+    charts = [
+        ('scatter', {'x_axis': x, 'y_axis': y, 'color_by': category}),
+        ('correlationMatrix', {}),
+        ('heatmap', {'columns': numeric})
+    ]
+    if category:
+        charts += [
+            ('bar', {'x_axis': category, 'y_axis': y, 'aggregation': 'mean'}),
+            ('horizontalBar', {'x_axis': category, 'y_axis': y, 'aggregation': 'sum'}),
+            ('pie', {'category': category}),
+            ('box', {'category': category, 'value': y}),
+            ('violin', {'category': category, 'value': y})
+        ]
+    if dates:
+        charts += [
+            ('line', {'x_axis': dates[0], 'y_axis': y}),
+            ('line/day', {'x_axis': dates[0], 'y_axis': y, 'bucket': 'day'})
+        ]
+    else:
+        charts.append(('line', {'x_axis': x, 'y_axis': y}))
+    if texts:
+        # Object-dtype column with nearly one category per row
+        charts.append(('bar/text', {'x_axis': texts[0], 'aggregation': 'count'}))
+
+    # Built once here, like at upload: the cube/* cases only time reading it
+    cube = GroupCube.build(df, categorical, numeric) if category else None
+
+    def prepare(viz_type, config, from_cube=False):
+        def run(analyzer, df, schema):
+            return analyzer.prepare_visualization_data(df, viz_type, config, schema=schema,
+                                                       cube=cube if from_cube else None)
+        return run
+
+    yield 'analyze', lambda analyzer, df, schema: analyzer.analyze_dataset(df, schema=schema)
+    yield 'analyze/approximate', lambda analyzer, df, schema: analyzer.analyze_dataset(
+        df, schema=schema, mode='approximate')
+    for name, config in charts:
+        yield f'prepare/{name}', prepare(name.split('/')[0], config)
+    if category:
+        yield 'cube/build', lambda analyzer, df, schema: GroupCube.build(df, categorical, numeric).to_dict()
+        for name, config in charts:
+            if name in ('bar', 'horizontalBar', 'pie'):
+                yield f'cube/{name}', prepare(name, config, from_cube=True)
+
+
+def measure(run, df, schema, repeat, engine='pandas'):
+    # Fresh analyzer per case: nothing is reused from a previous case
+    best = None
+    result = None
+    for _ in range(repeat):
+        analyzer = DataAnalyzer(query_engine=create_engine(engine))
+        start = time.perf_counter()
+        result = run(analyzer, df, schema)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    if isinstance(result, dict) and 'error' in result:
+        raise RuntimeError(result['error'])
+
+    # Memory on its own run, tracemalloc slows allocations down
+    analyzer = DataAnalyzer(query_engine=create_engine(engine))
+    tracemalloc.start()
+    run(analyzer, df, schema)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'seconds': round(best, 6),
+        'peak_bytes': peak,
+        'payload_bytes': len(dumps(result))
+    }
+
+
+def compare(results, baseline, tolerance, min_time):
+    """Regressions of `results` against `baseline`, as readable lines"""
+    regressions = []
+    for key, current in results.items():
+        previous = baseline.get(key)
+        if previous is None:
+            continue
+        if current['seconds'] >= min_time and current['seconds'] > previous['seconds'] * (1 + tolerance):
+            regressions.append(f"{key}: time {previous['seconds']:.4f}s -> {current['seconds']:.4f}s")
+        if current['peak_bytes'] > previous['peak_bytes'] * (1 + tolerance) + 1024 * 1024:
+            regressions.append(f"{key}: peak memory {_mb(previous['peak_bytes'])} -> {_mb(current['peak_bytes'])}")
+        if current['payload_bytes'] > previous['payload_bytes'] * (1 + PAYLOAD_TOLERANCE) + PAYLOAD_SLACK:
+            regressions.append(f"{key}: payload {previous['payload_bytes']} -> {current['payload_bytes']} bytes")
+    return regressions
+
+
+def _mb(value):
+    return f'{value / 1024 / 1024:.1f} MB'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='comma-separated row counts')
+    parser.add_argument('--numeric', type=int, default=6)
+    parser.add_argument('--categorical', type=int, default=3)
+    parser.add_argument('--cardinality', type=int, default=20)
+    parser.add_argument('--null-ratio', type=float, default=0.0)
+    parser.add_argument('--datetimes', type=int, default=1)
+    parser.add_argument('--text', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', help='run only the cases whose name contains this text')
+    parser.add_argument('--engine', default='pandas', help='query engine of the bar and pie aggregations')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true', help='write these results as the new baseline')
+    parser.add_argument('--output', help='also write the results to this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--min-time', type=float, default=0.005)
+    args = parser.parse_args(argv)
+
+    shape = {
+        'numeric': args.numeric,
+        'categorical': args.categorical,
+        'cardinality': args.cardinality,
+        'null_ratio': args.null_ratio,
+        'datetimes': args.datetimes,
+        'text': args.text,
+        'seed': args.seed
+    }
+    # Results are keyed by dataset shape, so baselines of other shapes are not compared
+    shape_key = ','.join(f'{k}={v}' for k, v in shape.items())
+    if args.engine != 'pandas':
+        shape_key += f',engine={args.engine}'
+
+    results = {}
+    for size in args.sizes.split(','):
+        rows = int(float(size))
+        df = synthetic_dataset(rows, **shape)
+        # Same dtypes and schema as an upload
+        schema = infer_schema(df)
+        df = apply_schema(df, schema)
+
+        for name, run in cases(df):
+            if args.only and args.only not in name:
+                continue
+            key = f'{shape_key}|{rows}|{name}'
+            try:
+                results[key] = measure(run, df, schema, args.repeat, args.engine)
+            except Exception as e:
+                print(f'{rows:>10} {name:24s} failed: {e}')
+                continue
+            r = results[key]
+            print(f"{rows:>10} {name:24s} {r['seconds'] * 1000:10.2f} ms {_mb(r['peak_bytes']):>11} "
+                  f"{r['payload_bytes']:>10} B")
+        del df
+
+    report = {
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    status = 0
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f).get('results', {})
+        regressions = compare(results, baseline, args.tolerance, args.min_time)
+        compared = sum(1 for key in results if key in baseline)
+        if regressions:
+            print(f'\n{len(regressions)} regression(s) against {args.baseline}:')
+            for line in regressions:
+                print(f'  {line}')
+            status = 1
+        else:
+            print(f'\nNo regression against {args.baseline} ({compared} cases compared)')
+
+    if args.save_baseline:
+        baseline = {'results': {}}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding='utf-8') as f:
+                baseline = json.load(f)
+        # Cases not run this time keep their previous baseline
+        baseline.update({k: v for k, v in report.items() if k != 'results'})
+        baseline.setdefault('results', {}).update(results)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f'\nBaseline saved to {args.baseline}')
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
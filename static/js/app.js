@@ -1,7 +1,9 @@
 // State management
 const state = {
     currentDataset: null,
+    replacedDatasetId: null,
     proposals: [],
+    preparedBatch: null,
     selectedProposal: null,
     vizData: null,
     currentChart: null
@@ -16,6 +18,7 @@ const elements = {
     visualizationSection: document.getElementById('visualizationSection'),
     uploadInfo: document.getElementById('uploadInfo'),
     uploadProgress: document.getElementById('uploadProgress'),
+    uploadStatus: document.getElementById('uploadStatus'),
     datasetInfo: document.getElementById('datasetInfo'),
     questionInput: document.getElementById('questionInput'),
     generateBtn: document.getElementById('generateBtn'),
@@ -34,6 +37,13 @@ const elements = {
 // API Base URL
 const API_URL = '/api';
 
+// Prepared charts already received, with their ETag, keyed by dataset + type + config
+const preparedCache = new Map();
+
+function preparedCacheKey(proposal) {
+    return JSON.stringify([state.currentDataset.dataset_id, proposal.type, proposal.config]);
+}
+
 // Event Listeners
 elements.fileInput.addEventListener('change', handleFileUpload);
 elements.generateBtn.addEventListener('click', handleGenerateVisualization);
@@ -54,6 +64,9 @@ async function handleFileUpload(event) {
 
     const formData = new FormData();
     formData.append('file', file);
+    if (state.replacedDatasetId) {
+        formData.append('replaces', state.replacedDatasetId);
+    }
 
     try {
         const response = await fetch(`${API_URL}/upload`, {
@@ -61,10 +74,15 @@ async function handleFileUpload(event) {
             body: formData
         });
 
-        const data = await response.json();
+        // Parsing and analysis run in the background: follow the job until it ends
+        let data = await response.json();
+        if (data.success && data.job_id) {
+            data = await waitForJob(data.job_id);
+        }
 
         if (data.success) {
             state.currentDataset = data;
+            state.replacedDatasetId = null;
             showSuccess(`Dataset chargé: ${data.rows} lignes, ${data.columns.length} colonnes`);
             showSection('question');
         } else {
@@ -74,6 +92,44 @@ async function handleFileUpload(event) {
         showError('Erreur de connexion au serveur. Assurez-vous que Flask est lancé.');
     } finally {
         elements.uploadProgress.classList.add('hidden');
+        elements.uploadStatus.textContent = 'Chargement en cours...';
+    }
+}
+
+const JOB_STAGES = {
+    queued: 'En attente',
+    waiting_memory: 'En attente de mémoire',
+    parsing: 'Lecture du fichier',
+    analyzing: 'Analyse',
+    saving: 'Enregistrement',
+    indexing: 'Pré-agrégation'
+};
+
+// Poll an upload job, showing its progress; resolves to the upload response
+async function waitForJob(jobId) {
+    while (true) {
+        const response = await fetch(`${API_URL}/jobs/${jobId}`);
+        const job = await response.json();
+        if (job.status === 'done') {
+            return job.result;
+        }
+        if (job.status === 'error' || !response.ok) {
+            return { success: false, error: job.error };
+        }
+
+        let text = JOB_STAGES[job.stage] || 'Chargement en cours';
+        if (job.progress !== null && job.stage === 'parsing') {
+            text += ` — ${Math.round(job.progress * 100)} %`;
+        }
+        if (job.rows > 0) {
+            text += `, ${job.rows.toLocaleString('fr-FR')} lignes`;
+        }
+        if (job.eta_seconds !== null) {
+            text += `, environ ${Math.ceil(job.eta_seconds)} s restantes`;
+        }
+        elements.uploadStatus.textContent = `${text}...`;
+
+        await new Promise(resolve => setTimeout(resolve, 500));
     }
 }
 
@@ -91,20 +147,43 @@ async function handleGenerateVisualization() {
     hideError();
 
     try {
-        const response = await fetch(`${API_URL}/generate-visualizations`, {
+        const response = await fetch(`${API_URL}/generate-visualizations/stream`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ question })
+            body: JSON.stringify({
+                question,
+                dataset_id: state.currentDataset.dataset_id
+            })
         });
 
-        const data = await response.json();
-
-        if (data.success) {
-            state.proposals = data.proposals;
-            displayProposals(data.proposals);
-            showSection('proposals');
-        } else {
+        if (!response.ok) {
+            const data = await response.json();
             showError(data.error || 'Erreur lors de la génération');
+            return;
+        }
+
+        state.proposals = [];
+        state.preparedBatch = null;
+        elements.proposalsList.innerHTML = '';
+
+        // One JSON object per line: show each card as soon as it arrives
+        await readNdjson(response, event => {
+            if (event.event === 'proposal') {
+                if (state.proposals.length === 0) {
+                    showSection('proposals');
+                }
+                state.proposals.push(event.proposal);
+                appendProposalCard(event.proposal);
+            } else if (event.event === 'error') {
+                showError(event.error);
+            } else if (event.event === 'done' && event.count === 0) {
+                showError('Aucune visualisation valide proposée');
+            }
+        });
+
+        // Prepare every card in one request while the user reads them
+        if (state.proposals.length > 0) {
+            state.preparedBatch = prepareAllProposals(state.proposals);
         }
     } catch (error) {
         showError('Erreur de connexion au serveur');
@@ -114,22 +193,141 @@ async function handleGenerateVisualization() {
     }
 }
 
+// Read a newline-delimited JSON response incrementally
+async function readNdjson(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let newline;
+        while ((newline = buffer.indexOf('\n')) >= 0) {
+            const line = buffer.slice(0, newline).trim();
+            buffer = buffer.slice(newline + 1);
+            if (line) onEvent(JSON.parse(line));
+        }
+    }
+    if (buffer.trim()) onEvent(JSON.parse(buffer));
+}
+
 // Display Proposals
 function displayProposals(proposals) {
     elements.proposalsList.innerHTML = '';
+    proposals.forEach(appendProposalCard);
+}
+
+function appendProposalCard(proposal) {
+    const card = document.createElement('div');
+    card.className = 'proposal-card';
+    card.innerHTML = `
+        <h3>${proposal.title}</h3>
+        <span class="proposal-type">${proposal.type}</span>
+        <p class="proposal-justification">${proposal.justification}</p>
+    `;
     
-    proposals.forEach(proposal => {
-        const card = document.createElement('div');
-        card.className = 'proposal-card';
-        card.innerHTML = `
-            <h3>${proposal.title}</h3>
-            <span class="proposal-type">${proposal.type}</span>
-            <p class="proposal-justification">${proposal.justification}</p>
-        `;
-        
-        card.addEventListener('click', () => selectProposal(proposal));
-        elements.proposalsList.appendChild(card);
+    card.addEventListener('click', () => selectProposal(proposal));
+    elements.proposalsList.appendChild(card);
+}
+
+// Prepare all proposals with the batch endpoint; resolves to null on failure.
+// Charts with an Arrow encoding are fetched on their own in that format meanwhile.
+async function prepareAllProposals(proposals) {
+    const binary = proposals.map(proposal => usesArrow(proposal));
+    const single = Promise.all(proposals.map((proposal, index) => (
+        binary[index] ? fetchPrepared(proposal).catch(() => null) : null
+    )));
+    const batched = proposals.filter((proposal, index) => !binary[index]);
+
+    try {
+        let results = [];
+        if (batched.length > 0) {
+            const response = await fetch(`${API_URL}/prepare-visualizations`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({
+                    dataset_id: state.currentDataset.dataset_id,
+                    items: batched.map((proposal, index) => ({
+                        id: index,
+                        type: proposal.type,
+                        config: proposal.config
+                    })),
+                    format: 'columnar'
+                })
+            });
+            const data = await response.json();
+            if (!data.success) return null;
+            results = data.results;
+        }
+
+        results.forEach((result, index) => {
+            if (result.success) {
+                result.data = decodeColumnar(result.data);
+                preparedCache.set(preparedCacheKey(batched[index]), { etag: `"${result.etag}"`, data: result });
+            }
+        });
+
+        const singles = await single;
+        return proposals.map((proposal, index) => (binary[index] ? singles[index] : results.shift()));
+    } catch (error) {
+        return null;
+    }
+}
+
+// Chart types the server can send as an Arrow IPC stream, when the Arrow library loaded
+const ARROW_MIMETYPE = 'application/vnd.apache.arrow.stream';
+const ARROW_TYPES = new Set(['scatter', 'line']);
+
+function usesArrow(proposal) {
+    return typeof Arrow !== 'undefined' && ARROW_TYPES.has(proposal.type);
+}
+
+// Rebuild a prepared chart from an Arrow stream: numeric columns stay typed
+// arrays over the received buffer, the other fields come from the metadata
+function decodeArrow(buffer, config) {
+    const table = Arrow.tableFromIPC(new Uint8Array(buffer));
+    const prepared = JSON.parse(table.schema.metadata.get('chart'));
+    const columns = { category: null };
+    table.schema.fields.forEach(field => {
+        columns[field.name] = table.getChild(field.name).toArray();
     });
+
+    // Datetimes arrive as milliseconds, labelled like the JSON payload
+    if (prepared.x_type === 'datetime') {
+        columns.x = Array.from(columns.x, ms => new Date(ms).toISOString().slice(0, 19).replace('T', ' '));
+    }
+    prepared.data = columns;
+    return { success: true, format: 'arrow', config, data: prepared };
+}
+
+// Rebuild chart data sent in the columnar format: parallel arrays become
+// lists of records again and dictionary-encoded strings are expanded
+function decodeColumnar(value) {
+    if (Array.isArray(value)) {
+        return value.map(decodeColumnar);
+    }
+    if (value === null || typeof value !== 'object') {
+        return value;
+    }
+    if ('$dict' in value) {
+        return value.$codes.map(code => value.$dict[code]);
+    }
+    if ('$records' in value) {
+        const columns = Object.entries(value.$records).map(([key, column]) => [key, decodeColumnar(column)]);
+        const records = [];
+        for (let i = 0; i < value.$length; i++) {
+            const record = {};
+            columns.forEach(([key, column]) => { record[key] = column[i]; });
+            records.push(record);
+        }
+        return records;
+    }
+    const decoded = {};
+    Object.entries(value).forEach(([key, item]) => { decoded[key] = decodeColumnar(item); });
+    return decoded;
 }
 
 // Select Proposal and Prepare Visualization
@@ -141,18 +339,17 @@ async function selectProposal(proposal) {
     elements.vizTitle.textContent = 'Préparation de la visualisation...';
     showSection('visualization');
 
-    try {
-        const response = await fetch(`${API_URL}/prepare-visualization`, {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({
-                type: proposal.type,
-                config: proposal.config
-            })
-        });
-
-        const data = await response.json();
+    // Already prepared by the batch request
+    const batch = state.preparedBatch ? await state.preparedBatch : null;
+    const prepared = batch ? batch[state.proposals.indexOf(proposal)] : null;
+    if (prepared && prepared.success) {
+        state.vizData = prepared;
+        displayVisualization(proposal, prepared);
+        return;
+    }
 
+    try {
+        const data = await fetchPrepared(proposal);
         if (data.success) {
             state.vizData = data;
             displayVisualization(proposal, data);
@@ -164,6 +361,52 @@ async function selectProposal(proposal) {
     }
 }
 
+// Prepare one proposal, as Arrow when the chart type has typed columns
+async function fetchPrepared(proposal) {
+    // Revalidate a copy we already have: the server answers 304 without a body
+    const cacheKey = preparedCacheKey(proposal);
+    const cached = preparedCache.get(cacheKey);
+    const arrow = usesArrow(proposal);
+    const headers = { 'Content-Type': 'application/json' };
+    if (arrow) {
+        headers['Accept'] = ARROW_MIMETYPE;
+    }
+    if (cached) {
+        headers['If-None-Match'] = cached.etag;
+    }
+
+    const response = await fetch(`${API_URL}/prepare-visualization`, {
+        method: 'POST',
+        headers,
+        body: JSON.stringify({
+            dataset_id: state.currentDataset.dataset_id,
+            type: proposal.type,
+            config: proposal.config,
+            format: arrow ? 'arrow' : 'columnar'
+        })
+    });
+
+    let data;
+    if (response.status === 304) {
+        data = cached.data;
+    } else if ((response.headers.get('Content-Type') || '').startsWith(ARROW_MIMETYPE)) {
+        data = decodeArrow(await response.arrayBuffer(), proposal.config);
+    } else {
+        data = await response.json();
+        if (data.format === 'columnar') {
+            data.data = decodeColumnar(data.data);
+        }
+    }
+
+    if (data.success) {
+        const etag = response.headers.get('ETag');
+        if (etag) {
+            preparedCache.set(cacheKey, { etag, data });
+        }
+    }
+    return data;
+}
+
 // Display Visualization with Chart.js
 function displayVisualization(proposal, vizData) {
     elements.vizTitle.textContent = proposal.title;
@@ -194,6 +437,9 @@ function displayVisualization(proposal, vizData) {
         case 'box':
             chartConfig = createBoxChart(vizData);
             break;
+        case 'violin':
+            chartConfig = createViolinChart(vizData);
+            break;
         case 'correlationMatrix':
             chartConfig = createCorrelationMatrixChart(vizData);
             break;
@@ -213,24 +459,61 @@ function displayVisualization(proposal, vizData) {
 
 // Chart Creation Functions
 function createScatterChart(vizData) {
+    const colors = [
+        'rgba(59, 130, 246, 0.6)',    // Blue
+        'rgba(16, 185, 129, 0.6)',    // Green
+        'rgba(239, 68, 68, 0.6)',     // Red
+        'rgba(139, 92, 246, 0.6)',    // Purple
+        'rgba(255, 115, 0, 0.6)',     // orange
+        'rgba(14, 165, 233, 0.6)',    // Cyan
+        'rgba(234, 179, 8, 0.6)'      // Yellow
+    ];
+
+    // Columnar payload (plain or typed arrays): x, y and optional category codes into prepared.categories
+    const prepared = vizData.data;
+    const columns = prepared.data;
+    const categories = prepared.categories;
+    const pointRadius = columns.x.length > 2000 ? 2 : 4;
+
+    let datasets;
+    if (categories && columns.category) {
+        const points = categories.map(() => []);
+        columns.x.forEach((x, i) => {
+            points[columns.category[i]].push({ x: x, y: columns.y[i] });
+        });
+        datasets = categories.map((category, code) => ({
+            label: category,
+            data: points[code],
+            backgroundColor: colors[code % colors.length],
+            borderWidth: 0,
+            pointRadius: pointRadius,
+            pointHoverRadius: pointRadius + 2
+        }));
+    } else {
+        datasets = [{
+            label: state.selectedProposal.title,
+            data: Array.from(columns.x, (x, i) => ({ x: x, y: columns.y[i] })),
+            backgroundColor: 'rgba(59, 130, 246, 0.6)',
+            borderColor: 'rgba(59, 130, 246, 0.8)',
+            borderWidth: 1,
+            pointRadius: pointRadius,
+            pointHoverRadius: pointRadius + 2
+        }];
+    }
+
     return {
         type: 'scatter',
-        data: {
-            datasets: [{
-                label: state.selectedProposal.title,
-                data: vizData.data.data.map(d => ({ x: d.x, y: d.y })),
-                backgroundColor: 'rgba(59, 130, 246, 0.6)',
-                borderColor: 'rgba(59, 130, 246, 0.8)',
-                borderWidth: 1,
-                pointRadius: 4,
-                pointHoverRadius: 6
-            }]
-        },
+        data: { datasets: datasets },
         options: {
             responsive: true,
             maintainAspectRatio: false,
+            animation: columns.x.length > 2000 ? false : undefined,
             plugins: {
-                legend: { display: false },  // Single dataset = no legend (reduce chartjunk)
+                legend: { display: datasets.length > 1 },  // Single dataset = no legend (reduce chartjunk)
+                subtitle: {
+                    display: prepared.dropped_points > 0,
+                    text: `Échantillon de ${prepared.returned_points} points sur ${prepared.total_points}`
+                },
                 title: {
                     display: true,
                     text: state.selectedProposal.title,
@@ -486,16 +769,35 @@ function createPieChart(vizData) {
 }
 
 function createBoxChart(vizData) {
+    const prepared = vizData.data;
+    const boxes = prepared.data;
     return {
         type: 'bar',
         data: {
-            labels: vizData.data.data.map(d => d.category),
+            labels: boxes.map(d => d.category),
             datasets: [{
+                type: 'line',
                 label: 'Médiane',
-                data: vizData.data.data.map(d => d.median),
+                data: boxes.map(d => d.median),
+                showLine: false,
+                pointStyle: 'line',
+                pointRadius: 12,
+                borderColor: 'rgba(30, 41, 59, 1)',
+                borderWidth: 3
+            }, {
+                label: 'Q1 – Q3',
+                data: boxes.map(d => [d.q1, d.q3]),  // Floating bar = interquartile range
                 backgroundColor: 'rgba(102, 126, 234, 0.6)',
                 borderColor: 'rgba(102, 126, 234, 1)',
-                borderWidth: 2
+                borderWidth: 2,
+                grouped: false
+            }, {
+                label: 'Moustaches',
+                data: boxes.map(d => [d.lower_whisker, d.upper_whisker]),
+                backgroundColor: 'rgba(102, 126, 234, 0.15)',
+                borderWidth: 0,
+                barPercentage: 0.15,
+                grouped: false
             }]
         },
         options: {
@@ -513,13 +815,13 @@ function createBoxChart(vizData) {
                 x: {
                     title: {
                         display: true,
-                        text: vizData.x_label || 'Category'
+                        text: prepared.x_label || 'Category'
                     }
                 },
                 y: {
                     title: {
                         display: true,
-                        text: vizData.y_label || 'Value'
+                        text: prepared.y_label || 'Value'
                     }
                 }
             }
@@ -527,20 +829,69 @@ function createBoxChart(vizData) {
     };
 }
 
+function createViolinChart(vizData) {
+    // The box plot, with each category's KDE drawn around it as a mirrored outline
+    const chartConfig = createBoxChart(vizData);
+    const density = vizData.data.density;
+    if (!density) {
+        return chartConfig;
+    }
+    const grid = density.grid;
+    const peak = Math.max(...density.values.map(values => Math.max(...values)));
+
+    chartConfig.options.scales.y.suggestedMin = grid[0];
+    chartConfig.options.scales.y.suggestedMax = grid[grid.length - 1];
+    chartConfig.plugins = [{
+        id: 'violinOutline',
+        beforeDatasetsDraw(chart) {
+            const { ctx, scales: { x, y } } = chart;
+            const halfWidth = 0.45 * (x.width / Math.max(density.values.length, 1));
+            ctx.save();
+            ctx.fillStyle = 'rgba(102, 126, 234, 0.2)';
+            ctx.strokeStyle = 'rgba(102, 126, 234, 0.8)';
+            ctx.lineWidth = 1.5;
+            density.values.forEach((values, i) => {
+                if (!(peak > 0)) {
+                    return;
+                }
+                const center = x.getPixelForValue(i);
+                ctx.beginPath();
+                values.forEach((value, j) => {
+                    ctx.lineTo(center + halfWidth * value / peak, y.getPixelForValue(grid[j]));
+                });
+                for (let j = values.length - 1; j >= 0; j--) {
+                    ctx.lineTo(center - halfWidth * values[j] / peak, y.getPixelForValue(grid[j]));
+                }
+                ctx.closePath();
+                ctx.fill();
+                ctx.stroke();
+            });
+            ctx.restore();
+        }
+    }];
+    return chartConfig;
+}
+
 function createLineChart(vizData) {
+    // Columnar payload, already bucketed/downsampled server-side; from an
+    // Arrow stream y is a typed array that Chart.js reads as is
+    const prepared = vizData.data;
+    const columns = prepared.data;
+    const dense = columns.x.length > 500;
+
     return {
         type: 'line',
         data: {
-            labels: vizData.data.data.map(d => d.x),
+            labels: Array.from(columns.x),
             datasets: [{
                 label: vizData.y_label || 'Value',
-                data: vizData.data.data.map(d => d.y),
+                data: columns.y,
                 backgroundColor: 'rgba(102, 126, 234, 0.2)',
                 borderColor: 'rgba(102, 126, 234, 1)',
-                borderWidth: 3,
+                borderWidth: dense ? 1.5 : 3,
                 fill: true,
-                tension: 0.4,
-                pointRadius: 4,
+                tension: dense ? 0 : 0.4,
+                pointRadius: dense ? 0 : 4,
                 pointBackgroundColor: 'rgba(102, 126, 234, 1)',
                 pointBorderColor: '#fff',
                 pointBorderWidth: 2,
@@ -550,12 +901,17 @@ function createLineChart(vizData) {
         options: {
             responsive: true,
             maintainAspectRatio: false,
+            animation: dense ? false : undefined,
             plugins: {
                 legend: { display: true },
                 title: {
                     display: true,
                     text: state.selectedProposal.title,
                     font: { size: 18, weight: 'bold' }
+                },
+                subtitle: {
+                    display: prepared.returned_points < prepared.total_points,
+                    text: `${prepared.returned_points} points affichés sur ${prepared.total_points}`
                 }
             },
             scales: {
@@ -708,7 +1064,10 @@ function goBackToUpload() {
     elements.fileInput.value = '';
     elements.uploadInfo.textContent = 'Aucun fichier sélectionné';
     
-    // Clear state
+    // Clear state, the next upload replaces this dataset on the server
+    if (state.currentDataset) {
+        state.replacedDatasetId = state.currentDataset.dataset_id;
+    }
     state.currentDataset = null;
     state.proposals = [];
     state.selectedProposal = null;
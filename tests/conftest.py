@@ -0,0 +1,54 @@
+import io
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# The app imports its helpers as `utils.*` from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    """The Flask app, storing its datasets in a temporary data folder"""
+    os.chdir(tmp_path_factory.mktemp('app'))
+    import app
+    return app
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+def upload(client, csv, **form):
+    """Upload CSV text and wait for it to be processed; returns the JSON response"""
+    data = {'file': (io.BytesIO(csv.encode()), 'data.csv'), 'wait': '1'}
+    data.update(form)
+    response = client.post('/api/upload', data=data, content_type='multipart/form-data')
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+@pytest.fixture(scope='session')
+def grouped_frame():
+    """Group keys of every dtype aggregations support, values with decimals far apart and missing values"""
+    rows = 5000
+    rng = np.random.default_rng(0)
+    letters = np.array([f'k{i}' for i in range(12)], dtype=object)
+    values = rng.standard_normal(rows) * 10.0 ** rng.integers(-3, 6, size=rows)
+    values[rng.random(rows) < 0.1] = np.nan
+    df = pd.DataFrame({
+        'text': letters[rng.integers(12, size=rows)],
+        'category': pd.Categorical(letters[rng.integers(12, size=rows)]),
+        'flag': rng.random(rows) < 0.3,
+        'integer': rng.integers(-5, 5, size=rows),
+        'unique': np.array([f'id{i}' for i in range(rows)], dtype=object),
+        'float64': values,
+        'float32': values.astype(np.float32),
+        'count': rng.integers(-1000, 1000, size=rows)
+    })
+    df.loc[rng.random(rows) < 0.05, 'text'] = None
+    return df
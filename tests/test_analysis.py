@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import upload
+from utils.analyse import DataAnalyzer
+
+
+def test_upload_can_stratify_the_approximate_analysis(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'APPROX_ANALYSIS_ROWS', 1000)
+    monkeypatch.setattr(app_module, 'ANALYSIS_LATENCY_TARGET', 1e-9)
+    csv = 'region,sales\n' + ''.join(f'{"north" if i % 50 else "south"},{i % 97}\n' for i in range(30000))
+
+    approximate = upload(client, csv, strata='region')['analysis']['approximate']
+    assert approximate['sampling'] == 'stratified'
+    assert approximate['sample_rows'] < 30000
+
+    approximate = upload(client, csv.replace('sales', 'amount'))['analysis']['approximate']
+    assert approximate['sampling'] == 'uniform'
+
+
+def test_stratified_estimates_weigh_rows_by_their_stratum():
+    # 15000 strata of 2 rows each keep one row: half of the sample for 15% of the data
+    rng = np.random.default_rng(0)
+    big = 170000
+    df = pd.DataFrame({
+        'group': np.concatenate([np.zeros(big, dtype=np.int64), 1 + np.arange(30000) // 2]),
+        'kind': np.concatenate([np.where(rng.random(big) < 0.3, 'a', 'b'), np.full(30000, 'rare')])
+    })
+    df['kind'] = df['kind'].astype(object)
+    schema = {'group': {'kind': 'numeric'}, 'kind': {'kind': 'categorical'}}
+
+    analysis = DataAnalyzer().analyze_dataset(df, schema=schema, mode='approximate', latency_target=1e-9,
+                                              strata='group')
+    info = analysis['categorical_info']['kind']
+    truth = df['kind'].value_counts()
+    assert analysis['approximate']['sampling'] == 'stratified'
+    assert list(info['value_counts']) == ['b', 'a', 'rare']
+
+    # The tiny strata are all 'rare': known exactly
+    assert info['value_counts']['rare'] == 30000
+    assert info['shares']['rare']['ci'] == pytest.approx([0.15, 0.15])
+    for value in ('a', 'b'):
+        assert info['value_counts'][value] == pytest.approx(truth[value], rel=0.03)
+        low, high = info['shares'][value]['ci']
+        assert low <= truth[value] / len(df) <= high
+        # As wide as a sample of the large stratum's 5000 rows allows
+        assert high - low == pytest.approx(2 * 1.96 * 0.85 * np.sqrt(0.3 * 0.7 / 5000), rel=0.1)
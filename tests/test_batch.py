@@ -0,0 +1,76 @@
+import io
+import json
+import threading
+
+import pandas as pd
+
+from conftest import upload
+from utils.analyse import DataAnalyzer
+from utils.shared_work import SharedWork
+
+CSV = 'city,price,rooms\n' + ''.join(f'{c},{p},{r}\n' for c, p, r in [
+    ('Paris', 10.5, 2), ('Lyon', 7.25, 3), ('Paris', 12.0, 4), ('Nice', 9.0, 1), ('Lyon', 8.5, 2), ('Paris', 6.75, 5)
+])
+ITEMS = [
+    {'id': 1, 'type': 'scatter', 'config': {'x_axis': 'price', 'y_axis': 'rooms'}},
+    {'id': 2, 'type': 'scatter', 'config': {'x_axis': 'rooms', 'y_axis': 'price', 'color_by': 'city'}},
+    {'id': 3, 'type': 'bar', 'config': {'x_axis': 'city', 'y_axis': 'price', 'aggregation': 'sum'}},
+    {'id': 4, 'type': 'pie', 'config': {'category': 'city'}},
+    {'id': 5, 'type': 'box', 'config': {'category': 'city', 'value': 'price'}},
+]
+
+
+def test_shared_work_is_computed_once_across_threads():
+    shared = SharedWork()
+    calls = []
+    start = threading.Barrier(8)
+
+    def compute():
+        calls.append(1)
+        return [1, 2, 3]
+
+    def worker():
+        start.wait()
+        results.append(shared.get(('values', 'price'), compute))
+
+    results = []
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert shared.stats() == {'hits': 7, 'computed': 1}
+
+
+def test_batch_matches_single_prepares(client, app_module):
+    dataset_id = upload(client, CSV)['dataset_id']
+    batch = client.post('/api/prepare-visualizations', json={'dataset_id': dataset_id, 'items': ITEMS}).get_json()
+
+    assert batch['success']
+    assert [result['id'] for result in batch['results']] == [item['id'] for item in ITEMS]
+    # Both scatters read the same two numeric columns
+    assert batch['shared_work']['hits'] >= 2
+    df = pd.read_csv(io.StringIO(CSV))
+    for item, result in zip(ITEMS, batch['results']):
+        # Prepared alone, without anything shared
+        alone = DataAnalyzer().prepare_visualization_data(df, item['type'], item['config'])
+        assert result['success'], result
+        assert result['data'] == json.loads(app_module.app.json.dumps(alone))
+
+        single = client.post('/api/prepare-visualization', json={
+            'dataset_id': dataset_id, 'type': item['type'], 'config': item['config']})
+        assert result['etag'] == single.headers['ETag'].strip('"')
+
+
+def test_batch_reports_errors_per_item(client):
+    dataset_id = upload(client, CSV)['dataset_id']
+    batch = client.post('/api/prepare-visualizations', json={'dataset_id': dataset_id, 'items': [
+        ITEMS[3], {'id': 9, 'type': 'bar', 'config': {'x_axis': 'missing'}}, {'id': 10, 'type': 'unknown'}
+    ]}).get_json()
+
+    assert batch['success']
+    assert [result['success'] for result in batch['results']] == [True, False, False]
+    assert 'unknown' in batch['results'][2]['error'].lower()
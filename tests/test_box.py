@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.analyse import DataAnalyzer
+
+
+def frame(rows=3000, categories=20, seed=0):
+    """Groups of very different sizes, with missing categories and values"""
+    rng = np.random.default_rng(seed)
+    sizes = 1 / np.arange(1, categories + 1)
+    labels = np.array([f'c{i}' for i in range(categories)], dtype=object)
+    df = pd.DataFrame({
+        'category': labels[rng.choice(categories, size=rows, p=sizes / sizes.sum())],
+        'value': rng.standard_normal(rows) * 10 + 100
+    })
+    df.loc[rng.random(rows) < 0.05, 'category'] = None
+    df.loc[rng.random(rows) < 0.05, 'value'] = np.nan
+    return df
+
+
+@pytest.mark.parametrize('viz_type', ['box', 'violin'])
+def test_box_statistics_match_numpy_per_group(viz_type):
+    df = frame()
+    result = DataAnalyzer().prepare_visualization_data(
+        df, viz_type, {'category': 'category', 'value': 'value', 'max_categories': 30})
+
+    clean = df.dropna()
+    assert result['folded_categories'] == 0
+    assert sorted(item['category'] for item in result['data']) == sorted(clean['category'].unique())
+    for item in result['data']:
+        values = clean.loc[clean['category'] == item['category'], 'value'].to_numpy()
+        q1, median, q3 = np.quantile(values, [0.25, 0.5, 0.75])
+        assert item['count'] == len(values)
+        assert (item['min'], item['max']) == (values.min(), values.max())
+        assert item['q1'] == pytest.approx(q1, rel=1e-12)
+        assert item['median'] == pytest.approx(median, rel=1e-12)
+        assert item['q3'] == pytest.approx(q3, rel=1e-12)
+
+        inside = values[(values >= q1 - 1.5 * (q3 - q1)) & (values <= q3 + 1.5 * (q3 - q1))]
+        assert (item['lower_whisker'], item['upper_whisker']) == (inside.min(), inside.max())
+        assert item['outlier_count'] == len(values) - len(inside)
+
+
+def test_smallest_categories_are_folded_into_other():
+    df = frame()
+    result = DataAnalyzer().prepare_visualization_data(
+        df, 'box', {'category': 'category', 'value': 'value', 'max_categories': 5})
+
+    clean = df.dropna()
+    sizes = clean['category'].value_counts()
+    kept = sizes.index[:5]
+    assert result['folded_categories'] == len(sizes) - 5
+    assert {item['category'] for item in result['data']} == set(kept) | {'Other'}
+    other = next(item for item in result['data'] if item['category'] == 'Other')
+    rest = clean.loc[~clean['category'].isin(kept), 'value'].to_numpy()
+    assert other['count'] == len(rest)
+    assert other['median'] == pytest.approx(np.median(rest), rel=1e-12)
+
+
+def test_violin_densities_integrate_to_one():
+    df = frame()
+    result = DataAnalyzer().prepare_visualization_data(
+        df, 'violin', {'category': 'category', 'value': 'value', 'kde_bins': 40})
+
+    grid = np.asarray(result['density']['grid'])
+    width = grid[1] - grid[0]
+    assert len(result['density']['values']) == len(result['data'])
+    for values in result['density']['values']:
+        assert len(values) == 40
+        assert np.sum(values) * width == pytest.approx(1.0)
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+
+from conftest import upload
+from utils.cache import AnalysisCache, DatasetFingerprint
+
+
+def test_fingerprint_follows_the_content():
+    df = pd.DataFrame({'a': np.arange(1000), 'b': np.arange(1000) * 0.5, 'c': ['x', 'y'] * 500})
+    version = AnalysisCache.fingerprint(df)
+
+    # Same data, any chunking: same version
+    chunked = DatasetFingerprint()
+    for start in range(0, 1000, 300):
+        chunked.update(df.iloc[start:start + 300])
+    assert chunked.hexdigest() == version
+    assert AnalysisCache.fingerprint(df.copy()) == version
+
+    changed = df.copy()
+    changed.loc[500, 'b'] = 0.25
+    assert AnalysisCache.fingerprint(changed) != version
+    assert AnalysisCache.fingerprint(df.rename(columns={'c': 'd'})) != version
+    assert AnalysisCache.fingerprint(df.astype({'a': float})) != version
+
+
+def test_analysis_is_computed_once_per_version():
+    cache = AnalysisCache(max_entries=2)
+    computed = []
+
+    def compute(version):
+        return lambda: computed.append(version) or {'version': version}
+
+    for version in ['v1', 'v1', 'v2', 'v1', 'v3', 'v1', 'v2']:
+        assert cache.get_or_compute(version, compute(version)) == {'version': version}
+    # v2 was the least recently used one when v3 came in
+    assert computed == ['v1', 'v2', 'v3', 'v2']
+    assert cache.stats()['hits'] == 3 and cache.stats()['entries'] == 2
+
+    cache.invalidate('v1')
+    cache.get_or_compute('v1', compute('v1'))
+    assert computed[-1] == 'v1'
+    cache.invalidate()
+    assert cache.stats()['entries'] == 0
+
+
+def test_same_upload_reuses_its_analysis(client):
+    csv = 'label,amount\n' + ''.join(f'l{i % 7},{i * 1.25}\n' for i in range(200))
+    first = upload(client, csv)
+    hits = client.get('/api/cache-stats').get_json()['analysis']['hits']
+
+    second = upload(client, csv)
+    assert client.get('/api/cache-stats').get_json()['analysis']['hits'] > hits
+    assert second['analysis'] == first['analysis'] and first['analysis']['statistics']
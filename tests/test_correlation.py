@@ -0,0 +1,99 @@
+from fractions import Fraction
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.correlation import CorrelationEngine, top_correlations
+
+
+def frame(rows=2000, missing=0.1, seed=0):
+    """Correlated columns far from zero, a constant one and missing values"""
+    rng = np.random.default_rng(seed)
+    factor = rng.standard_normal(rows)
+    df = pd.DataFrame({
+        f'x{i}': 1e9 * (i % 2) + 10.0 ** (i % 3) * (i / 6 * factor + rng.standard_normal(rows))
+        for i in range(7)
+    })
+    df['constant'] = 0.1
+    df['integer'] = rng.integers(0, 5, size=rows)
+    for col in df.columns:
+        df.loc[rng.random(rows) < missing, col] = np.nan
+    return df
+
+
+@pytest.mark.parametrize('missing', [0.0, 0.1])
+@pytest.mark.parametrize('block_size', [1, 3, 256])
+def test_blocked_matrix_matches_pandas(missing, block_size):
+    df = frame(missing=missing)
+    matrix, sample = CorrelationEngine(block_size=block_size).matrix(df, df.columns)
+
+    assert sample is None
+    # pandas' own sums lose ~1e-8 on the columns offset by 1e9
+    pd.testing.assert_frame_equal(matrix, df.corr(), rtol=1e-6, atol=1e-7)
+    assert matrix['constant'].isna().all()
+
+
+def test_offset_columns_are_exact():
+    df = frame(rows=300)
+    matrix, _ = CorrelationEngine().matrix(df, df.columns)
+
+    for a, b in [('x0', 'x1'), ('x1', 'x3'), ('x3', 'x5'), ('x4', 'integer')]:
+        both = df[[a, b]].dropna()
+        xs, ys = [[Fraction(v) for v in both[col]] for col in (a, b)]
+        mx, my = sum(xs) / len(xs), sum(ys) / len(ys)
+        cross = sum((x - mx) * (y - my) for x, y in zip(xs, ys))
+        expected = float(cross) / float(sum((x - mx) ** 2 for x in xs) * sum((y - my) ** 2 for y in ys)) ** 0.5
+        assert matrix.loc[a, b] == pytest.approx(expected, rel=1e-12, abs=1e-15)
+
+
+def test_narrower_requests_are_slices_of_the_cached_matrix():
+    df = frame()
+    engine = CorrelationEngine()
+    engine.matrix(df, df.columns, version='v1')
+
+    # Served from the cache even though the frame no longer has the data
+    subset = ['x3', 'x0', 'x5']
+    matrix, _ = engine.matrix(df.iloc[:0], subset, version='v1')
+    pd.testing.assert_frame_equal(matrix, df[subset].corr(), rtol=1e-6, atol=1e-7)
+
+
+def test_new_version_is_computed_again():
+    df = frame()
+    engine = CorrelationEngine()
+    before, _ = engine.matrix(df, ['x5', 'x6'], version='v1')
+    assert before.loc['x5', 'x6'] > 0.4
+
+    changed = df.assign(x6=-df['x6'])
+    after, _ = engine.matrix(changed, ['x5', 'x6'], version='v2')
+    assert after.loc['x5', 'x6'] == pytest.approx(-before.loc['x5', 'x6'])
+
+    # Same version: the cached matrix, whatever the frame holds
+    stale, _ = engine.matrix(changed, ['x5', 'x6'], version='v1')
+    assert stale.loc['x5', 'x6'] == before.loc['x5', 'x6']
+
+    # Unless it was invalidated
+    engine.invalidate('v1')
+    after, _ = engine.matrix(changed, ['x5', 'x6'], version='v1')
+    assert after.loc['x5', 'x6'] < 0
+
+
+def test_sampled_matrix_stays_within_its_bound():
+    df = frame(rows=20000, missing=0.0)
+    columns = [f'x{i}' for i in range(7)]
+    matrix, sample = CorrelationEngine(sample_rows=2000).matrix(df, columns)
+
+    assert sample['rows'] == 2000 and sample['total_rows'] == 20000
+    error = (matrix - df[columns].corr()).abs().to_numpy().max()
+    assert error <= sample['error_bound']
+
+
+def test_top_correlations_are_the_strongest_pairs():
+    df = frame(missing=0.0)
+    columns = [f'x{i}' for i in range(7)]
+    corr = df[columns].corr()
+    pairs = sorted(((abs(corr.iloc[i, j]), columns[i], columns[j])
+                    for i in range(7) for j in range(i + 1, 7)), reverse=True)
+
+    top = top_correlations(corr.to_numpy(), columns, k=4)
+    assert [(t['var1'], t['var2']) for t in top] == [(a, b) for _, a, b in pairs[:4]]
@@ -0,0 +1,36 @@
+import json
+
+import pandas as pd
+import pytest
+
+from utils.cube import GroupCube
+from utils.query import AggregationPlan, PandasEngine
+
+KEYS = ('text', 'category', 'flag')
+NUMERIC = ('float64', 'float32', 'count')
+
+
+@pytest.fixture(scope='module')
+def cube(grouped_frame):
+    # Through JSON, like the cube stored next to a dataset
+    built = GroupCube.build(grouped_frame, list(KEYS) + ['unique'], list(NUMERIC))
+    return GroupCube.from_dict(json.loads(json.dumps(built.to_dict())))
+
+
+@pytest.mark.parametrize('plan', [AggregationPlan(key) for key in KEYS] + [
+    AggregationPlan(key, value, aggregation)
+    for key in KEYS
+    for value in NUMERIC
+    for aggregation in ('count', 'sum', 'mean', 'min', 'max')
+], ids=lambda plan: f'{plan.key}-{plan.value}-{plan.aggregation}')
+def test_cube_matches_pandas(grouped_frame, cube, plan):
+    expected = PandasEngine().aggregate(grouped_frame, plan)
+    pd.testing.assert_series_equal(cube.aggregate(plan), expected, check_exact=True)
+
+
+def test_cube_skips_what_it_does_not_cover(cube):
+    # Too many categories, unknown column, value not summarized
+    assert 'unique' not in cube.columns
+    assert cube.aggregate(AggregationPlan('unique')) is None
+    assert cube.aggregate(AggregationPlan('missing')) is None
+    assert cube.aggregate(AggregationPlan('text', 'unique', 'count')) is None
@@ -0,0 +1,18 @@
+from conftest import upload
+
+
+def test_requests_must_name_their_dataset(client):
+    upload(client, 'a,b\nx,1\ny,2\n')
+    config = {'type': 'bar', 'config': {'x_axis': 'a'}}
+
+    response = client.post('/api/prepare-visualization', json=config)
+    assert response.status_code == 400
+
+    response = client.post('/api/prepare-visualization', json=dict(config, dataset_id='unknown'))
+    assert response.status_code == 404
+
+
+def test_single_client_mode_falls_back_to_latest_upload(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'SINGLE_CLIENT_MODE', True)
+    dataset_id = upload(client, 'a,b\nx,1\ny,2\n')['dataset_id']
+    assert app_module.resolve_dataset_id({})[0] == dataset_id
@@ -0,0 +1,176 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.analyse import DataAnalyzer
+from utils.downsample import grid_thin, lttb, stratified_sample
+
+
+@pytest.mark.parametrize('strata, rows, budget', [
+    (10, 100000, 5000),
+    (500, 5000, 501),
+    (8000, 20000, 5000),
+    (3, 10, 5),
+])
+def test_stratified_sample_stays_within_budget(strata, rows, budget):
+    codes = np.random.default_rng(0).integers(0, strata, rows)
+    keep = stratified_sample(codes, budget)
+
+    assert len(keep) == budget
+    assert len(np.unique(keep)) == budget
+    assert np.all(np.diff(keep) > 0)
+
+
+def test_stratified_sample_keeps_every_stratum_when_budget_allows():
+    # One huge stratum and many single-row ones
+    codes = np.concatenate([np.zeros(10000, dtype=np.int64), np.arange(1, 101)])
+    keep = stratified_sample(codes, 1000)
+
+    assert len(keep) == 1000
+    assert set(codes[keep]) == set(range(101))
+
+
+def test_stratified_sample_drops_smallest_strata_first():
+    # Stratum c has c + 1 rows: with 5 points, the 5 largest strata keep one each
+    codes = np.repeat(np.arange(10), np.arange(1, 11))
+    keep = stratified_sample(codes, 5)
+
+    assert sorted(codes[keep]) == [5, 6, 7, 8, 9]
+
+
+def test_stratified_sample_is_proportional():
+    codes = np.repeat([0, 1, 2], [60000, 30000, 10000])
+    kept = np.bincount(codes[stratified_sample(codes, 1000)])
+
+    assert kept.sum() == 1000
+    assert np.abs(kept - [600, 300, 100]).max() <= 1
+
+
+def test_scatter_lists_only_kept_categories():
+    rng = np.random.default_rng(1)
+    df = pd.DataFrame({
+        'x': rng.random(20000),
+        'y': rng.random(20000),
+        'group': rng.integers(0, 8000, 20000).astype(str)
+    })
+    config = {'x_axis': 'x', 'y_axis': 'y', 'color_by': 'group', 'sampling': 'stratified', 'max_points': 5000}
+    prepared = DataAnalyzer().prepare_visualization_data(df, 'scatter', config)
+
+    assert prepared['returned_points'] == 5000
+    assert prepared['dropped_points'] == 15000
+    codes = np.asarray(prepared['data']['category'])
+    # Every listed category is used, and the codes point into the list
+    assert sorted(set(codes.tolist())) == list(range(len(prepared['categories'])))
+    assert len(prepared['categories']) <= 5000
+
+
+def test_lttb_keeps_the_ends_and_the_spikes():
+    rng = np.random.default_rng(2)
+    x = np.arange(10000, dtype=float)
+    y = rng.standard_normal(10000) * 0.1
+    spikes = [1234, 5678, 9000]
+    y[spikes] = [50, -50, 80]
+    keep = lttb(x, y, 100)
+
+    assert len(keep) == 100
+    assert keep[0] == 0 and keep[-1] == 9999
+    assert np.all(np.diff(keep) > 0)
+    assert set(spikes) <= set(keep.tolist())
+    # Short series are left alone
+    assert lttb(x[:50], y[:50], 100).tolist() == list(range(50))
+
+
+def test_line_is_sorted_and_downsampled_to_its_budget():
+    rng = np.random.default_rng(3)
+    df = pd.DataFrame({'t': rng.permutation(5000).astype(float), 'v': rng.standard_normal(5000)})
+    df.loc[::10, 'v'] = np.nan
+    prepared = DataAnalyzer().prepare_visualization_data(
+        df, 'line', {'x_axis': 't', 'y_axis': 'v', 'max_points': 300})
+
+    assert prepared['total_points'] == 4500
+    assert prepared['returned_points'] == 300 and prepared['downsampling'] == 'lttb'
+    x = np.asarray(prepared['data']['x'])
+    assert np.all(np.diff(x) > 0)
+    values = df.dropna().set_index('t')['v']
+    assert prepared['data']['y'] == values.loc[x].tolist()
+
+
+@pytest.mark.parametrize('bucket, freq, agg', [('hour', 'h', 'mean'), ('day', 'D', 'max'), ('month', 'MS', 'count')])
+def test_line_time_buckets_match_pandas(bucket, freq, agg):
+    rng = np.random.default_rng(4)
+    times = pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 90 * 24 * 3600, 20000), unit='s')
+    df = pd.DataFrame({'when': times.strftime('%Y-%m-%d %H:%M:%S'), 'value': rng.standard_normal(20000)})
+    prepared = DataAnalyzer().prepare_visualization_data(
+        df, 'line', {'x_axis': 'when', 'y_axis': 'value', 'bucket': bucket, 'bucket_agg': agg, 'max_points': 10000})
+
+    expected = pd.Series(df['value'].to_numpy(), index=times).resample(freq).agg(agg).dropna()
+    assert prepared['x_type'] == 'datetime' and prepared['bucket'] == bucket
+    assert prepared['y_label'] == f'{agg.capitalize()} of value'
+    assert prepared['data']['x'] == expected.index.strftime('%Y-%m-%d %H:%M:%S').tolist()
+    assert prepared['data']['y'] == pytest.approx(expected.tolist(), rel=1e-12)
+
+
+def test_unknown_line_bucket_is_an_error():
+    df = pd.DataFrame({'when': pd.date_range('2024-01-01', periods=10), 'value': range(10)})
+    prepared = DataAnalyzer().prepare_visualization_data(
+        df, 'line', {'x_axis': 'when', 'y_axis': 'value', 'bucket': 'fortnight'})
+    assert prepared == {'error': 'Unknown bucket: fortnight'}
+
+
+def test_grid_thinning_keeps_one_point_per_occupied_cell():
+    rng = np.random.default_rng(5)
+    # A dense cloud and a few far outliers
+    x = np.concatenate([rng.standard_normal(50000), [40.0, -40.0]])
+    y = np.concatenate([rng.standard_normal(50000), [40.0, -40.0]])
+    keep = grid_thin(x, y, 2500)
+
+    side = 50
+    cells = (np.minimum(((x - x.min()) / (x.max() - x.min()) * side).astype(int), side - 1) * side +
+             np.minimum(((y - y.min()) / (y.max() - y.min()) * side).astype(int), side - 1))
+    assert len(keep) <= 2500
+    assert np.all(np.diff(keep) > 0)
+    assert len(set(cells[keep].tolist())) == len(keep) == len(np.unique(cells))
+    assert {50000, 50001} <= set(keep.tolist())
+
+
+def test_grid_thinning_separates_categories():
+    x = np.tile(np.linspace(0, 1, 1000), 2)
+    y = np.tile(np.linspace(0, 1, 1000), 2)
+    codes = np.repeat([0, 1], 1000)
+    keep = grid_thin(x, y, 100, codes)
+
+    # The two categories overlap point for point, each keeps its own cells
+    assert np.bincount(codes[keep]).tolist() == [10, 10]
+
+
+@pytest.mark.parametrize('sampling, expected', [
+    ('uniform', 'uniform'), ('grid', 'grid'), ('stratified', 'stratified'), ('unknown', 'uniform')
+])
+def test_scatter_sampling_modes(sampling, expected):
+    rng = np.random.default_rng(6)
+    df = pd.DataFrame({
+        'x': rng.standard_normal(20000),
+        'y': rng.standard_normal(20000),
+        'group': rng.choice(['common', 'rare'], size=20000, p=[0.999, 0.001])
+    })
+    config = {'x_axis': 'x', 'y_axis': 'y', 'color_by': 'group', 'sampling': sampling, 'max_points': 1000}
+    prepared = DataAnalyzer().prepare_visualization_data(df, 'scatter', config)
+
+    assert prepared['sampling'] == expected
+    assert prepared['returned_points'] <= 1000
+    assert prepared['returned_points'] + prepared['dropped_points'] == 20000
+    categories = [prepared['categories'][code] for code in prepared['data']['category']]
+    if expected == 'stratified':
+        # The rare group keeps its share of the budget, at least a point
+        assert 1 <= categories.count('rare') <= 2
+    assert pd.DataFrame({'x': prepared['data']['x'], 'y': prepared['data']['y'], 'group': categories}).merge(
+        df, how='left', indicator=True)['_merge'].eq('both').all()
+
+
+def test_small_scatters_are_not_sampled():
+    df = pd.DataFrame({'x': [1.0, 2.0, np.nan, 4.0], 'y': [1.0, 3.0, 2.0, 5.0]})
+    prepared = DataAnalyzer().prepare_visualization_data(df, 'scatter', {'x_axis': 'x', 'y_axis': 'y'})
+
+    assert prepared['sampling'] is None
+    assert prepared['data'] == {'x': [1.0, 2.0, 4.0], 'y': [1.0, 3.0, 5.0], 'category': None}
+    assert prepared['missing_points'] == 1
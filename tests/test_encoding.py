@@ -0,0 +1,153 @@
+import gzip
+import json
+
+import numpy as np
+import orjson
+import pandas as pd
+import pyarrow as pa
+import pytest
+from werkzeug.datastructures import Accept
+from werkzeug.http import parse_accept_header
+
+from conftest import upload
+from utils.analyse import DataAnalyzer
+from utils.encoding import (ARROW_MIMETYPE, ARROW_TYPES, brotli, compress, dumps, negotiate_encoding,
+                            to_arrow, to_columnar)
+
+CHARTS = [
+    ('bar', {'x_axis': 'city', 'y_axis': 'price', 'aggregation': 'mean'}),
+    ('pie', {'category': 'city'}),
+    ('scatter', {'x_axis': 'price', 'y_axis': 'rooms', 'color_by': 'city'}),
+    ('line', {'x_axis': 'day', 'y_axis': 'price'}),
+    ('box', {'category': 'city', 'value': 'price'}),
+    ('heatmap', {'columns': ['price', 'rooms']}),
+]
+
+
+def frame(rows=500, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'city': rng.choice(['Paris', 'Lyon', 'Nice'], size=rows),
+        'price': rng.standard_normal(rows) * 3 + 10,
+        'rooms': rng.integers(1, 6, size=rows),
+        'day': pd.date_range('2024-01-01', periods=rows, freq='h')
+    })
+
+
+def decode(value):
+    """What the browser does with a columnar payload"""
+    if isinstance(value, dict):
+        if '$records' in value:
+            columns = {k: decode(v) for k, v in value['$records'].items()}
+            return [dict(zip(columns, row)) for row in zip(*columns.values())]
+        if '$dict' in value:
+            return [value['$dict'][code] for code in value['$codes']]
+        return {k: decode(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [decode(v) for v in value]
+    return value
+
+
+def assert_close(actual, expected):
+    if isinstance(expected, dict):
+        assert actual.keys() == expected.keys()
+        for key in expected:
+            assert_close(actual[key], expected[key])
+    elif isinstance(expected, list):
+        assert len(actual) == len(expected)
+        for a, e in zip(actual, expected):
+            assert_close(a, e)
+    elif isinstance(expected, float):
+        assert actual == pytest.approx(expected, rel=1e-6, abs=1e-6)
+    else:
+        assert actual == expected
+
+
+@pytest.mark.parametrize('viz_type, config', CHARTS)
+def test_columnar_payloads_round_trip(viz_type, config):
+    prepared = DataAnalyzer().prepare_visualization_data(frame(), viz_type, config)
+    assert 'error' not in prepared
+    plain = orjson.loads(dumps(prepared))
+
+    assert_close(decode(orjson.loads(dumps(to_columnar(plain)))), plain)
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('br, gzip', 'br' if brotli else 'gzip'),
+    ('gzip;q=0.5, br;q=1', 'br' if brotli else 'gzip'),
+    ('br;q=0, gzip', 'gzip'),
+    ('gzip', 'gzip'),
+    ('identity', None),
+    ('', None),
+])
+def test_negotiation_prefers_brotli_then_gzip(header, expected):
+    assert negotiate_encoding(parse_accept_header(header, Accept)) == expected
+
+
+def test_compressed_responses_decode_to_the_plain_one(client):
+    dataset_id = upload(client, 'city,price\nParis,10.5\nLyon,7.25\nParis,12\n')['dataset_id']
+    body = {'dataset_id': dataset_id, 'type': 'bar', 'format': 'columnar',
+            'config': {'x_axis': 'city', 'y_axis': 'price', 'aggregation': 'mean'}}
+    plain = client.post('/api/prepare-visualization', json=body)
+    assert 'Content-Encoding' not in plain.headers
+
+    response = client.post('/api/prepare-visualization', json=body, headers={'Accept-Encoding': 'br, gzip'})
+    encoding = 'br' if brotli else 'gzip'
+    assert response.headers['Content-Encoding'] == encoding
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    assert response.headers['ETag'] != plain.headers['ETag']
+    data = brotli.decompress(response.data) if brotli else gzip.decompress(response.data)
+    assert json.loads(data) == plain.get_json()
+    assert compress(plain.data, None) == plain.data
+
+
+@pytest.mark.parametrize('viz_type, config', [chart for chart in CHARTS if chart[0] in ARROW_TYPES])
+def test_arrow_streams_carry_the_json_payload(viz_type, config):
+    df = frame()
+    analyzer = DataAnalyzer()
+    plain = orjson.loads(dumps(analyzer.prepare_visualization_data(df, viz_type, config)))
+    prepared = analyzer.prepare_visualization_data(df, viz_type, config, arrays=True)
+    table = pa.ipc.open_stream(to_arrow(prepared)).read_all()
+
+    meta = json.loads(table.schema.metadata[b'chart'])
+    assert meta == {k: v for k, v in plain.items() if k != 'data'}
+    columns = [name for name, values in plain['data'].items() if values is not None]
+    assert table.column_names == columns
+    for name in columns:
+        values = table.column(name).to_pylist()
+        if viz_type == 'line' and name == 'x':
+            # Milliseconds of the wall-clock time the JSON payload prints
+            values = pd.to_datetime(values, unit='ms').strftime('%Y-%m-%d %H:%M:%S').tolist()
+        assert_close(values, plain['data'][name])
+
+
+def test_arrow_columns_are_narrowed():
+    table = pa.ipc.open_stream(to_arrow({'data': {
+        'small': np.arange(3, dtype=np.int64),
+        'large': np.array([0, 1, 2 ** 40]),
+        'exact': np.array([0.5, 1.25, 3.0]),
+        'precise': np.array([1e9, 1e9 + 1e-3, 1e9 + 2e-3]),
+        'label': np.array(['a', 'b', 'a'], dtype=object),
+        'empty': None
+    }})).read_all()
+
+    assert table.schema.types == [pa.int32(), pa.float64(), pa.float32(), pa.float64(),
+                                  pa.dictionary(pa.int32(), pa.string())]
+    assert table.column('large').to_pylist() == [0, 1, 2 ** 40]
+    assert table.column('precise').to_pylist() == [1e9, 1e9 + 1e-3, 1e9 + 2e-3]
+    assert table.column('label').to_pylist() == ['a', 'b', 'a']
+
+
+def test_arrow_format_is_served_for_scatter_and_line_only(client):
+    dataset_id = upload(client, 'a,b\n1,2\n2,4\n3,5\n')['dataset_id']
+    scatter = {'dataset_id': dataset_id, 'type': 'scatter', 'config': {'x_axis': 'a', 'y_axis': 'b'}}
+    response = client.post('/api/prepare-visualization', json=dict(scatter, format='arrow'))
+    assert response.mimetype == ARROW_MIMETYPE
+    assert pa.ipc.open_stream(response.data).read_all().column('y').to_pylist() == [2, 4, 5]
+
+    negotiated = client.post('/api/prepare-visualization', json=scatter, headers={'Accept': ARROW_MIMETYPE})
+    assert negotiated.mimetype == ARROW_MIMETYPE and negotiated.data == response.data
+
+    bar = client.post('/api/prepare-visualization', json={
+        'dataset_id': dataset_id, 'type': 'bar', 'format': 'arrow', 'config': {'x_axis': 'a'}})
+    assert bar.mimetype == 'application/json'
@@ -0,0 +1,97 @@
+import io
+import threading
+import time
+
+from utils.jobs import JobQueue
+
+
+def recorder():
+    """on_change hook recording every (status, stage) a job goes through"""
+    seen = {}
+
+    def on_change(job):
+        states = seen.setdefault(job.id, [])
+        if not states or states[-1] != (job.status, job.stage):
+            states.append((job.status, job.stage))
+    return seen, on_change
+
+
+def test_jobs_go_from_queued_to_done_or_error():
+    seen, on_change = recorder()
+    queue = JobQueue(workers=1, on_change=on_change)
+    release = threading.Event()
+
+    def slow(job):
+        job.update(stage='parsing', rows=10)
+        release.wait(5)
+        return {'rows': job.rows}
+
+    def failing(job):
+        raise ValueError('bad file')
+
+    first = queue.submit(slow)
+    second = queue.submit(failing)
+    # One worker: the second job waits for the first
+    assert second.to_dict()['status'] == 'queued'
+    assert queue.stats()['queued'] >= 1
+    release.set()
+    assert first.wait(5) and second.wait(5)
+
+    assert seen[first.id] == [('queued', 'queued'), ('running', 'queued'), ('running', 'parsing'), ('done', 'done')]
+    assert first.to_dict()['result'] == {'rows': 10}
+    assert first.to_dict()['progress'] == 1.0
+    assert seen[second.id][-1] == ('error', 'queued')
+    assert second.to_dict()['error'] == 'bad file'
+    assert queue.stats()['finished'] == 2
+
+
+def test_full_queue_refuses_jobs():
+    queue = JobQueue(workers=1, max_pending=1)
+    release = threading.Event()
+    running = queue.submit(lambda job: release.wait(5))
+    while running.status != 'running':
+        time.sleep(0.01)
+
+    assert queue.submit(lambda job: None) is not None
+    assert queue.full()
+    assert queue.submit(lambda job: None) is None
+    release.set()
+
+
+def test_jobs_wait_for_memory():
+    seen, on_change = recorder()
+    queue = JobQueue(workers=2, memory_budget=100, on_change=on_change)
+    release = threading.Event()
+    big = queue.submit(lambda job: release.wait(5), memory=80)
+    while big.status != 'running':
+        time.sleep(0.01)
+
+    other = queue.submit(lambda job: None, memory=50)
+    while other.stage != 'waiting_memory':
+        time.sleep(0.01)
+    assert other.status == 'queued'
+    assert queue.stats()['reserved_bytes'] == 80
+    release.set()
+
+    assert other.wait(5)
+    assert ('running', 'waiting_memory') in seen[other.id]
+    assert other.status == 'done'
+    assert queue.stats()['reserved_bytes'] == 0
+
+
+def test_uploads_are_polled_until_done(client):
+    response = client.post('/api/upload', data={'file': (io.BytesIO(b'a,b\nx,1\ny,2\n'), 'data.csv')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 202
+    status_url = response.get_json()['status_url']
+
+    deadline = time.time() + 10
+    state = client.get(status_url).get_json()
+    while state['status'] in ('queued', 'running') and time.time() < deadline:
+        time.sleep(0.05)
+        state = client.get(status_url).get_json()
+    assert state['status'] == 'done', state
+    assert state['stage'] == 'done'
+    assert state['result']['dataset_id']
+
+    assert client.get('/api/jobs/unknown').status_code == 404
@@ -0,0 +1,172 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import pytest
+
+from conftest import upload
+from utils.analyse import DataAnalyzer
+from utils.llm_client import LLMClient, LLMError
+from utils.prompt import GeminiService
+
+PROPOSALS = {'propositions': [{'id': 1, 'type': 'bar', 'title': 'Ventes', 'justification': 'ok',
+                               'config': {'x_axis': 'a', 'aggregation': 'count'}}]}
+
+
+class FakeClient:
+    """Answers questions containing "ok", fails the others once `release` is set"""
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def post_json(self, payload):
+        if 'ok' in payload['messages'][-1]['content']:
+            return {'choices': [{'message': {'content': json.dumps(PROPOSALS)}}]}
+        self.release.wait(5)
+        raise LLMError('backend down', status=503)
+
+    def post_stream(self, payload, on_usage=None):
+        raise LLMError('backend down', status=503)
+
+
+@pytest.fixture
+def context():
+    df = pd.DataFrame({'a': ['x', 'y', 'x'], 'b': [1, 2, 3]})
+    return DataAnalyzer().analyze_dataset(df), list(df.columns)
+
+
+def test_concurrent_calls_report_their_own_outcome(context):
+    analysis, columns = context
+    client = FakeClient()
+    service = GeminiService(api_key='key', client=client)
+
+    # A failing call still in flight while another one succeeds
+    failed = {}
+    thread = threading.Thread(target=lambda: failed.update(service.generate('question', analysis, columns)))
+    thread.start()
+    succeeded = service.generate('ok question', analysis, columns)
+    client.release.set()
+    thread.join()
+
+    assert succeeded['error'] is None
+    assert succeeded['proposals'] == PROPOSALS['propositions']
+    assert succeeded['prompt_tokens'] > 0
+    assert failed['error'] == 'backend down'
+    assert failed['proposals'] == service._get_default_proposals(['b'], ['a'])
+
+
+def test_stream_reports_its_outcome_last(context):
+    analysis, columns = context
+    events = list(GeminiService(api_key='key', client=FakeClient()).stream_visualization_proposals(
+        'question', analysis, columns))
+
+    # One numeric column: only the bar chart of the defaults can be drawn
+    assert [kind for kind, _ in events] == ['proposal', 'done']
+    assert events[-1][1]['error'] == 'backend down'
+
+
+class FakeResponse:
+    def __init__(self, status):
+        self.status_code = status
+        self.headers = {'Retry-After': '0'}
+        self.text = ''
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.closed = True
+
+
+def test_retried_responses_are_closed():
+    client = LLMClient('http://llm.invalid', 'key', max_retries=3)
+    responses = [FakeResponse(503), FakeResponse(429), FakeResponse(200)]
+    pending = iter(responses)
+    client.session.post = lambda *args, **kwargs: next(pending)
+
+    assert client._request({}, deadline=time.monotonic() + 10, stream=True) is responses[2]
+    assert [response.closed for response in responses] == [True, True, False]
+
+
+class ScriptedHandler(BaseHTTPRequestHandler):
+    """Answers each POST with the next (status, headers) of the server's script"""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        status, headers = self.server.script.pop(0)
+        self.server.times.append(time.monotonic())
+        body = json.dumps({'choices': [{'message': {'content': '{}'}}]} if status == 200 else {}).encode()
+        self.send_response(status)
+        for name, value in dict(headers, **{'Content-Length': str(len(body))}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ScriptedHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_async_calls_retry_on_separate_event_loops(server):
+    client = LLMClient(f'http://127.0.0.1:{server.server_port}', 'key', max_retries=3,
+                       backoff_base=0.05, backoff_max=0.05)
+
+    # Each asyncio.run has its own loop, closed when it returns
+    for _ in range(2):
+        server.script = [(429, {'Retry-After': '0.2'}), (503, {}), (200, {})]
+        server.times = []
+        assert asyncio.run(client.apost_json({'messages': []})) == {'choices': [{'message': {'content': '{}'}}]}
+        assert server.script == []
+        # Retry-After is honoured before the second attempt
+        assert server.times[1] - server.times[0] >= 0.2
+    assert len(client._async) == 1
+
+    server.script = [(500, {})] * 4
+    with pytest.raises(LLMError) as error:
+        asyncio.run(client.apost_json({'messages': []}))
+    assert error.value.status == 500
+    assert server.script == []
+
+
+def test_async_generation_reports_its_outcome(context):
+    analysis, columns = context
+
+    class AsyncClient:
+        async def apost_json(self, payload):
+            return {'choices': [{'message': {'content': json.dumps(PROPOSALS)}}]}
+
+    outcome = asyncio.run(GeminiService(api_key='key', client=AsyncClient()).agenerate('ok', analysis, columns))
+    assert outcome['error'] is None
+    assert outcome['proposals'] == PROPOSALS['propositions']
+
+
+def test_fallback_proposals_survive_the_stream(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module.gemini_service, 'client', FakeClient())
+    dataset_id = upload(client, 'ville,prix,surface\nParis,10,30\nLyon,7,45\nParis,12,50\nNice,9,20\n')['dataset_id']
+
+    response = client.post('/api/generate-visualizations/stream', json={
+        'dataset_id': dataset_id, 'question': 'prix par ville', 'bypass_cache': True
+    })
+    events = [json.loads(line) for line in response.data.decode().splitlines()]
+
+    assert [event['event'] for event in events] == ['proposal'] * 3 + ['done']
+    assert events[-1]['fallback'] and events[-1]['count'] == 3
+    for event in events[:-1]:
+        proposal = event['proposal']
+        prepared = client.post('/api/prepare-visualization', json={
+            'dataset_id': dataset_id, 'type': proposal['type'], 'config': proposal['config']
+        })
+        assert prepared.status_code == 200, prepared.get_json()
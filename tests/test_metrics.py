@@ -0,0 +1,42 @@
+import re
+
+from conftest import upload
+from utils.metrics import MetricsRegistry
+
+# name{labels} value, as Prometheus scrapes it
+SAMPLE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{([a-zA-Z_]\w*="([^"\\]|\\.)*",?)*\})? \S+$')
+
+
+def test_histogram_and_counter_exposition():
+    registry = MetricsRegistry()
+    latency = registry.histogram('latency_seconds', 'Latency', labels=('route',), buckets=(0.1, 1))
+    tokens = registry.counter('tokens_total', 'Tokens', labels=('kind',))
+    registry.collected('broken', 'Fails at scrape time', lambda: 1 / 0)
+    latency.observe(0.05, route='a')
+    latency.observe(0.5, route='a')
+    tokens.inc(3, kind='say "hi"\n')
+
+    lines = registry.render().splitlines()
+    assert lines[:2] == ['# HELP latency_seconds Latency', '# TYPE latency_seconds histogram']
+    assert 'latency_seconds_bucket{route="a",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{route="a",le="1"} 2' in lines
+    assert 'latency_seconds_bucket{route="a",le="+Inf"} 2' in lines
+    assert 'latency_seconds_sum{route="a"} 0.55' in lines
+    assert 'latency_seconds_count{route="a"} 2' in lines
+    assert 'tokens_total{kind="say \\"hi\\"\\n"} 3' in lines
+    # A failing collector is reported without hiding the other metrics
+    assert lines[-1].startswith('# broken unavailable:')
+
+
+def test_metrics_endpoint_labels_routes_and_stages(client):
+    upload(client, 'a,b\nx,1\ny,2\n')
+    response = client.get('/api/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+
+    text = response.data.decode()
+    for line in text.splitlines():
+        assert line.startswith('#') or SAMPLE.match(line), line
+    assert re.search(r'^dataviz_request_seconds_count\{route="upload_file",status="200"\} \d+$', text, re.M)
+    assert re.search(r'^dataviz_stage_seconds_count\{route="[^"]+",stage="[^"]+"\} \d+$', text, re.M)
+    assert re.search(r'^dataviz_datasets\{state="known"\} [1-9]\d*$', text, re.M)
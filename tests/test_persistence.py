@@ -0,0 +1,35 @@
+import pandas as pd
+import pytest
+
+from utils.persistence import DatasetPersistence
+
+
+@pytest.mark.parametrize('format', ['parquet', 'arrow'])
+def test_chunk_writer_widens_types_across_chunks(tmp_path, format):
+    persistence = DatasetPersistence(str(tmp_path), format=format)
+    writer = persistence.writer('ds')
+    writer.write(pd.DataFrame({'code': [1, 2], 'count': [1, 2], 'note': [None, None]}))
+    # Letters in a column of digits, a decimal and a blank in an integer column
+    writer.write(pd.DataFrame({'code': ['A1', '3'], 'count': [4.5, None], 'note': [None, 'x']}))
+    writer.write(pd.DataFrame({'code': [5, 6], 'count': [7, 8], 'note': ['y', None]}))
+    writer.close()
+    persistence.save_meta('ds', {'schema': None})
+
+    df = persistence.load('ds')
+    assert df['code'].tolist() == ['1', '2', 'A1', '3', '5', '6']
+    assert df['count'].dtype == 'float64'
+    assert df['count'].tolist()[:3] == [1.0, 2.0, 4.5]
+    assert df['count'].isna().sum() == 1
+    assert df['note'].tolist() == [None, None, None, 'x', 'y', None]
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted([f'ds.{format}', 'ds.json'])
+
+
+@pytest.mark.parametrize('format', ['parquet', 'arrow'])
+def test_save_and_load_round_trip(tmp_path, format):
+    persistence = DatasetPersistence(str(tmp_path), format=format)
+    df = pd.DataFrame({'a': [1, 2, 3], 'b': ['x', 'y', None], 'c': [0.5, None, 1.5]})
+    persistence.save('ds', df, version='v1')
+
+    pd.testing.assert_frame_equal(persistence.load('ds'), df)
+    pd.testing.assert_frame_equal(persistence.load('ds', columns=['c']), df[['c']])
+    assert persistence.load_meta('ds')['version'] == 'v1'
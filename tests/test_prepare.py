@@ -0,0 +1,62 @@
+import gzip
+import json
+
+import pytest
+
+from conftest import upload
+
+CSV = 'city,price,rooms\n' + ''.join(f'{c},{p},{r}\n' for c, p, r in [
+    ('Paris', 10.5, 2), ('Lyon', 7.25, 3), ('Paris', 12.0, 4), ('Nice', 9.0, 1), ('Lyon', 8.5, 2)
+])
+BAR = {'x_axis': 'city', 'y_axis': 'price', 'aggregation': 'mean'}
+
+
+@pytest.fixture
+def dataset_id(client):
+    return upload(client, CSV)['dataset_id']
+
+
+def prepare(client, dataset_id, headers=None, **body):
+    return client.post('/api/prepare-visualization', headers=headers or {},
+                       json=dict({'dataset_id': dataset_id, 'type': 'bar', 'config': BAR}, **body))
+
+
+def test_prepared_chart_revalidates(client, dataset_id):
+    first = prepare(client, dataset_id)
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+
+    again = prepare(client, dataset_id, headers={'If-None-Match': etag})
+    assert again.status_code == 304
+
+    changed = client.post('/api/prepare-visualization', headers={'If-None-Match': etag}, json={
+        'dataset_id': dataset_id, 'type': 'bar', 'config': dict(BAR, aggregation='sum')
+    })
+    assert changed.status_code == 200
+
+
+@pytest.mark.parametrize('accept_encoding', [None, 'gzip'])
+def test_batch_etags_revalidate_the_columnar_variant(client, dataset_id, accept_encoding):
+    headers = {'Accept-Encoding': accept_encoding} if accept_encoding else {}
+    batch = client.post('/api/prepare-visualizations', headers=headers, json={
+        'dataset_id': dataset_id, 'format': 'columnar',
+        'items': [{'id': 0, 'type': 'bar', 'config': BAR}, {'id': 1, 'type': 'pie', 'config': {'category': 'city'}}]
+    })
+    body = batch.data if accept_encoding is None else gzip.decompress(batch.data)
+    results = json.loads(body)['results']
+
+    # What the browser does with a card prepared by the batch
+    for result in results:
+        response = client.post('/api/prepare-visualization', headers=dict(headers, **{
+            'If-None-Match': f'"{result["etag"]}"'
+        }), json={'dataset_id': dataset_id, 'type': result['type'], 'config': result['config'], 'format': 'columnar'})
+        assert response.status_code == 304
+
+
+def test_columnar_and_plain_payloads_match(client, dataset_id):
+    plain = prepare(client, dataset_id).get_json()['data']
+    columnar = prepare(client, dataset_id, format='columnar').get_json()['data']
+
+    records = columnar['data']['$records']
+    assert records['category'] == [row['category'] for row in plain['data']]
+    assert records['value'] == [row['value'] for row in plain['data']]
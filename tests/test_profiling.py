@@ -0,0 +1,64 @@
+import time
+
+import pandas as pd
+import pytest
+
+from utils.profiling import ProfileStore, RequestProfile
+
+TOKEN = 'secret-token'
+
+
+def work():
+    df = pd.DataFrame({'a': range(20000)})
+    deadline = time.perf_counter() + 0.05
+    while time.perf_counter() < deadline:
+        df['a'].sum()
+
+
+def profiled():
+    """A profile of application code calling into pandas, like a view run after the before_request hook"""
+    profile = RequestProfile()
+    profile.start()
+    work()
+    profile.stop()
+    return profile
+
+
+@pytest.fixture
+def saved_profile(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'PROFILE_ADMIN_TOKEN', TOKEN)
+    return app_module.profile_store.save(profiled(), {'path': '/api/test'})
+
+
+def test_profiles_need_the_admin_token(client, saved_profile):
+    for url in (f'/api/profiles/{saved_profile}', f'/api/profiles/{saved_profile}/folded'):
+        assert client.get(url).status_code == 404
+        assert client.get(url, headers={'X-Profile': 'wrong'}).status_code == 404
+        assert client.get(url, headers={'X-Profile': TOKEN}).status_code == 200
+        assert client.get(f'{url}?profile={TOKEN}').status_code == 200
+
+
+def test_unknown_profiles_are_not_found(client, saved_profile):
+    headers = {'X-Profile': TOKEN}
+    assert client.get('/api/profiles/0123abcd', headers=headers).status_code == 404
+    assert client.get('/api/profiles/0123abcd/folded', headers=headers).status_code == 404
+    assert client.get('/api/profiles/..%2Fregistry/folded', headers=headers).status_code == 404
+
+
+def test_profiles_are_off_without_a_token(client, saved_profile, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'PROFILE_ADMIN_TOKEN', None)
+    assert client.get(f'/api/profiles/{saved_profile}', headers={'X-Profile': TOKEN}).status_code == 404
+
+
+def test_report_breaks_pandas_time_down_by_caller(tmp_path):
+    store = ProfileStore(str(tmp_path), max_profiles=2)
+    ids = [store.save(profiled(), {'path': '/api/test'}) for _ in range(3)]
+
+    report = store.load(ids[-1])
+    assert report['request'] == {'path': '/api/test'}
+    assert report['samples'] > 0
+    assert any(entry['caller'].startswith('work (tests/test_profiling.py')
+               and entry['library'] == 'pandas' for entry in report['dataframe_operations'])
+    assert 'work (tests/test_profiling.py' in store.load(ids[-1], kind='folded')
+    # Only the latest `max_profiles` are kept
+    assert store.load(ids[0]) is None
@@ -0,0 +1,65 @@
+import pytest
+
+from utils.prompt_builder import PromptBuilder, estimate_tokens
+
+
+def wide_info(columns=300):
+    """Analysis of a wide dataset: numeric columns, then categorical ones with many values"""
+    statistics = {f'mesure_{i}': {'mean': i * 1.5, 'median': i, 'min': 0, 'max': 2 * i, 'std': 0.5}
+                  for i in range(columns // 2)}
+    categorical_info = {f'groupe_{i}': {'unique_count': 40, 'value_counts': {f'v{j}': 100 - j for j in range(40)}}
+                        for i in range(columns // 2)}
+    info = {
+        'statistics': statistics,
+        'categorical_info': categorical_info,
+        'correlations': [{'var1': 'mesure_7', 'var2': 'mesure_9', 'correlation': -0.93}]
+    }
+    return info, list(statistics) + list(categorical_info)
+
+
+@pytest.mark.parametrize('budget', [50, 200, 1000])
+def test_context_stays_within_the_token_budget(budget):
+    info, columns = wide_info()
+    context = PromptBuilder(token_budget=budget).build('', info, columns)
+
+    text = '\n'.join(context[key] for key in ('statistics', 'categorical_info', 'correlations', 'omitted'))
+    assert context['estimated_tokens'] <= budget
+    assert estimate_tokens(text) <= budget
+    assert len(context['columns']) + context['omitted_count'] == len(columns)
+    assert context['omitted_count'] > 0
+    assert context['omitted'].startswith(str(context['omitted_count']))
+
+
+def test_omitted_columns_are_named_when_they_fit():
+    info, columns = wide_info(columns=20)
+    context = PromptBuilder(token_budget=250).build('', info, columns)
+
+    assert 0 < context['omitted_count'] < 20
+    assert context['omitted'].startswith(f"Autres colonnes ({context['omitted_count']}, sans détail): ")
+    assert all(col in context['omitted'] for col in columns if col not in context['columns'])
+
+
+def test_columns_named_in_the_question_are_described_first():
+    info, columns = wide_info()
+    context = PromptBuilder(token_budget=100).build('Comment évolue le Groupe_42 ?', info, columns)
+
+    assert 'groupe_42' in context['categorical'] and len(context['columns']) < 10
+    assert 'groupe_42 [40 valeurs]: v0 (100), v1 (99), v2 (98), v3 (97)' in context['categorical_info']
+    assert context['numeric'] == []
+
+
+def test_strongest_correlated_columns_come_next():
+    info, columns = wide_info()
+    context = PromptBuilder(token_budget=100).build('', info, columns)
+
+    assert {'mesure_7', 'mesure_9'} <= set(context['columns']) and len(context['columns']) < 10
+    assert context['correlations'] == 'mesure_7 ~ mesure_9: -0.93'
+
+
+def test_small_datasets_are_described_in_full():
+    info, columns = wide_info(columns=6)
+    context = PromptBuilder(token_budget=2000).build('', info, columns)
+
+    assert context['columns'] == columns
+    assert context['omitted'] == '' and context['omitted_count'] == 0
+    assert 'mesure_2: moy=3 med=2 min=0 max=4 std=0.5' in context['statistics']
@@ -0,0 +1,34 @@
+import json
+import os
+import time
+
+from utils.proposal_cache import ProposalCache
+
+
+def test_expired_files_are_deleted_when_read(tmp_path):
+    cache = ProposalCache(str(tmp_path), ttl=60)
+    key = cache.key('question', {'columns': ['a']})
+    cache.put(key, [{'type': 'bar'}])
+    path = tmp_path / f'{key}.json'
+
+    # Written an hour ago, by a previous process
+    path.write_text(json.dumps({'created': time.time() - 3600, 'proposals': [{'type': 'bar'}]}))
+    cache._memory.clear()
+
+    assert cache.get(key) is None
+    assert not path.exists()
+
+
+def test_file_tier_is_bounded(tmp_path):
+    cache = ProposalCache(str(tmp_path), max_entries=2, max_files=3)
+    for i in range(5):
+        cache.put(cache.key(f'question {i}', {}), [i])
+        old = time.time() - 100 + i
+        os.utime(tmp_path / f"{cache.key(f'question {i}', {})}.json", (old, old))
+    cache.prune()
+
+    assert len(os.listdir(tmp_path)) == 3
+    # The newest entries are kept, and answered from disk
+    cache._memory.clear()
+    assert cache.get(cache.key('question 4', {})) == [4]
+    assert cache.get(cache.key('question 0', {})) is None
@@ -0,0 +1,61 @@
+import json
+
+import pytest
+
+from utils.proposal_stream import ProposalStreamParser, validate_proposal
+
+PROPOSALS = [
+    {'id': 1, 'type': 'bar', 'title': 'Prix {moyen} par "ville"', 'config': {'x_axis': 'ville', 'y_axis': 'prix'}},
+    {'id': 2, 'type': 'scatter', 'title': 'Crochets ] et [ \\ échappés', 'config': {'x_axis': 'a', 'y_axis': 'b'}},
+    {'id': 3, 'type': 'pie', 'title': 'Parts', 'config': {'category': 'ville', 'nested': {'deep': [1, {'x': 2}]}}},
+]
+DOCUMENT = '```json\n' + json.dumps({'analyse': 'ok', 'propositions': PROPOSALS, 'fin': [{'id': 9}]},
+                                    ensure_ascii=False, indent=2) + '\n```'
+
+
+def parse(chunks):
+    parser = ProposalStreamParser()
+    found = []
+    for chunk in chunks:
+        found.extend(parser.feed(chunk))
+    return found
+
+
+def test_every_split_yields_the_same_proposals():
+    for cut in range(len(DOCUMENT)):
+        assert parse([DOCUMENT[:cut], DOCUMENT[cut:]]) == PROPOSALS, cut
+
+
+def test_proposals_come_out_as_soon_as_they_are_closed():
+    parser = ProposalStreamParser()
+    emitted = []
+    for position, char in enumerate(DOCUMENT):
+        for proposal in parser.feed(char):
+            emitted.append((proposal['id'], position))
+
+    assert [pid for pid, _ in emitted] == [1, 2, 3]
+    for pid, position in emitted:
+        # Out on its closing brace: one character earlier it was not complete
+        assert DOCUMENT[position] == '}'
+        assert len(parse([DOCUMENT[:position]])) == pid - 1
+
+
+def test_broken_proposals_are_skipped():
+    text = '{"propositions": [{"id": 1, "type": }, {"id": 2, "type": "bar"}]}'
+    assert parse([text[:20], text[20:]]) == [{'id': 2, 'type': 'bar'}]
+    assert parse(['{"analyse": "pas de propositions"}']) == []
+
+
+@pytest.mark.parametrize('proposal, error', [
+    ({'type': 'bar', 'config': {'x_axis': 'ville'}}, None),
+    ({'type': 'heatmap', 'config': {'columns': ['prix', 'surface']}}, None),
+    ({'type': 'scatter', 'config': {'x_axis': 'prix', 'y_axis': 'auto'}}, None),
+    ({'type': 'radar', 'config': {}}, 'Type de graphique inconnu: radar'),
+    ({'type': 'box', 'config': {'category': 'ville'}}, 'Paramètre manquant: value'),
+    ({'type': 'pie', 'config': {'category': 'pays'}}, 'Colonne inexistante: pays'),
+    ({'type': 'heatmap', 'config': {'columns': ['prix', 'age']}}, 'Colonne inexistante: age'),
+    ({'type': 'bar', 'config': 'x_axis=ville'}, 'Configuration invalide'),
+    ('bar', 'Proposition invalide'),
+])
+def test_proposals_are_validated_against_the_columns(proposal, error):
+    assert validate_proposal(proposal, ['ville', 'prix', 'surface']) == error
@@ -0,0 +1,47 @@
+import pandas as pd
+import pytest
+
+from utils.persistence import DatasetPersistence
+from utils.query import AggregationPlan, ColumnarEngine, create_engine
+
+pytest.importorskip('polars')
+pytest.importorskip('duckdb')
+
+PLANS = [AggregationPlan(key) for key in ('text', 'integer')] + [
+    AggregationPlan(key, value, aggregation)
+    for key in ('text', 'category', 'integer')
+    for value in ('float64', 'float32', 'count')
+    for aggregation in ('count', 'sum', 'mean', 'min', 'max')
+]
+
+
+@pytest.fixture(scope='module')
+def sources(tmp_path_factory, grouped_frame):
+    """The frame and its stored Parquet and Arrow files"""
+    df = grouped_frame
+    folder = tmp_path_factory.mktemp('datasets')
+    files = {}
+    for format in ('parquet', 'arrow'):
+        persistence = DatasetPersistence(str(folder), format=format)
+        persistence.save(format, df)
+        files[format] = persistence.data_path(format)
+    return df, files
+
+
+@pytest.mark.parametrize('engine,source', [('polars', None), ('duckdb', None), ('duckdb', 'parquet'),
+                                           ('duckdb', 'arrow')])
+@pytest.mark.parametrize('plan', PLANS, ids=lambda plan: f'{plan.key}-{plan.value}-{plan.aggregation}')
+def test_engines_match_pandas(sources, engine, source, plan):
+    df, files = sources
+    expected = create_engine('pandas').aggregate(df, plan)
+    result = create_engine(engine).aggregate(df, plan, source=files.get(source))
+    # Exact: same groups, order, dtypes and values to the last bit
+    pd.testing.assert_series_equal(result, expected, check_exact=True)
+
+
+def test_columnar_engines_must_implement_run():
+    class Incomplete(ColumnarEngine):
+        name = 'incomplete'
+
+    with pytest.raises(TypeError):
+        Incomplete()
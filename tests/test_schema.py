@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+from conftest import upload
+from utils.schema import infer_schema, fit_schema, apply_schema
+
+
+def test_fit_schema_widens_instead_of_casting():
+    schema = infer_schema(pd.DataFrame({'n': [1, 2], 'code': [10, 20], 'flag': [True, False]}), downcast=False)
+    chunk = pd.DataFrame({'n': [4.5, np.nan], 'code': ['A1', '30'], 'flag': [True, False]})
+
+    fitted, changed = fit_schema(chunk, schema)
+    assert fitted['n']['dtype'] == 'float64'
+    assert fitted['code']['kind'] in ('categorical', 'text')
+    assert fitted['flag'] == schema['flag']
+    assert changed == ['code']
+
+    converted = apply_schema(chunk, fitted, categories=False)
+    assert converted['n'].tolist()[0] == 4.5
+    assert converted['code'].tolist() == ['A1', '30']
+
+
+def test_text_chunk_of_digits_stays_text():
+    schema = infer_schema(pd.DataFrame({'code': ['A1', 'B2', 'C3']}), downcast=False)
+    chunk = pd.DataFrame({'code': [75001, 75002]})
+
+    assert fit_schema(chunk, schema) == (schema, [])
+    assert apply_schema(chunk, schema, categories=False)['code'].tolist() == ['75001', '75002']
+
+
+def test_floats_are_not_narrowed():
+    df = pd.DataFrame({'price': np.random.default_rng(0).integers(0, 1000, 100000) + 0.5,
+                       'count': np.arange(100000)})
+    schema = infer_schema(df)
+
+    assert schema['price']['dtype'] == 'float64'
+    assert apply_schema(df, schema)['price'].sum() == df['price'].sum()
+
+
+def test_streamed_upload_with_mixed_chunks(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'STREAMING_CHUNK_ROWS', 2)
+    rows = [
+        ('a', 1, 10), ('b', 2, 20),
+        # A blank and a decimal in the integer column, letters in the code column
+        ('a', '', 'X1'), ('b', 4.5, 40),
+        ('a', 5, 50), ('b', 6, 60),
+    ]
+    csv = 'group,value,code\n' + ''.join(f'{g},{v},{c}\n' for g, v, c in rows)
+    result = upload(client, csv, mode='stream')
+    dataset_id = result['dataset_id']
+
+    df = app_module.dataset_store.get(dataset_id)
+    assert df['value'].isna().sum() == 1
+    assert df['value'].sum() == 1 + 2 + 4.5 + 5 + 6
+    assert df['code'].astype(str).tolist() == ['10', '20', 'X1', '40', '50', '60']
+
+    # The code column is analyzed as text, the value column over all its rows
+    analysis = result['analysis']
+    assert 'code' not in analysis['statistics']
+    assert analysis['statistics']['value']['mean'] == (1 + 2 + 4.5 + 5 + 6) / 5
+
+    response = client.post('/api/prepare-visualization', json={
+        'dataset_id': dataset_id, 'type': 'bar',
+        'config': {'x_axis': 'group', 'y_axis': 'value', 'aggregation': 'mean'}
+    })
+    means = {row['category']: row['value'] for row in response.get_json()['data']['data']}
+    assert means == {'a': 3.0, 'b': 12.5 / 3}
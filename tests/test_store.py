@@ -0,0 +1,75 @@
+import pandas as pd
+
+from utils.cube import GroupCube
+from utils.persistence import DatasetPersistence
+from utils.query import AggregationPlan
+from utils.registry import DatasetRegistry
+from utils.store import DatasetStore
+
+
+class CountingRegistry(DatasetRegistry):
+    def __init__(self, path):
+        super().__init__(path)
+        self.lookups = 0
+
+    def exists(self, dataset_id):
+        self.lookups += 1
+        return super().exists(dataset_id)
+
+
+def stores(tmp_path, registry_ttl):
+    """Two stores sharing a folder and a registry, like two worker processes"""
+    registry = CountingRegistry(str(tmp_path / 'registry.sqlite'))
+    return [DatasetStore(DatasetPersistence(str(tmp_path)), registry=registry, registry_ttl=registry_ttl)
+            for _ in range(2)]
+
+
+def test_accessors_of_a_request_query_the_registry_once(tmp_path):
+    first, second = stores(tmp_path, registry_ttl=60)
+    dataset_id = first.put(pd.DataFrame({'a': ['x', 'y'], 'b': [1, 2]}), version='v1')
+
+    # Picked up from the registry by the other worker, then served from memory
+    assert dataset_id in second
+    lookups = second.registry.lookups
+    assert second.version(dataset_id) == 'v1'
+    assert second.columns(dataset_id) == ['a', 'b']
+    assert second.schema(dataset_id) is None
+    assert second.cube(dataset_id) is None
+    assert second.get(dataset_id)['b'].tolist() == [1, 2]
+    assert second.registry.lookups == lookups
+
+
+def test_removal_by_another_worker_is_seen_after_the_ttl(tmp_path):
+    first, second = stores(tmp_path, registry_ttl=0)
+    dataset_id = first.put(pd.DataFrame({'a': [1, 2]}), version='v1')
+    assert second.version(dataset_id) == 'v1'
+
+    first.remove(dataset_id)
+    assert dataset_id not in second
+    assert second.version(dataset_id) is None
+
+
+def test_missing_cube_is_not_looked_for_again(tmp_path, monkeypatch):
+    first, second = stores(tmp_path, registry_ttl=60)
+    df = pd.DataFrame({'a': ['x', 'y', 'x'], 'b': [1, 2, 3]})
+    dataset_id = first.put(df, version='v1')
+    reads = []
+    load_cube = DatasetPersistence.load_cube
+    monkeypatch.setattr(DatasetPersistence, 'load_cube',
+                        lambda self, dataset_id: reads.append(dataset_id) or load_cube(self, dataset_id))
+
+    assert first.cube(dataset_id) is None
+    assert first.cube(dataset_id) is None
+    assert second.cube(dataset_id) is None
+    assert len(reads) == 2
+
+    # Built here: served at once
+    first.put_cube(dataset_id, GroupCube.build(df, ['a'], ['b']))
+    assert first.cube(dataset_id).aggregate(AggregationPlan('a')).tolist() == [2, 1]
+    assert len(reads) == 2
+
+    # Built by another worker: looked for again once the registry is asked again
+    assert second.cube(dataset_id) is None
+    second.registry_ttl = 0
+    assert second.cube(dataset_id) is not None
+    assert len(reads) == 3
@@ -0,0 +1,83 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.analyse import DataAnalyzer
+from utils.streaming import HyperLogLog, QuantileSketch, StreamingAnalyzer, read_csv_streaming
+
+
+def csv_text(rows=5000, seed=0):
+    """Numeric columns far from zero and correlated, categories, missing values"""
+    rng = np.random.default_rng(seed)
+    base = rng.standard_normal(rows)
+    df = pd.DataFrame({
+        'offset': 1e8 + base,
+        'scaled': 3 * base + rng.standard_normal(rows),
+        'count': rng.integers(0, 100, size=rows),
+        'city': rng.choice(['Paris', 'Lyon', 'Nice', 'Lille'], size=rows, p=[0.5, 0.3, 0.15, 0.05]),
+        'code': [f'c{i}' for i in rng.integers(0, 300, size=rows)]
+    })
+    df.loc[rng.random(rows) < 0.05, 'scaled'] = np.nan
+    df.loc[rng.random(rows) < 0.05, 'city'] = None
+    return df.to_csv(index=False)
+
+
+def test_streamed_analysis_matches_the_exact_one():
+    text = csv_text()
+    streamed = read_csv_streaming(io.StringIO(text), chunksize=700)
+    df = pd.read_csv(io.StringIO(text))
+    exact = DataAnalyzer().analyze_dataset(df)
+
+    assert streamed['dataset_summary'] == exact['dataset_summary']
+    for col, stats in exact['statistics'].items():
+        for key in ('mean', 'min', 'max', 'std'):
+            assert streamed['statistics'][col][key] == pytest.approx(stats[key], rel=1e-9), (col, key)
+        # The median comes from a sketch: close in rank
+        values = np.sort(df[col].dropna().to_numpy())
+        median = streamed['statistics'][col]['median']
+        low = np.searchsorted(values, median, side='left')
+        high = np.searchsorted(values, median, side='right')
+        assert low / len(values) - 0.01 < 0.5 < high / len(values) + 0.01
+
+    assert len(streamed['correlations']) == len(exact['correlations'])
+    for got, expected in zip(streamed['correlations'], exact['correlations']):
+        assert {got['var1'], got['var2']} == {expected['var1'], expected['var2']}
+        assert got['correlation'] == pytest.approx(expected['correlation'], abs=1e-9)
+
+    assert streamed['categorical_info']['city']['value_counts'] == exact['categorical_info']['city']['value_counts']
+    assert streamed['categorical_info']['code']['unique_count'] == exact['categorical_info']['code']['unique_count']
+    # Ties may be listed in another order, the counts are the same
+    assert sorted(streamed['categorical_info']['code']['top_20_values'].values()) == \
+        sorted(exact['categorical_info']['code']['top_20_values'].values())
+
+
+def test_later_chunks_take_the_dtypes_of_the_first():
+    analyzer = StreamingAnalyzer()
+    chunks = list(pd.read_csv(io.StringIO('a,b\n1,x\n2,y\nn/a?,z\n4,x\n'), chunksize=2))
+    for chunk in chunks:
+        analyzer.update(chunk)
+    result = analyzer.result()
+
+    assert result['statistics']['a']['mean'] == pytest.approx(7 / 3)
+    assert result['dataset_summary']['missing_values'] == {'a': 1, 'b': 0}
+    assert result['categorical_info']['b']['value_counts'] == {'x': 2, 'y': 1, 'z': 1}
+
+
+def test_sketches_stay_within_their_error():
+    rng = np.random.default_rng(0)
+    values = rng.lognormal(size=200000)
+    sketch = QuantileSketch(k=1024)
+    for chunk in np.array_split(values, 50):
+        sketch.update(chunk)
+    ordered = np.sort(values)
+    for q in (0.01, 0.5, 0.99):
+        rank = np.searchsorted(ordered, sketch.quantile(q)) / len(values)
+        assert abs(rank - q) < 0.01
+
+    distinct = HyperLogLog()
+    for chunk in np.array_split(np.arange(100000), 10):
+        distinct.update(chunk.astype(str))
+        distinct.update(chunk[:100].astype(str))
+    assert distinct.count() == pytest.approx(100000, rel=0.03)
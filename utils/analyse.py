@@ -1,15 +1,38 @@
+import math
+import time
+
 import pandas as pd
 import numpy as np
+from utils.downsample import uniform_sample, stratified_sample, grid_thin, lttb, per_group_sample
+from utils.schema import columns_of_kind, looks_like_dates, parse_dates
+from utils.correlation import CorrelationEngine, top_correlations, Z_95
+from utils.query import PandasEngine, compile_plan
 
 class DataAnalyzer:
-    def analyze_dataset(self, df):
+    # Chart.js stays responsive up to a few thousand points per chart
+    SCATTER_MAX_POINTS = 5000
+    LINE_MAX_POINTS = 2000
+    BOX_MAX_SAMPLE = 500
+    LINE_BUCKETS = {'minute': 'min', 'hour': 'H', 'day': 'D', 'week': 'W', 'month': 'MS'}
+    # Rows timed first to size the sample of an approximate analysis
+    APPROX_PILOT_ROWS = 20000
+
+    def __init__(self, correlation_engine=None, query_engine=None):
+        self.correlation_engine = correlation_engine or CorrelationEngine()
+        # Runs the per-category aggregations of bar and pie charts
+        self.query_engine = query_engine or PandasEngine()
+
+    def analyze_dataset(self, df, schema=None, version=None, mode='exact', latency_target=2.0, strata=None):
+        """Statistics, top correlations and category counts of `df`.
+
+        mode='approximate' analyzes a row sample sized so the analysis takes
+        about `latency_target` seconds, and adds 95% confidence intervals.
+        """
+        if mode == 'approximate':
+            return self._analyze_sample(df, schema, latency_target, strata)
         
-        numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
-        categorical_cols = df.select_dtypes(include=['object', 'category', 'bool']).columns.tolist()
-        
-        for col in categorical_cols:
-            if df[col].dtype == 'bool':
-                df[col] = df[col].astype(str)
+        numeric_cols = columns_of_kind(df, schema, 'numeric')
+        categorical_cols = columns_of_kind(df, schema, 'categorical', 'boolean', 'text')
         
         analysis = {
             'statistics': {},
@@ -35,20 +58,12 @@ class DataAnalyzer:
             }
         
         if len(numeric_cols) > 1:
-            corr_matrix = df[numeric_cols].corr()
+            # Kept per version, the heatmap and correlation matrix charts reuse it
+            corr_matrix, sample = self.correlation_engine.matrix(df, numeric_cols, version=version)
             # Get top correlations
-            correlations_list = []
-            for i in range(len(numeric_cols)):
-                for j in range(i+1, len(numeric_cols)):
-                    corr_value = corr_matrix.iloc[i, j]
-                    if not np.isnan(corr_value):
-                        correlations_list.append({
-                            'var1': numeric_cols[i],
-                            'var2': numeric_cols[j],
-                            'correlation': float(corr_value)
-                        })
-            correlations_list.sort(key=lambda x: abs(x['correlation']), reverse=True)
-            analysis['correlations'] = correlations_list[:10] 
+            analysis['correlations'] = top_correlations(corr_matrix.to_numpy(), numeric_cols, k=10)
+            if sample:
+                analysis['correlation_sample'] = sample
         
         for col in categorical_cols:
             unique_vals = df[col].dropna().unique()
@@ -70,279 +85,510 @@ class DataAnalyzer:
         
         return analysis
     
-    def prepare_visualization_data(self, df, viz_type, config):
-        
+    def _analyze_sample(self, df, schema, latency_target, strata=None):
+        """Approximate analysis: the exact analysis of a sample, with confidence intervals"""
+        total = len(df)
+        if total <= self.APPROX_PILOT_ROWS:
+            return self.analyze_dataset(df, schema)
+
+        # Time a small pilot sample and extrapolate linearly to the latency target
+        started = time.perf_counter()
+        self.analyze_dataset(df.iloc[uniform_sample(total, self.APPROX_PILOT_ROWS)], schema)
+        elapsed = max(time.perf_counter() - started, 1e-3)
+        size = int(self.APPROX_PILOT_ROWS * latency_target / elapsed)
+        if size >= total:
+            return self.analyze_dataset(df, schema)
+        size = max(size, self.APPROX_PILOT_ROWS)
+
+        stratified = strata is not None and strata in df.columns
+        if stratified:
+            # Proportional allocation: every stratum keeps its share of the sample
+            codes, _ = pd.factorize(df[strata], use_na_sentinel=False)
+            rows = stratified_sample(codes, size, seed=1)
+        else:
+            # Uniform without replacement, what a reservoir over the rows would keep
+            rows = uniform_sample(total, size, seed=1)
+        sample = df.iloc[rows]
+        analysis = self.analyze_dataset(sample, schema)
+        m = len(sample)
+
+        # Row count and missing values are cheap enough to stay exact
+        analysis['dataset_summary']['total_rows'] = total
+        analysis['dataset_summary']['missing_values'] = df.isnull().sum().to_dict()
+
+        for col, stats in analysis['statistics'].items():
+            values = pd.to_numeric(sample[col], errors='coerce').to_numpy(dtype=float)
+            values = values[~np.isnan(values)]
+            stats.update(self._numeric_intervals(values, total))
+
+        for corr in analysis['correlations']:
+            pairs = int((sample[corr['var1']].notna() & sample[corr['var2']].notna()).sum())
+            corr['ci'] = self._correlation_interval(corr['correlation'], pairs)
+
+        scale = total / m
+        for col, info in analysis['categorical_info'].items():
+            counts = info.get('value_counts') or info.get('top_20_values')
+            if stratified:
+                # Small strata keep at least one row, so rows do not all weigh the same
+                shares = self._stratified_shares(sample[col], codes[rows], np.bincount(codes), total)
+                shares = shares.head(len(counts))
+                counts.clear()
+                counts.update({str(value): int(round(share * total)) for value, share in shares['share'].items()})
+                info['shares'] = {
+                    str(value): {'share': float(row.share), 'ci': [float(row.low), float(row.high)]}
+                    for value, row in shares.iterrows()
+                }
+                continue
+            info['shares'] = {
+                value: {'share': count / m, 'ci': self._share_interval(count, m)}
+                for value, count in counts.items()
+            }
+            # Counts extrapolated to the whole dataset
+            for value in counts:
+                counts[value] = int(round(counts[value] * scale))
+
+        analysis['approximate'] = {
+            'sample_rows': m,
+            'total_rows': total,
+            'sampling': 'stratified' if stratified else 'uniform',
+            'confidence': 0.95,
+            'note': 'Distinct counts, min and max are those seen in the sample'
+        }
+        return analysis
+
+    @staticmethod
+    def _numeric_intervals(values, total):
+        """95% intervals for the mean (normal), median (order statistics) and std (asymptotic)"""
+        m = len(values)
+        if m < 2:
+            return {}
+        mean = values.mean()
+        std = values.std(ddof=1)
+        # Finite population correction: a sample close to the dataset size is close to exact
+        fpc = math.sqrt(max(total - m, 0) / max(total - 1, 1))
+        half = Z_95 * std / math.sqrt(m) * fpc
+
+        # Distribution-free: ranks around m/2 that bracket the median with 95% probability
+        spread = Z_95 * math.sqrt(m) / 2
+        low_rank = max(int(math.floor(m / 2 - spread)), 0)
+        high_rank = min(int(math.ceil(m / 2 + spread)), m - 1)
+        ordered = np.partition(values, (low_rank, high_rank))
+
+        # Var(s^2) ~ (m4 - s^4) / m, which does not assume normal data
+        variance = std ** 2
+        m4 = ((values - mean) ** 4).mean()
+        var_half = Z_95 * math.sqrt(max(m4 - variance ** 2, 0.0) / m) * fpc
+        return {
+            'mean_ci': [float(mean - half), float(mean + half)],
+            'median_ci': [float(ordered[low_rank]), float(ordered[high_rank])],
+            'std_ci': [float(math.sqrt(max(variance - var_half, 0.0))), float(math.sqrt(variance + var_half))]
+        }
+
+    @staticmethod
+    def _correlation_interval(r, pairs):
+        """Fisher z interval for a correlation estimated from `pairs` rows"""
+        if pairs <= 3 or abs(r) >= 1:
+            return [float(r), float(r)]
+        z = math.atanh(r)
+        half = Z_95 / math.sqrt(pairs - 3)
+        return [math.tanh(z - half), math.tanh(z + half)]
+
+    @staticmethod
+    def _stratified_shares(values, strata, sizes, total):
+        """Shares of every value of a stratified sample, largest first, with 95% intervals.
+
+        A row of stratum h stands for N_h / n_h rows; the interval is the normal
+        one on the stratified variance sum (N_h/N)^2 (1 - n_h/N_h) p_h (1 - p_h) / (n_h - 1).
+        """
+        sampled = np.bincount(strata, minlength=len(sizes))
+        table = pd.crosstab(values.to_numpy(), strata)
+        present = table.columns.to_numpy()
+        n_h, N_h = sampled[present], sizes[present]
+        p_h = table.to_numpy() / n_h
+        weight = N_h / total
+        share = p_h @ weight
+        variance = (p_h * (1 - p_h)) @ (weight ** 2 * (1 - n_h / N_h) / np.maximum(n_h - 1, 1))
+        half = Z_95 * np.sqrt(variance)
+        shares = pd.DataFrame({'share': share, 'low': np.maximum(share - half, 0.0),
+                               'high': np.minimum(share + half, 1.0)}, index=table.index)
+        return shares.sort_values('share', ascending=False, kind='stable')
+
+    @staticmethod
+    def _share_interval(count, m):
+        """Wilson score interval for a proportion count / m"""
+        p = count / m
+        z2 = Z_95 ** 2
+        centre = (p + z2 / (2 * m)) / (1 + z2 / m)
+        half = Z_95 * math.sqrt(p * (1 - p) / m + z2 / (4 * m * m)) / (1 + z2 / m)
+        return [max(centre - half, 0.0), min(centre + half, 1.0)]
+
+    def required_columns(self, viz_type, config, available):
+        """Columns a chart needs, or None when it may need any column (e.g. auto-selection)"""
+        if viz_type in ('heatmap', 'correlationMatrix'):
+            columns = config.get('columns') if viz_type == 'heatmap' else None
+            if not columns or any(c not in available for c in columns):
+                return None
+            return list(dict.fromkeys(columns))
+
+        keys = {
+            'scatter': ['x_axis', 'y_axis'],
+            'line': ['x_axis', 'y_axis'],
+            'bar': ['x_axis'],
+            'horizontalBar': ['x_axis'],
+            'pie': ['category'],
+            'box': ['category', 'value'],
+            'violin': ['category', 'value']
+        }.get(viz_type)
+        if keys is None:
+            return None
+        columns = [config.get(key) for key in keys]
+        if any(c not in available for c in columns):
+            # Missing columns trigger a fallback on the first numeric column
+            return None
+        for key in ('y_axis', 'value', 'color_by'):
+            column = config.get(key)
+            if column and column not in available and key != 'color_by':
+                return None
+            if column in available:
+                columns.append(column)
+        return list(dict.fromkeys(columns))
+
+    def prepare_visualization_data(self, df, viz_type, config, schema=None, shared=None, version=None,
+                                   arrays=False, source=None, cube=None):
+        """Chart-ready data; with `arrays`, scatter and line series stay numpy arrays for binary encoding.
+
+        `source` is the stored file of `df`, which query engines reading
+        files aggregate instead of the frame. Bar and pie charts covered by
+        the dataset's group-by `cube` are answered from it.
+        """
         if viz_type == 'scatter':
-            return self._prepare_scatter(df, config)
+            return self._prepare_scatter(df, config, schema, shared, arrays)
         elif viz_type == 'bar':
-            return self._prepare_bar(df, config)
+            return self._prepare_bar(df, config, schema, shared, source, cube)
         elif viz_type == 'horizontalBar':
-            return self._prepare_horizontal_bar(df, config)
+            return self._prepare_horizontal_bar(df, config, schema, shared, source, cube)
         elif viz_type == 'pie':
-            return self._prepare_pie(df, config)
+            return self._prepare_pie(df, config, schema, shared, source, cube)
         elif viz_type == 'box':
-            return self._prepare_box(df, config)
+            return self._prepare_box(df, config, schema, shared)
         elif viz_type == 'correlationMatrix':
-            return self._prepare_correlation_matrix(df, config)
+            return self._prepare_correlation_matrix(df, config, schema, shared, version)
         elif viz_type == 'heatmap':
-            return self._prepare_heatmap(df, config)
+            return self._prepare_heatmap(df, config, schema, shared, version)
         elif viz_type == 'violin':
-            return self._prepare_violin(df, config)
+            return self._prepare_violin(df, config, schema, shared)
         elif viz_type == 'line':
-            return self._prepare_line(df, config)
+            return self._prepare_line(df, config, schema, shared, arrays)
         else:
             return {'error': f'Unknown visualization type: {viz_type}'}
-    
-    def _prepare_scatter(self, df, config):
+
+    def _shared(self, shared, key, compute):
+        """Compute `key` once per batch when several charts are prepared from the same frame"""
+        if shared is None:
+            return compute()
+        return shared.get(key, compute)
+
+    def _numeric_columns(self, df, schema, shared):
+        return self._shared(shared, ('numeric_columns',), lambda: columns_of_kind(df, schema, 'numeric'))
+
+    def _numeric_values(self, df, column, shared):
+        return self._shared(shared, ('values', column),
+                            lambda: pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=float))
+
+    def _aggregate(self, df, plan, shared, source, cube):
+        """`plan`'s per-category aggregation, from the cube when it has it"""
+        if cube is not None:
+            grouped = cube.aggregate(plan)
+            if grouped is not None:
+                return grouped
+        return self.query_engine.aggregate(df, plan, shared, source)
+
+    def _correlations(self, df, columns, shared, version):
+        """Correlation matrix over `columns`, sliced from the one of this dataset version when known"""
+        return self._shared(shared, ('corr', tuple(columns)),
+                            lambda: self.correlation_engine.matrix(df, columns, version=version))
+
+    def _prepare_scatter(self, df, config, schema=None, shared=None, arrays=False):
+        """Prepare columnar, downsampled scatter data"""
         x_axis = config.get('x_axis')
         y_axis = config.get('y_axis')
         color_by = config.get('color_by')
-        
-        data = []
-        for _, row in df.iterrows():
-            point = {
-                'x': float(row[x_axis]) if pd.notna(row[x_axis]) else None,
-                'y': float(row[y_axis]) if pd.notna(row[y_axis]) else None
+        max_points = int(config.get('max_points', self.SCATTER_MAX_POINTS))
+        sampling = config.get('sampling', 'uniform')
+
+        # Fall back to the first numeric columns when the LLM did not pick any
+        if x_axis not in df.columns or y_axis not in df.columns:
+            numeric_cols = self._numeric_columns(df, schema, shared)
+            if x_axis not in df.columns:
+                x_axis = next((c for c in numeric_cols if c != y_axis), None)
+            if y_axis not in df.columns:
+                y_axis = next((c for c in numeric_cols if c != x_axis), None)
+            if x_axis is None or y_axis is None:
+                return {'error': 'Need two numeric columns for scatter plot'}
+        if color_by not in df.columns:
+            color_by = None
+
+        try:
+            x = self._numeric_values(df, x_axis, shared)
+            y = self._numeric_values(df, y_axis, shared)
+            valid = ~(np.isnan(x) | np.isnan(y))
+            x = x[valid]
+            y = y[valid]
+
+            codes = None
+            categories = None
+            if color_by:
+                codes, uniques = self._shared(shared, ('factorize', color_by, False),
+                                              lambda: pd.factorize(df[color_by], use_na_sentinel=False))
+                codes = codes[valid]
+                categories = [str(c) for c in uniques]
+
+            total = len(x)
+            if total > max_points:
+                if sampling == 'stratified' and codes is not None:
+                    keep = stratified_sample(codes, max_points)
+                elif sampling == 'grid':
+                    keep = grid_thin(x, y, max_points, codes)
+                else:
+                    sampling = 'uniform'
+                    keep = uniform_sample(total, max_points)
+                x = x[keep]
+                y = y[keep]
+                if codes is not None:
+                    codes = codes[keep]
+            else:
+                sampling = None
+
+            if codes is not None:
+                # Only the categories that kept a point, codes renumbered into them
+                kept, codes = np.unique(codes, return_inverse=True)
+                categories = [categories[code] for code in kept]
+
+            if arrays:
+                data = {'x': x, 'y': y, 'category': codes}
+            else:
+                data = {
+                    'x': x.tolist(),
+                    'y': y.tolist(),
+                    'category': codes.tolist() if codes is not None else None
+                }
+
+            return {
+                'data': data,
+                'categories': categories,
+                'x_label': x_axis,
+                'y_label': y_axis,
+                'color_label': color_by,
+                'total_points': total,
+                'returned_points': len(x),
+                'dropped_points': total - len(x),
+                'missing_points': int((~valid).sum()),
+                'sampling': sampling
             }
-            if color_by and color_by in df.columns:
-                point['category'] = str(row[color_by])
-            data.append(point)
-        
-        return {
-            'data': data,
-            'x_label': x_axis,
-            'y_label': y_axis,
-            'color_label': color_by
-        }
+        except Exception as e:
+            return {'error': f'Error preparing scatter plot: {str(e)}'}
     
-    def _prepare_bar(self, df, config):
+    def _prepare_bar(self, df, config, schema=None, shared=None, source=None, cube=None):
         """Prepare bar chart data with best practices"""
-        x_axis = config.get('x_axis')
-        y_axis = config.get('y_axis')
-        aggregation = config.get('aggregation', 'count')
-        sort_by = config.get('sort_by', 'value')  
-        limit = config.get('limit', None)  
-        order = config.get('order', 'desc') 
-        max_categories = config.get('max_categories', 15)  
-        
-        # Use limit if specified, otherwise use max_categories
-        if limit:
-            max_categories = limit
-        
-        # Validation x_axis
-        if not x_axis or x_axis not in df.columns:
-            return {'error': f'Column {x_axis} not found in dataset'}
-        
-        # If no y_axis specified
-        if not y_axis or y_axis not in df.columns:
-            if aggregation == 'count' or not y_axis:
-                # Count 
-                try:
-                    df_clean = df[x_axis].dropna()
-                    if len(df_clean) == 0:
-                        return {'error': 'No valid data after removing NaN values'}
-                    
-                    grouped = df_clean.value_counts()
-                    
-                    # Apply limit
-                    if len(grouped) > max_categories:
-                        if order == 'asc':
-                            grouped = grouped.nsmallest(max_categories)
-                        else:
-                            grouped = grouped.nlargest(max_categories)
-                    
-                    data = [
-                        {'category': str(cat), 'value': int(val)}
-                        for cat, val in grouped.items()
-                    ]
-                    
-                    # Sort data
-                    if sort_by == 'value':
-                        reverse = (order == 'desc')
-                        data = sorted(data, key=lambda x: x['value'], reverse=reverse)
-                    elif sort_by == 'category':
-                        data = sorted(data, key=lambda x: x['category'])
-                    
-                    return {
-                        'data': data,
-                        'x_label': x_axis,
-                        'y_label': 'Count',
-                        'limited': len(grouped) == max_categories,
-                        'limit_applied': limit if limit else max_categories if len(grouped) > max_categories else None
-                    }
-                except Exception as e:
-                    return {'error': f'Error preparing bar chart: {str(e)}'}
-            else:
-                # Need numeric column for aggregation
-                numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
-                if numeric_cols:
-                    y_axis = numeric_cols[0]
-                else:
-                    return {'error': 'No numeric column found for aggregation'}
+        plan, error = compile_plan('bar', config, df.columns,
+                                   self._numeric_columns(df, schema, shared) if config.get('y_axis') else [])
+        if error:
+            return {'error': error}
         
         try:
-            # Drop NaN values 
-            df_clean = df[[x_axis, y_axis]].dropna()
-            
-            if len(df_clean) == 0:
+            # Drop NaN values, then aggregate
+            grouped = self._aggregate(df, plan, shared, source, cube)
+            if len(grouped) == 0 or (plan.value is None and grouped.sum() == 0):
                 return {'error': 'No valid data after removing NaN values'}
             
-            # Aggregate
-            if aggregation == 'mean':
-                grouped = df_clean.groupby(x_axis)[y_axis].mean()
-            elif aggregation == 'sum':
-                grouped = df_clean.groupby(x_axis)[y_axis].sum()
-            elif aggregation == 'count':
-                grouped = df_clean.groupby(x_axis)[y_axis].count()
-            elif aggregation == 'min':
-                grouped = df_clean.groupby(x_axis)[y_axis].min()
-            elif aggregation == 'max':
-                grouped = df_clean.groupby(x_axis)[y_axis].max()
-            else:
-                grouped = df_clean.groupby(x_axis)[y_axis].mean()
-            
-            # Apply limit 
-            if len(grouped) > max_categories:
-                if order == 'asc':
-                    # For "worst", "bottom", "lowest"
-                    grouped = grouped.nsmallest(max_categories)
-                else:
-                    # For "top", "best", "highest" (default)
-                    grouped = grouped.nlargest(max_categories)
-            
-            data = [
-                {'category': str(cat), 'value': float(val)}
-                for cat, val in grouped.items()
-            ]
-            
-            # Sort
-            if sort_by == 'value':
-                reverse = (order == 'desc')
-                data = sorted(data, key=lambda x: x['value'], reverse=reverse)
-            elif sort_by == 'category':
-                data = sorted(data, key=lambda x: x['category'])
+            # Apply limit, then sort
+            kept = plan.select(grouped)
+            cast = int if plan.value is None else float
+            data = [{'category': cat, 'value': val} for cat, val in plan.rows(kept, cast)]
             
+            limit = config.get('limit', None)
             return {
                 'data': data,
-                'x_label': x_axis,
-                'y_label': f'{aggregation.capitalize()} of {y_axis}',
-                'limited': len(grouped) == max_categories,
-                'limit_applied': limit if limit else max_categories if len(grouped) > max_categories else None
+                'x_label': plan.key,
+                'y_label': 'Count' if plan.value is None else
+                           f"{config.get('aggregation', 'count').capitalize()} of {plan.value}",
+                'limited': len(kept) == plan.limit,
+                'limit_applied': limit if limit else plan.limit if len(kept) > plan.limit else None
             }
         except Exception as e:
             return {'error': f'Error preparing bar chart: {str(e)}'}
     
-    def _prepare_horizontal_bar(self, df, config):
-        result = self._prepare_bar(df, config)
+    def _prepare_horizontal_bar(self, df, config, schema=None, shared=None, source=None, cube=None):
+        result = self._prepare_bar(df, config, schema, shared, source, cube)
         if 'error' not in result:
             result['horizontal'] = True
         return result
     
-    def _prepare_pie(self, df, config):
-        category = config.get('category')
-        value = config.get('value', None)
-        aggregation = config.get('aggregation', 'count')
-        limit = config.get('limit', 10)  
-        sort_by = config.get('sort_by', 'value')
-        order = config.get('order', 'desc')
-        
-        # Validation
-        if not category or category not in df.columns:
-            return {'error': f'Column {category} not found in dataset'}
+    def _prepare_pie(self, df, config, schema=None, shared=None, source=None, cube=None):
+        plan, error = compile_plan('pie', config, df.columns, None)
+        if error:
+            return {'error': error}
         
         try:
-            if not value or aggregation == 'count':
-                # Count 
-                grouped = df[category].value_counts()
-            elif value in df.columns:
-                # Aggregation
-                df_clean = df[[category, value]].dropna()
-                
-                if len(df_clean) == 0:
-                    return {'error': 'No valid data after removing NaN values'}
-                
-                if aggregation == 'sum':
-                    grouped = df_clean.groupby(category)[value].sum()
-                elif aggregation == 'mean':
-                    grouped = df_clean.groupby(category)[value].mean()
-                else:
-                    grouped = df_clean.groupby(category)[value].sum()
-            else:
-                return {'error': f'Column {value} not found in dataset'}
-            
-            # Apply limit 
-            if len(grouped) > limit:
-                if order == 'asc':
-                    grouped = grouped.nsmallest(limit)
-                else:
-                    grouped = grouped.nlargest(limit)
-            
-            data = [
-                {'label': str(cat), 'value': float(val)}
-                for cat, val in grouped.items()
-            ]
+            grouped = self._aggregate(df, plan, shared, source, cube)
+            if plan.value is not None and len(grouped) == 0:
+                return {'error': 'No valid data after removing NaN values'}
             
-            # Sort if needed
-            if sort_by == 'value':
-                reverse = (order == 'desc')
-                data = sorted(data, key=lambda x: x['value'], reverse=reverse)
-            elif sort_by == 'category':
-                data = sorted(data, key=lambda x: x['label'])
+            # Apply limit, then sort
+            kept = plan.select(grouped)
+            data = [{'label': cat, 'value': val} for cat, val in plan.rows(kept)]
             
             return {
                 'data': data,
-                'category_label': category,
-                'value_label': value if value else 'Count',
-                'limit_applied': limit if len(grouped) == limit else None
+                'category_label': plan.key,
+                'value_label': config.get('value') or 'Count',
+                'limit_applied': plan.limit if len(kept) == plan.limit else None
             }
         except Exception as e:
             return {'error': f'Error preparing pie chart: {str(e)}'}
     
-    def _prepare_box(self, df, config):
+    def _prepare_box(self, df, config, schema=None, shared=None, kde=False):
+        """Prepare box plot statistics per category in a single grouped pass"""
         category = config.get('category')
         value = config.get('value')
+        max_categories = int(config.get('max_categories', 15))
+        sample_size = int(config.get('sample_size', 0))
+        kde_bins = int(config.get('kde_bins', 32))
         
         if not category or category not in df.columns:
             return {'error': f'Column {category} not found'}
         
         if not value or value not in df.columns:
-            numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
+            numeric_cols = self._numeric_columns(df, schema, shared)
             if numeric_cols:
                 value = numeric_cols[0]
             else:
                 return {'error': 'No numeric column found'}
         
         try:
-            data = []
-            for cat in df[category].unique():
-                if pd.isna(cat):
-                    continue
-                    
-                values = df[df[category] == cat][value].dropna().tolist()
-                if values:
-                    data.append({
-                        'category': str(cat),
-                        'values': values,
-                        'min': float(np.min(values)),
-                        'q1': float(np.percentile(values, 25)),
-                        'median': float(np.median(values)),
-                        'q3': float(np.percentile(values, 75)),
-                        'max': float(np.max(values))
-                    })
-            
-            if not data:
+            groups = self._shared(shared, ('sorted_groups', category, value, max_categories),
+                                  lambda: self._sorted_groups(df, category, value, max_categories, shared))
+            if groups is None:
                 return {'error': 'No valid data for box plot'}
-            
-            return {
+            values, codes, labels, sizes, starts, folded = groups
+
+            def quantile(q):
+                position = starts + q * (sizes - 1)
+                low = np.floor(position).astype(np.int64)
+                high = np.ceil(position).astype(np.int64)
+                return values[low] + (values[high] - values[low]) * (position - low)
+
+            q1 = quantile(0.25)
+            median = quantile(0.5)
+            q3 = quantile(0.75)
+            iqr = q3 - q1
+            lower_fence = q1 - 1.5 * iqr
+            upper_fence = q3 + 1.5 * iqr
+
+            inside = (values >= lower_fence[codes]) & (values <= upper_fence[codes])
+            lower_whisker = np.minimum.reduceat(np.where(inside, values, np.inf), starts)
+            upper_whisker = np.maximum.reduceat(np.where(inside, values, -np.inf), starts)
+            outliers = np.bincount(codes[~inside], minlength=len(labels))
+
+            data = []
+            for i, label in enumerate(labels):
+                data.append({
+                    'category': label,
+                    'count': int(sizes[i]),
+                    'min': float(values[starts[i]]),
+                    'q1': float(q1[i]),
+                    'median': float(median[i]),
+                    'q3': float(q3[i]),
+                    'max': float(values[starts[i] + sizes[i] - 1]),
+                    'lower_whisker': float(lower_whisker[i]),
+                    'upper_whisker': float(upper_whisker[i]),
+                    'outlier_count': int(outliers[i])
+                })
+
+            if sample_size > 0:
+                sampled = per_group_sample(codes, min(sample_size, self.BOX_MAX_SAMPLE))
+                for i, item in enumerate(data):
+                    item['values'] = values[sampled[codes[sampled] == i]].tolist()
+
+            result = {
                 'data': data,
                 'x_label': category,
-                'y_label': value
+                'y_label': value,
+                'folded_categories': folded
             }
+
+            if kde:
+                result['density'] = self._binned_kde(values, codes, sizes, kde_bins)
+
+            return result
         except Exception as e:
             return {'error': f'Error preparing box plot: {str(e)}'}
+
+    def _sorted_groups(self, df, category, value, max_categories, shared=None):
+        """Values of `value` sorted by (category, value), with at most `max_categories` groups"""
+        values = self._numeric_values(df, value, shared)
+        codes, uniques = self._shared(shared, ('factorize', category, True), lambda: pd.factorize(df[category]))
+        valid = (codes >= 0) & ~np.isnan(values)
+        values = values[valid]
+        codes = codes[valid]
+        if len(values) == 0:
+            return None
+
+        labels = [str(c) for c in uniques]
+        counts = np.bincount(codes, minlength=len(labels))
+        present = np.flatnonzero(counts)
+
+        # Keep the most populated categories, fold the rest into "Other"
+        folded = 0
+        if len(present) > max_categories:
+            kept = present[np.argsort(-counts[present], kind='stable')[:max_categories]]
+            kept.sort()
+            folded = len(present) - len(kept)
+            remap = np.full(len(labels), len(kept), dtype=np.int64)
+            remap[kept] = np.arange(len(kept))
+            codes = remap[codes]
+            labels = [labels[i] for i in kept] + ['Other']
+        else:
+            remap = np.full(len(labels), -1, dtype=np.int64)
+            remap[present] = np.arange(len(present))
+            codes = remap[codes]
+            labels = [labels[i] for i in present]
+
+        # One sort by (category, value) gives every group as a contiguous sorted run
+        order = np.lexsort((values, codes))
+        values = values[order]
+        codes = codes[order]
+        sizes = np.bincount(codes, minlength=len(labels))
+        starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+        return values, codes, labels, sizes, starts, folded
+
+    def _binned_kde(self, values, codes, sizes, bins):
+        """Gaussian KDE per category evaluated on a shared fixed grid of `bins` points"""
+        low, high = float(values.min()), float(values.max())
+        if high == low:
+            high = low + 1.0
+        width = (high - low) / bins
+        grid = low + width * (np.arange(bins) + 0.5)
+
+        cells = np.minimum(((values - low) / width).astype(np.int64), bins - 1)
+        histogram = np.bincount(codes * bins + cells, minlength=len(sizes) * bins)
+        histogram = histogram.reshape(len(sizes), bins).astype(float)
+
+        stds = pd.Series(values).groupby(codes).std(ddof=1).reindex(range(len(sizes))).fillna(0).to_numpy()
+        offsets = np.arange(-bins + 1, bins)
+        densities = []
+        for i in range(len(sizes)):
+            # Scott's rule bandwidth, expressed in bins (at least one bin)
+            bandwidth = max(1.06 * stds[i] * sizes[i] ** (-0.2) / width, 1.0)
+            kernel = np.exp(-0.5 * (offsets / bandwidth) ** 2)
+            smoothed = np.convolve(histogram[i], kernel)[bins - 1:2 * bins - 1]
+            total = smoothed.sum() * width
+            densities.append((smoothed / total).tolist() if total > 0 else smoothed.tolist())
+
+        return {'grid': grid.tolist(), 'values': densities}
     
-    def _prepare_heatmap(self, df, config):
-        numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
+    def _prepare_heatmap(self, df, config, schema=None, shared=None, version=None):
+        numeric_cols = self._numeric_columns(df, schema, shared)
         
         if 'columns' in config and config['columns']:
             cols_to_use = [c for c in config['columns'] if c in numeric_cols]
@@ -352,7 +598,7 @@ class DataAnalyzer:
         if len(cols_to_use) < 2:
             return {'error': 'Need at least 2 numeric columns for heatmap'}
         
-        corr_matrix = df[cols_to_use].corr()
+        corr_matrix, sample = self._correlations(df, cols_to_use, shared, version)
         
         data = []
         for i, row_name in enumerate(corr_matrix.index):
@@ -367,18 +613,19 @@ class DataAnalyzer:
             'data': data,
             'variables': cols_to_use,
             'x_label': 'Variables',
-            'y_label': 'Variables'
+            'y_label': 'Variables',
+            'sample': sample
         }
     
-    def _prepare_correlation_matrix(self, df, config):
-        numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
+    def _prepare_correlation_matrix(self, df, config, schema=None, shared=None, version=None):
+        numeric_cols = self._numeric_columns(df, schema, shared)
         
         if len(numeric_cols) < 2:
             return {'error': 'Need at least 2 numeric columns for correlation matrix'}
         
         cols_to_use = numeric_cols[:12]
         
-        corr_matrix = df[cols_to_use].corr()
+        corr_matrix, sample = self._correlations(df, cols_to_use, shared, version)
         
         data = []
         for i, row_name in enumerate(corr_matrix.index):
@@ -398,28 +645,104 @@ class DataAnalyzer:
             'variables': cols_to_use,
             'x_labels': cols_to_use,
             'y_labels': cols_to_use,
-            'type': 'correlationMatrix'
+            'type': 'correlationMatrix',
+            'sample': sample
         }
     
-    def _prepare_line(self, df, config):
+    def _prepare_line(self, df, config, schema=None, shared=None, arrays=False):
+        """Prepare line chart data, bucketed and/or LTTB-downsampled to a point budget"""
         x_axis = config.get('x_axis')
         y_axis = config.get('y_axis')
-        
-        df_sorted = df.sort_values(by=x_axis)
-        
-        data = []
-        for _, row in df_sorted.iterrows():
-            if pd.notna(row[x_axis]) and pd.notna(row[y_axis]):
-                data.append({
-                    'x': str(row[x_axis]),
-                    'y': float(row[y_axis])
-                })
-        
-        return {
-            'data': data,
-            'x_label': x_axis,
-            'y_label': y_axis
-        }
+        max_points = int(config.get('max_points', self.LINE_MAX_POINTS))
+        bucket = config.get('bucket')
+        bucket_agg = config.get('bucket_agg', 'mean')
+
+        if not x_axis or x_axis not in df.columns:
+            return {'error': f'Column {x_axis} not found in dataset'}
+        if not y_axis or y_axis not in df.columns:
+            return {'error': f'Column {y_axis} not found in dataset'}
+
+        try:
+            x_values, x_type = self._line_axis(df[x_axis], (schema or {}).get(x_axis))
+            y_values = pd.to_numeric(df[y_axis], errors='coerce')
+            series = pd.Series(y_values.to_numpy(dtype=float), index=x_values)
+            series = series[series.notna() & series.index.notna()]
+            total = len(series)
+            if total == 0:
+                return {'error': 'No valid data after removing NaN values'}
+
+            if bucket and x_type == 'datetime':
+                if bucket not in self.LINE_BUCKETS:
+                    return {'error': f'Unknown bucket: {bucket}'}
+                if bucket_agg not in ('mean', 'min', 'max', 'sum', 'count'):
+                    bucket_agg = 'mean'
+                series = series.resample(self.LINE_BUCKETS[bucket]).agg(bucket_agg).dropna()
+            else:
+                bucket = None
+                series = series.sort_index(kind='stable')
+
+            if x_type == 'category':
+                # Non-numeric x: LTTB runs over the sorted positions
+                positions = np.arange(len(series))
+            elif x_type == 'datetime':
+                positions = series.index.asi8
+            else:
+                positions = series.index.to_numpy(dtype=float)
+
+            downsampled = len(series) > max_points
+            if downsampled:
+                series = series.iloc[lttb(positions, series.to_numpy(), max_points)]
+
+            if arrays:
+                # Datetimes as milliseconds of their wall-clock time, like the strings below
+                if x_type == 'datetime':
+                    index = series.index.tz_localize(None) if series.index.tz is not None else series.index
+                    x_out = index.asi8 // 1_000_000
+                elif x_type == 'category':
+                    x_out = series.index.astype(str).to_numpy()
+                else:
+                    x_out = series.index.to_numpy(dtype=float)
+                y_out = series.to_numpy()
+            else:
+                if x_type == 'datetime':
+                    x_out = series.index.strftime('%Y-%m-%d %H:%M:%S').tolist()
+                elif x_type == 'category':
+                    x_out = [str(v) for v in series.index]
+                else:
+                    x_out = series.index.tolist()
+                y_out = series.tolist()
+
+            return {
+                'data': {
+                    'x': x_out,
+                    'y': y_out
+                },
+                'x_label': x_axis,
+                'y_label': f'{bucket_agg.capitalize()} of {y_axis}' if bucket else y_axis,
+                'x_type': x_type,
+                'bucket': bucket,
+                'total_points': total,
+                'returned_points': len(series),
+                'downsampling': 'lttb' if downsampled else None
+            }
+        except Exception as e:
+            return {'error': f'Error preparing line chart: {str(e)}'}
+
+    def _line_axis(self, column, spec=None):
+        """Return the x values of a line chart and their kind: datetime, numeric or category"""
+        if pd.api.types.is_datetime64_any_dtype(column):
+            return pd.DatetimeIndex(column), 'datetime'
+        if pd.api.types.is_numeric_dtype(column) and not pd.api.types.is_bool_dtype(column):
+            return pd.Index(column), 'numeric'
+
+        # The ingestion schema already knows; otherwise look at a small sample
+        if spec is not None:
+            is_date = spec['kind'] == 'datetime'
+        else:
+            is_date = looks_like_dates(column.dropna())
+        if is_date:
+            return pd.DatetimeIndex(parse_dates(column)), 'datetime'
+        return pd.Index(column.astype(str).where(column.notna())), 'category'
     
-    def _prepare_violin(self, df, config):
-        return self._prepare_box(df, config)
\ No newline at end of file
+    def _prepare_violin(self, df, config, schema=None, shared=None):
+        return self._prepare_box(df, config, schema, shared, kde=True)
\ No newline at end of file
@@ -0,0 +1,165 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+
+class AnalysisCache:
+    """Keeps `analyze_dataset` results per dataset version.
+
+    The version is a content fingerprint of the DataFrame, so re-uploading the
+    same file reuses the analysis while any change to the data gets a new one.
+    """
+
+    def __init__(self, max_entries=8):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def fingerprint(df):
+        """Content hash of a DataFrame: columns, dtypes and every value"""
+        fingerprint = DatasetFingerprint()
+        fingerprint.update(df)
+        return fingerprint.hexdigest()
+
+    def get(self, version):
+        with self._lock:
+            if version in self._entries:
+                self._entries.move_to_end(version)
+                self.hits += 1
+                return self._entries[version]
+            self.misses += 1
+            return None
+
+    def put(self, version, analysis):
+        with self._lock:
+            self._entries[version] = analysis
+            self._entries.move_to_end(version)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, version, compute):
+        """Return the cached analysis for `version`, computing and storing it on a miss"""
+        analysis = self.get(version)
+        if analysis is None:
+            analysis = compute()
+            self.put(version, analysis)
+        return analysis
+
+    def invalidate(self, version=None):
+        """Drop one dataset version, or everything when no version is given"""
+        with self._lock:
+            if version is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(version, None)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else None,
+                'entries': len(self._entries)
+            }
+
+
+class ResultCache:
+    """Encoded prepared-visualization payloads, bounded by their total size in bytes.
+
+    Keys hash (dataset version, chart type, canonical config), so the same
+    chart on the same data is served without preparing it again; the key also
+    serves as the HTTP ETag. Least recently used payloads are evicted first
+    once the cached bytes exceed `max_bytes`.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(version, viz_type, config, variant=None):
+        # Canonical JSON: key order and spacing of the config do not change the chart.
+        # Explicit nulls are kept, `config.get(k, default)` treats them differently from absent keys.
+        # `variant` separates other encodings of the same chart
+        parts = [version, viz_type, config or {}] + ([variant] if variant else [])
+        raw = json.dumps(parts, sort_keys=True, separators=(',', ':'), default=str)
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry['body']
+
+    def put(self, key, version, body):
+        with self._lock:
+            # A payload bigger than the whole budget would only flush everything else
+            if len(body) > self.max_bytes:
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old['body'])
+            self._entries[key] = {'version': version, 'body': body}
+            self._bytes += len(body)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted['body'])
+
+    def invalidate(self, version=None):
+        """Drop the payloads of one dataset version, or everything when no version is given"""
+        with self._lock:
+            if version is None:
+                self._entries.clear()
+                self._bytes = 0
+                return
+            for key in [k for k, e in self._entries.items() if e['version'] == version]:
+                self._bytes -= len(self._entries.pop(key)['body'])
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else None,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes
+            }
+
+
+class DatasetFingerprint:
+    """Incremental content hash, so chunked uploads get a version without a full frame.
+
+    The column header comes from the first chunk and the row hashes of every
+    chunk are appended, which makes the digest independent of the chunk size.
+    """
+
+    def __init__(self):
+        self._digest = hashlib.sha1()
+        self._started = False
+
+    def update(self, df):
+        if not self._started:
+            self._digest.update(repr(list(df.columns)).encode())
+            self._digest.update(repr([str(t) for t in df.dtypes]).encode())
+            self._started = True
+        self._digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+
+    def hexdigest(self):
+        return self._digest.hexdigest()
@@ -0,0 +1,169 @@
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from utils.downsample import uniform_sample
+
+# Two-sided 95% normal quantile, for the sampled-mode error bound
+Z_95 = 1.959964
+
+
+def top_correlations(matrix, columns, k=10):
+    """The `k` strongest pairs of the upper triangle, strongest first.
+
+    Ties keep the row-major order of the pairs, like a stable sort over a
+    (i, j) double loop would.
+    """
+    matrix = np.asarray(matrix, dtype=float)
+    rows, cols = np.triu_indices(len(columns), k=1)
+    values = matrix[rows, cols]
+    valid = ~np.isnan(values)
+    rows, cols, values = rows[valid], cols[valid], values[valid]
+
+    strength = np.abs(values)
+    if len(values) > k:
+        # Everything at least as strong as the k-th strongest, then an exact sort of that
+        threshold = np.partition(strength, len(values) - k)[len(values) - k]
+        keep = strength >= threshold
+        rows, cols, values, strength = rows[keep], cols[keep], values[keep], strength[keep]
+    top = np.argsort(-strength, kind='stable')[:k]
+    return [
+        {'var1': columns[rows[i]], 'var2': columns[cols[i]], 'correlation': float(values[i])}
+        for i in top
+    ]
+
+
+def sampling_error_bound(rows):
+    """Per-pair 95% bound on |r_sample - r| for a correlation estimated from `rows` sampled rows.
+
+    The Fisher transform z = atanh(r) has standard error 1/sqrt(m - 3), and
+    |dr/dz| <= 1, so the half-width in z also bounds the error on r.
+    """
+    if rows <= 3:
+        return 1.0
+    return min(Z_95 / math.sqrt(rows - 3), 1.0)
+
+
+class CorrelationEngine:
+    """Pairwise-complete Pearson correlation matrices, computed in column blocks.
+
+    Gives the same values as `DataFrame.corr()` but with matrix products over
+    blocks of `block_size` columns, so peak memory stays around two blocks of
+    rows plus the p x p result. With `sample_rows`, larger datasets are
+    estimated from a uniform row sample and the result states its error
+    bound. Matrices are kept per dataset version so charts reuse the one
+    computed during analysis.
+    """
+
+    def __init__(self, block_size=256, sample_rows=None, max_versions=4, seed=0):
+        self.block_size = block_size
+        self.sample_rows = sample_rows
+        self.max_versions = max_versions
+        self.seed = seed
+        self._matrices = OrderedDict()
+        self._lock = threading.Lock()
+
+    def matrix(self, df, columns, version=None):
+        """Return (correlation DataFrame over `columns`, sampling info or None)"""
+        columns = list(columns)
+        if version is not None:
+            cached = self._cached(version, columns)
+            if cached is not None:
+                return cached
+
+        data = df[columns]
+        sample = None
+        if self.sample_rows and len(data) > self.sample_rows:
+            data = data.iloc[uniform_sample(len(data), self.sample_rows, self.seed)]
+            sample = {'rows': len(data), 'total_rows': len(df), 'error_bound': sampling_error_bound(len(data))}
+
+        values = self._compute(data)
+        matrix = pd.DataFrame(values, index=columns, columns=columns)
+
+        if version is not None:
+            with self._lock:
+                known = self._matrices.get(version)
+                # Keep the widest matrix of a version, narrower requests are slices of it
+                if known is None or len(known[0].columns) < len(columns):
+                    self._matrices[version] = (matrix, sample)
+                self._matrices.move_to_end(version)
+                while len(self._matrices) > self.max_versions:
+                    self._matrices.popitem(last=False)
+        return matrix, sample
+
+    def _cached(self, version, columns):
+        with self._lock:
+            entry = self._matrices.get(version)
+            if entry is None:
+                return None
+            matrix, sample = entry
+            if not set(columns) <= set(matrix.columns):
+                return None
+            self._matrices.move_to_end(version)
+        return matrix.loc[columns, columns], sample
+
+    def invalidate(self, version=None):
+        with self._lock:
+            if version is None:
+                self._matrices.clear()
+            else:
+                self._matrices.pop(version, None)
+
+    def _compute(self, data):
+        p = data.shape[1]
+        result = np.empty((p, p))
+        bounds = [(start, min(start + self.block_size, p)) for start in range(0, p, self.block_size)]
+
+        for i, (a0, a1) in enumerate(bounds):
+            a = self._load(data, a0, a1)
+            for b0, b1 in bounds[i:]:
+                b = a if b0 == a0 else self._load(data, b0, b1)
+                block = self._block(a, b)
+                result[a0:a1, b0:b1] = block
+                result[b0:b1, a0:a1] = block.T
+        return result
+
+    @staticmethod
+    def _load(data, start, stop):
+        x = data.iloc[:, start:stop].to_numpy(dtype=np.float64, na_value=np.nan)
+        present = ~np.isnan(x)
+        count = present.sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(present, x, 0.0).sum(axis=0) / count
+        # A rounded mean would leave a constant column with tiny non-zero
+        # deviations, and correlations of +-1 where pandas gives NaN
+        lowest = np.where(present, x, np.inf).min(axis=0, initial=np.inf)
+        constant = lowest == np.where(present, x, -np.inf).max(axis=0, initial=-np.inf)
+        mean = np.where(constant, lowest, mean)
+        # Centred on the column mean, so the co-moment sums below stay well conditioned
+        x = np.where(present, x - mean, 0.0)
+        return x, present, present.all()
+
+    @staticmethod
+    def _block(a, b):
+        xa, pa, dense_a = a
+        xb, pb, dense_b = b
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if dense_a and dense_b:
+                # No missing values: every pair uses all rows and the centred sums are zero
+                cross = xa.T @ xb
+                corr = cross / np.sqrt(np.outer((xa * xa).sum(axis=0), (xb * xb).sum(axis=0)))
+                if len(xa) < 2:
+                    corr[:] = np.nan
+                return np.clip(corr, -1.0, 1.0)
+
+            # Pairwise-complete: sums over the rows where both columns are present
+            ma = pa.astype(np.float64)
+            mb = pb.astype(np.float64)
+            n = ma.T @ mb
+            sum_a = xa.T @ mb
+            sum_b = ma.T @ xb
+            cross = xa.T @ xb - sum_a * sum_b / n
+            var_a = (xa * xa).T @ mb - sum_a ** 2 / n
+            var_b = ma.T @ (xb * xb) - sum_b ** 2 / n
+            corr = cross / np.sqrt(var_a * var_b)
+        corr[n < 2] = np.nan
+        return np.clip(corr, -1.0, 1.0)
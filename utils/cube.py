@@ -0,0 +1,145 @@
+import numpy as np
+import pandas as pd
+
+
+class GroupCube:
+    """Per-category summaries of every numeric column, built once per dataset.
+
+    For each low-cardinality column, the cube keeps its categories in the
+    order `value_counts()` finds them, their row counts, and for every
+    numeric column the count, sum, min, max and sum of squares of its
+    present values per category. The sums are pandas' own grouped sums, so
+    count/sum/mean/min/max aggregations rebuilt from the cube are the ones
+    a groupby over all rows would give, in O(categories).
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+
+    @classmethod
+    def build(cls, df, keys, numeric, max_categories=50):
+        """Cube of `df` over the `keys` columns having at most `max_categories` categories"""
+        numeric = [col for col in numeric
+                   if isinstance(df[col].dtype, np.dtype) and df[col].dtype.kind in 'iuf']
+        columns = {}
+        for key in keys:
+            column = df[key]
+            if not _cube_key(column):
+                continue
+            # Categories in the order value_counts() sorts them from
+            rows = column.value_counts(sort=False)
+            if len(rows) > max_categories:
+                continue
+
+            # One grouper for every statistic; sums are pandas' own, bit for bit
+            grouped = df.groupby(column, observed=True)[numeric]
+            counts = grouped.count().reindex(rows.index)
+            sums = grouped.sum().reindex(rows.index)
+            minima = grouped.min().reindex(rows.index)
+            maxima = grouped.max().reindex(rows.index)
+            if isinstance(column.dtype, pd.CategoricalDtype):
+                codes, uniques = column.cat.codes.to_numpy(), column.cat.categories
+            else:
+                codes, uniques = pd.factorize(column)
+
+            summary = {
+                'rows': rows.tolist(),
+                'values': {}
+            }
+            if isinstance(column.dtype, pd.CategoricalDtype):
+                summary['categories'] = column.cat.categories.tolist()
+                summary['ordered'] = bool(column.cat.ordered)
+            else:
+                summary['keys'] = rows.index.tolist()
+                summary['dtype'] = str(column.dtype)
+
+            for col in numeric:
+                if col == key:
+                    continue
+                summary['values'][col] = {
+                    'dtype': str(df[col].dtype),
+                    'count': counts[col].fillna(0).astype(np.int64).tolist(),
+                    'sum': _values(sums[col]),
+                    'min': _values(minima[col]),
+                    'max': _values(maxima[col]),
+                    'sumsq': _sum_of_squares(df[col], codes, uniques).reindex(rows.index).tolist()
+                }
+            columns[key] = summary
+        return cls(columns)
+
+    def to_dict(self):
+        return {'columns': self.columns}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get('columns') or {})
+
+    def aggregate(self, plan):
+        """`plan`'s aggregation as the Series pandas would return, or None when the cube lacks it"""
+        summary = self.columns.get(plan.key)
+        if summary is None:
+            return None
+        if plan.value is not None and plan.value not in summary['values']:
+            return None
+
+        index = self._index(summary, plan.key)
+        if plan.value is None:
+            rows = pd.Series(np.asarray(summary['rows'], dtype=np.int64), index=index, name='count')
+            return rows.sort_values(ascending=False)
+
+        stats = summary['values'][plan.value]
+        dtype = np.dtype(stats['dtype'])
+        count = np.asarray(stats['count'], dtype=np.int64)
+        present = np.flatnonzero(count > 0)
+        if plan.aggregation == 'count':
+            values = count
+        elif plan.aggregation == 'mean':
+            values = self._mean(stats, dtype, count)
+        elif dtype.kind in 'iu':
+            # Integer sums stay exact integers; absent groups are dropped below
+            values = np.array([0 if v is None else v for v in stats[plan.aggregation]],
+                              dtype=np.int64 if plan.aggregation == 'sum' else dtype)
+        else:
+            values = np.asarray(stats[plan.aggregation], dtype=np.float64).astype(dtype)
+
+        # groupby(observed=True): present groups only, sorted by key
+        index = index[present]
+        values = values[present]
+        if not isinstance(index, pd.CategoricalIndex):
+            order = index.argsort()
+            index, values = index[order], values[order]
+        return pd.Series(values, index=index, name=plan.value)
+
+    def _index(self, summary, key):
+        if 'categories' in summary:
+            dtype = pd.CategoricalDtype(summary['categories'], ordered=summary['ordered'])
+            codes = np.arange(len(summary['categories']))
+            return pd.CategoricalIndex(pd.Categorical.from_codes(codes, dtype=dtype), name=key)
+        return pd.Index(np.asarray(summary['keys'], dtype=summary['dtype']), name=key)
+
+    def _mean(self, stats, dtype, count):
+        # Like pandas: the float sum divided by the count, in the column's float width
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if dtype.kind == 'f':
+                return np.asarray(stats['sum'], dtype=dtype) / count.astype(dtype)
+            return np.asarray(stats['sum'], dtype=np.float64) / count
+
+
+def _cube_key(column):
+    """Columns whose categories survive a JSON round trip unchanged"""
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return pd.api.types.infer_dtype(column.cat.categories, skipna=False) == 'string'
+    if column.dtype == bool:
+        return True
+    return column.dtype == object and pd.api.types.infer_dtype(column, skipna=True) == 'string'
+
+
+def _sum_of_squares(values, codes, uniques):
+    values = values.to_numpy(dtype=np.float64)
+    valid = (codes >= 0) & ~np.isnan(values)
+    sums = np.bincount(codes[valid], weights=values[valid] ** 2, minlength=len(uniques))
+    return pd.Series(sums, index=uniques)
+
+
+def _values(series):
+    return [None if pd.isna(v) else v for v in series.tolist()]
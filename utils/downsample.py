@@ -0,0 +1,127 @@
+import numpy as np
+
+
+def uniform_sample(n, budget, seed=0):
+    """Pick `budget` row positions out of `n`, uniformly and in original order"""
+    if n <= budget:
+        return np.arange(n)
+    rng = np.random.default_rng(seed)
+    return np.sort(rng.choice(n, size=budget, replace=False))
+
+
+def stratified_sample(codes, budget, seed=0):
+    """Sample at most `budget` row positions, every stratum keeping its share of the budget.
+
+    While there are fewer strata than points, each stratum keeps at least one
+    point so that rare categories never disappear from the chart, and the
+    rest of the budget is split in proportion to the strata sizes (largest
+    remainders first). With more strata than points, the largest strata keep
+    one point each and the smallest are dropped.
+    """
+    n = len(codes)
+    if n <= budget:
+        return np.arange(n)
+
+    _, inverse, sizes = np.unique(codes, return_inverse=True, return_counts=True)
+    # Largest strata first; stable so that ties keep their code order
+    largest = np.argsort(-sizes, kind='stable')
+    quotas = np.zeros(len(sizes), dtype=np.int64)
+    if len(sizes) >= budget:
+        quotas[largest[:budget]] = 1
+    else:
+        # One point each, then the rest in proportion to what every stratum has left
+        shares, remainders = np.divmod((sizes - 1) * (budget - len(sizes)), n - len(sizes))
+        quotas = 1 + shares
+        remainders = remainders[largest]
+        extra = budget - int(quotas.sum())
+        quotas[largest[np.argsort(-remainders, kind='stable')[:extra]]] += 1
+
+    keep = _random_rank(inverse, sizes, seed) < quotas[inverse]
+    return np.flatnonzero(keep)
+
+
+def grid_thin(x, y, budget, codes=None, seed=0):
+    """Keep at most one point per cell of a sqrt(budget) x sqrt(budget) grid.
+
+    Points that would be drawn on top of each other are collapsed, which keeps
+    the visual shape of dense clouds while removing overplotting. When
+    `codes` is given every category keeps its own cell occupancy.
+    """
+    n = len(x)
+    if n <= budget:
+        return np.arange(n)
+
+    side = max(int(np.sqrt(budget)), 1)
+    cells = _grid_cells(x, side) * side + _grid_cells(y, side)
+    if codes is not None:
+        cells = cells + np.asarray(codes, dtype=np.int64) * side * side
+
+    _, first = np.unique(cells, return_index=True)
+    first.sort()
+    if len(first) > budget:
+        first = first[uniform_sample(len(first), budget, seed)]
+    return first
+
+
+def _grid_cells(values, side):
+    low = values.min()
+    span = values.max() - low
+    if span == 0:
+        return np.zeros(len(values), dtype=np.int64)
+    cells = ((values - low) / span * side).astype(np.int64)
+    return np.minimum(cells, side - 1)
+
+
+def lttb(x, y, budget):
+    """Largest-Triangle-Three-Buckets: pick `budget` positions that keep the shape of a line.
+
+    `x` must be sorted ascending. The first and last points are always kept;
+    each intermediate bucket keeps the point forming the largest triangle with
+    the previously kept point and the average of the next bucket.
+    """
+    n = len(x)
+    if n <= budget or budget < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, n - 1, budget - 1).astype(np.int64)
+
+    keep = np.empty(budget, dtype=np.int64)
+    keep[0] = 0
+    keep[-1] = n - 1
+    previous = 0
+    for i in range(budget - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = end, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        px, py = x[previous], y[previous]
+        areas = np.abs(
+            (px - avg_x) * (y[start:end] - py) - (px - x[start:end]) * (avg_y - py)
+        )
+        previous = start + int(np.argmax(areas))
+        keep[i + 1] = previous
+    return keep
+
+
+def per_group_sample(codes, cap, seed=0):
+    """Sample at most `cap` row positions per group, uniformly without replacement"""
+    n = len(codes)
+    if n == 0:
+        return np.arange(0)
+    _, inverse, sizes = np.unique(codes, return_inverse=True, return_counts=True)
+    return np.flatnonzero(_random_rank(inverse, sizes, seed) < cap)
+
+
+def _random_rank(inverse, sizes, seed):
+    """Random rank of every row inside its group (0 .. group size - 1)"""
+    n = len(inverse)
+    rng = np.random.default_rng(seed)
+    # Group id plus a random fraction sorts rows by group, shuffled inside each group
+    order = np.argsort(inverse + rng.random(n))
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    rank = np.empty(n, dtype=np.int64)
+    rank[order] = np.arange(n) - np.repeat(starts, sizes)
+    return rank
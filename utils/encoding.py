@@ -0,0 +1,133 @@
+import gzip
+
+import numpy as np
+import orjson
+import pyarrow as pa
+
+try:
+    import brotli
+except ImportError:  # optional: without it responses are gzip-compressed only
+    brotli = None
+
+# A string column is dictionary-encoded when it has at most this share of distinct values
+DICTIONARY_MAX_RATIO = 0.5
+# Arrow IPC stream of a chart's series, with the rest of the payload in the schema metadata
+ARROW_MIMETYPE = 'application/vnd.apache.arrow.stream'
+# Chart types whose series can be sent as Arrow columns
+ARROW_TYPES = {'scatter', 'line'}
+# Float arrays are narrowed to float32 when no value moves by more than this share of their range
+FLOAT32_MAX_ERROR = 1e-6
+
+
+def to_columnar(value):
+    """Re-encode chart data as parallel arrays, with a dictionary for repeated strings.
+
+    A list of records sharing the same keys becomes
+    {"$records": {key: column, ...}, "$length": n}, and a string column with
+    few distinct values becomes {"$dict": [distinct values], "$codes": [...]}.
+    Float arrays are sent with float32 precision when that moves no value by
+    more than a millionth of the array's range, far below a pixel (large
+    timestamps keep full precision). Anything else is kept as is, so every
+    `_prepare_*` payload round-trips.
+    """
+    if isinstance(value, dict):
+        return {k: to_columnar(v) for k, v in value.items()}
+    if isinstance(value, list):
+        if len(value) > 1 and all(isinstance(v, dict) for v in value):
+            keys = list(value[0].keys())
+            if all(list(v.keys()) == keys for v in value):
+                return {
+                    '$records': {k: _column([v[k] for v in value]) for k in keys},
+                    '$length': len(value)
+                }
+        return _column(value)
+    return value
+
+
+def _column(values):
+    if all(isinstance(v, str) for v in values):
+        codes = {}
+        for v in values:
+            codes.setdefault(v, len(codes))
+        if len(codes) <= DICTIONARY_MAX_RATIO * len(values):
+            return {'$dict': list(codes), '$codes': [codes[v] for v in values]}
+        return values
+    if values and all(type(v) is float for v in values):
+        return _narrow_floats(np.asarray(values, dtype=np.float64))
+    if any(isinstance(v, (dict, list)) for v in values):
+        return [to_columnar(v) for v in values]
+    return values
+
+
+def _narrow_floats(values):
+    finite = values[np.isfinite(values)]
+    if len(finite) == 0:
+        return values
+    narrow = finite.astype(np.float32)
+    if not np.isfinite(narrow).all():
+        return values
+    error = np.abs(narrow.astype(np.float64) - finite).max()
+    if error <= FLOAT32_MAX_ERROR * (finite.max() - finite.min()) or error == 0:
+        return values.astype(np.float32)
+    return values
+
+
+def to_arrow(prepared):
+    """Encode a payload prepared with `arrays=True` as an Arrow IPC stream.
+
+    Each array of `prepared['data']` becomes a column, written straight from
+    its numpy buffer: floats are narrowed like in `to_columnar`, integers are
+    sent as int32 when they fit (else float64, since 64-bit integers decode to
+    BigInts in the browser) and strings are dictionary-encoded. Everything
+    else is JSON in the `chart` metadata key.
+    """
+    names = []
+    columns = []
+    for name, values in prepared['data'].items():
+        if values is None:
+            continue
+        names.append(name)
+        columns.append(_arrow_column(np.asarray(values)))
+
+    meta = {k: v for k, v in prepared.items() if k != 'data'}
+    schema = pa.schema([pa.field(n, c.type) for n, c in zip(names, columns)],
+                       metadata={'chart': dumps(meta)})
+    batch = pa.record_batch(columns, schema=schema)
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+def _arrow_column(values):
+    if values.dtype.kind == 'f':
+        return pa.array(_narrow_floats(values.astype(np.float64, copy=False)))
+    if values.dtype.kind in 'iub':
+        if len(values) == 0 or (values.min() >= -2 ** 31 and values.max() < 2 ** 31):
+            return pa.array(values.astype(np.int32, copy=False))
+        return pa.array(values.astype(np.float64))
+    return pa.array(values, type=pa.string()).dictionary_encode()
+
+
+def dumps(value):
+    """Fast JSON encoding; NaN and infinities become null, numpy values are accepted"""
+    return orjson.dumps(value, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+
+
+def negotiate_encoding(accept_encodings):
+    """Best compression the client accepts: brotli, then gzip, else None"""
+    if brotli is not None and accept_encodings['br'] > 0:
+        return 'br'
+    if accept_encodings['gzip'] > 0:
+        return 'gzip'
+    return None
+
+
+def compress(body, encoding):
+    """Compress `body` with a negotiated `encoding` (None leaves it as is)"""
+    if encoding == 'br':
+        return brotli.compress(body, quality=5)
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=6)
+    return body
@@ -0,0 +1,187 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Job:
+    """One background task and its progress, as reported to the client.
+
+    `stage` and `rows` are set by the task itself. While a file is tracked,
+    the bytes read so far come from its OS-level read position, so progress
+    can be polled from another thread without touching the reader.
+    """
+
+    def __init__(self, total_bytes=0, memory=0, on_change=None):
+        self.id = uuid.uuid4().hex
+        self.status = 'queued'
+        self.stage = 'queued'
+        self.rows = 0
+        self.total_bytes = total_bytes
+        self.memory = memory
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self._fd = None
+        self._bytes_read = 0
+        self._done = threading.Event()
+        self._on_change = on_change
+
+    def update(self, stage=None, rows=None):
+        if stage is not None:
+            self.stage = stage
+        if rows is not None:
+            self.rows = rows
+        self._changed()
+
+    def _changed(self):
+        if self._on_change is not None:
+            self._on_change(self)
+
+    def track(self, handle):
+        """Report progress from the read position of an open file"""
+        self._fd = handle.fileno()
+
+    def untrack(self):
+        self._bytes_read = self.bytes_read()
+        self._fd = None
+
+    def bytes_read(self):
+        fd = self._fd
+        if fd is None:
+            return self._bytes_read
+        try:
+            return os.lseek(fd, 0, os.SEEK_CUR)
+        except OSError:
+            return self._bytes_read
+
+    def eta(self):
+        """Seconds left, extrapolated from the share of the input read so far"""
+        done = self.bytes_read()
+        if self.started is None or self.finished is not None or not self.total_bytes or not done:
+            return None
+        if done >= self.total_bytes:
+            return None
+        elapsed = time.time() - self.started
+        return elapsed * (self.total_bytes - done) / done
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def to_dict(self):
+        now = self.finished or time.time()
+        read = self.bytes_read()
+        if self.status == 'done':
+            progress = 1.0
+        elif self.total_bytes:
+            progress = min(read / self.total_bytes, 1.0)
+        else:
+            progress = None
+        eta = self.eta()
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'stage': self.stage,
+            'rows': self.rows,
+            'bytes_read': read,
+            'total_bytes': self.total_bytes,
+            'progress': progress,
+            'elapsed': round(now - (self.started or now), 3),
+            'eta_seconds': round(eta, 1) if eta is not None else None,
+            'result': self.result,
+            'error': self.error
+        }
+
+
+class JobQueue:
+    """Local worker pool for long tasks, bounded in concurrency and memory.
+
+    At most `workers` jobs run at once and at most `max_pending` wait for a
+    worker; `submit` returns None beyond that. Each job declares the memory it
+    is expected to need and only starts once that fits in `memory_budget`
+    next to the running jobs (a job larger than the whole budget runs alone).
+    Finished jobs are kept for polling, the `max_finished` most recent ones.
+    `on_change(job)` is called whenever a job changes stage, progress or
+    status, e.g. to publish its state to other processes.
+    """
+
+    def __init__(self, workers=2, memory_budget=2 * 1024 ** 3, max_pending=8, max_finished=100,
+                 on_change=None):
+        self.on_change = on_change
+        self.memory_budget = memory_budget
+        self.max_pending = max_pending
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._jobs = OrderedDict()
+        self._reserved = 0
+        self._lock = threading.Lock()
+        self._memory_freed = threading.Condition(self._lock)
+
+    def submit(self, run, total_bytes=0, memory=0):
+        """Queue `run(job)`; its return value becomes the job result. None when the queue is full"""
+        job = Job(total_bytes=total_bytes, memory=min(memory, self.memory_budget), on_change=self.on_change)
+        with self._lock:
+            if self._count('queued') >= self.max_pending:
+                return None
+            self._jobs[job.id] = job
+            self._forget_finished()
+        job._changed()
+        self._executor.submit(self._run, job, run)
+        return job
+
+    def full(self):
+        with self._lock:
+            return self._count('queued') >= self.max_pending
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job, run):
+        with self._memory_freed:
+            while self._reserved and self._reserved + job.memory > self.memory_budget:
+                if job.stage != 'waiting_memory':
+                    job.stage = 'waiting_memory'
+                    job._changed()
+                self._memory_freed.wait()
+            self._reserved += job.memory
+            job.status = 'running'
+            job.started = time.time()
+        job._changed()
+        try:
+            job.result = run(job)
+            job.status = 'done'
+            job.stage = 'done'
+        except Exception as e:
+            job.error = str(e)
+            job.status = 'error'
+        finally:
+            job.untrack()
+            job.finished = time.time()
+            with self._memory_freed:
+                self._reserved -= job.memory
+                self._memory_freed.notify_all()
+            job._changed()
+            job._done.set()
+
+    def _count(self, status):
+        return sum(1 for job in self._jobs.values() if job.status == status)
+
+    def _forget_finished(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished is not None]
+        for job_id in finished[:max(len(finished) - self.max_finished, 0)]:
+            del self._jobs[job_id]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queued': self._count('queued'),
+                'running': self._count('running'),
+                'finished': sum(1 for job in self._jobs.values() if job.finished is not None),
+                'reserved_bytes': self._reserved,
+                'memory_budget': self.memory_budget
+            }
@@ -0,0 +1,218 @@
+import asyncio
+import email.utils
+import json
+import random
+import threading
+import time
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+# Rate limiting and transient server errors are worth another attempt
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """The LLM backend could not produce a completion"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class LLMClient:
+    """HTTP client for the chat-completions endpoint.
+
+    Keeps a persistent connection pool (no TCP+TLS handshake per question),
+    caps the number of in-flight calls, retries 429/5xx and network errors
+    with jittered exponential backoff honouring `Retry-After`, and enforces
+    an overall deadline per request. `apost_json` is the asyncio variant.
+    """
+
+    def __init__(self, endpoint, api_key, timeout=60, max_retries=3, max_concurrency=8,
+                 pool_size=16, backoff_base=0.5, backoff_max=8.0):
+        self.endpoint = endpoint
+        self.api_key = api_key
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_concurrency = max_concurrency
+        self.pool_size = pool_size
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+        # Async clients and semaphores only work on the event loop they were
+        # created on: one pair per running loop, forgotten once it is closed
+        self._async = {}
+        self._async_lock = threading.Lock()
+
+    @property
+    def headers(self):
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+        }
+
+    def post_json(self, payload, timeout=None):
+        """POST `payload` and return the decoded JSON body, retrying within the deadline"""
+        deadline = time.monotonic() + (timeout or self.timeout)
+        if not self._slots.acquire(timeout=max(deadline - time.monotonic(), 0)):
+            raise LLMError("Too many concurrent LLM requests")
+        try:
+            return self._request(payload, deadline).json()
+        finally:
+            self._slots.release()
+
+    def post_stream(self, payload, timeout=None, on_usage=None):
+        """POST a `stream: true` completion and yield the text deltas as they arrive.
+
+        Retries only happen before the first byte; `timeout` bounds getting a
+        response and every read after that, not the whole generation. The
+        token usage some providers add to the last event (`usage`, or
+        `x_groq.usage` on Groq) is passed to `on_usage`.
+        """
+        timeout = timeout or self.timeout
+        deadline = time.monotonic() + timeout
+        if not self._slots.acquire(timeout=timeout):
+            raise LLMError("Too many concurrent LLM requests")
+        try:
+            response = self._request(dict(payload, stream=True), deadline, stream=True, read_timeout=timeout)
+            with response:
+                for line in response.iter_lines(decode_unicode=True):
+                    # Server-sent events: "data: {...}" lines, ended by "data: [DONE]"
+                    if not line or not line.startswith('data:'):
+                        continue
+                    data = line[5:].strip()
+                    if data == '[DONE]':
+                        break
+                    event = json.loads(data)
+                    usage = event.get("usage") or (event.get("x_groq") or {}).get("usage")
+                    if usage and on_usage is not None:
+                        on_usage(usage)
+                    choices = event.get("choices") or [{}]
+                    delta = choices[0].get("delta", {}).get("content")
+                    if delta:
+                        yield delta
+        finally:
+            self._slots.release()
+
+    def _request(self, payload, deadline, stream=False, read_timeout=None):
+        """Send until a successful response, retrying transient failures within `deadline`"""
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise LLMError("LLM request deadline exceeded")
+            try:
+                response = self.session.post(
+                    self.endpoint, headers=self.headers, json=payload,
+                    timeout=(remaining, read_timeout or remaining), stream=stream
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                response, error = None, e
+            else:
+                error = None
+                if response.status_code < 400:
+                    return response
+                # Failed attempts are not read further: give their connection back to the pool
+                with response:
+                    if response.status_code not in RETRYABLE_STATUS:
+                        raise LLMError(f"LLM backend returned {response.status_code}: {response.text[:200]}",
+                                       status=response.status_code)
+
+            delay = self._retry_delay(attempt, response)
+            if attempt >= self.max_retries or time.monotonic() + delay >= deadline:
+                status = response.status_code if response is not None else None
+                raise LLMError(f"LLM request failed after {attempt + 1} attempts: {error or status}",
+                               status=status)
+            time.sleep(delay)
+            attempt += 1
+
+    async def apost_json(self, payload, timeout=None):
+        """Asyncio variant of `post_json`: waiting on the LLM does not hold a thread"""
+        client, slots = self._async_resources()
+        deadline = time.monotonic() + (timeout or self.timeout)
+        try:
+            await asyncio.wait_for(slots.acquire(), max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            raise LLMError("Too many concurrent LLM requests")
+        try:
+            attempt = 0
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise LLMError("LLM request deadline exceeded")
+                try:
+                    response = await client.post(self.endpoint, headers=self.headers, json=payload,
+                                                 timeout=remaining)
+                except httpx.TransportError as e:
+                    response, error = None, e
+                else:
+                    error = None
+                    if response.status_code < 400:
+                        return response.json()
+                    if response.status_code not in RETRYABLE_STATUS:
+                        raise LLMError(f"LLM backend returned {response.status_code}: {response.text[:200]}",
+                                       status=response.status_code)
+
+                delay = self._retry_delay(attempt, response)
+                if attempt >= self.max_retries or time.monotonic() + delay >= deadline:
+                    status = response.status_code if response is not None else None
+                    raise LLMError(f"LLM request failed after {attempt + 1} attempts: {error or status}",
+                                   status=status)
+                await asyncio.sleep(delay)
+                attempt += 1
+        finally:
+            slots.release()
+
+    def _async_resources(self):
+        """(AsyncClient, Semaphore) of the running event loop, created on its first call"""
+        loop = asyncio.get_running_loop()
+        with self._async_lock:
+            for closed in [other for other in self._async if other.is_closed()]:
+                del self._async[closed]
+            resources = self._async.get(loop)
+            if resources is None:
+                client = httpx.AsyncClient(limits=httpx.Limits(max_connections=self.pool_size,
+                                                               max_keepalive_connections=self.pool_size))
+                resources = self._async[loop] = (client, asyncio.Semaphore(self.max_concurrency))
+            return resources
+
+    async def aclose(self):
+        """Close the async client of the running event loop"""
+        with self._async_lock:
+            resources = self._async.pop(asyncio.get_running_loop(), None)
+        if resources is not None:
+            await resources[0].aclose()
+
+    def _retry_delay(self, attempt, response):
+        """Seconds to wait before the next attempt: `Retry-After` if given, else full-jitter backoff"""
+        if response is not None:
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            if retry_after is not None:
+                return retry_after
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def close(self):
+        self.session.close()
+
+
+def parse_retry_after(value):
+    """`Retry-After` is either a number of seconds or an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(when.timestamp() - time.time(), 0.0)
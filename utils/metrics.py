@@ -0,0 +1,154 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds, from a cached chart to a slow LLM round trip
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# Bytes, 1 KB to 64 MB by factors of 4
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(9))
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return 'NaN'
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic count per label combination"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, '') for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Histogram:
+    """Observations counted into cumulative `le` buckets, with their sum and count"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, '') for n in self.labels)
+        with self._lock:
+            counts, total, count = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(counts), total, count) for key, (counts, total, count) in self._values.items()]
+        samples = []
+        for key, counts, total, count in items:
+            for bound, cumulative in zip(self.buckets, counts):
+                samples.append((f'{self.name}_bucket', key + (_number(float(bound)),), cumulative))
+            samples.append((f'{self.name}_bucket', key + ('+Inf',), count))
+            samples.append((f'{self.name}_sum', key, total))
+            samples.append((f'{self.name}_count', key, count))
+        return samples
+
+    def sample_labels(self, sample_name):
+        if sample_name.endswith('_bucket'):
+            return self.labels + ('le',)
+        return self.labels
+
+
+class Collected:
+    """Values read from `collect()` at scrape time, as {label tuple: value}.
+
+    For state kept elsewhere, e.g. cache statistics: a gauge, or a counter
+    when the values only ever grow.
+    """
+
+    def __init__(self, name, help, collect, labels=(), kind='gauge'):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.collect = collect
+        self.kind = kind
+
+    def samples(self):
+        return [(self.name, tuple(key), value) for key, value in self.collect().items()]
+
+
+class MetricsRegistry:
+    """Metrics of this process, rendered in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def collected(self, name, help, collect, labels=(), kind='gauge'):
+        return self.register(Collected(name, help, collect, labels, kind))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            try:
+                samples = metric.samples()
+            except Exception as e:
+                # A failing collector must not hide every other metric
+                lines.append(f'# {metric.name} unavailable: {_escape(e)}')
+                continue
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, key, value in samples:
+                names = metric.sample_labels(name) if hasattr(metric, 'sample_labels') else metric.labels
+                lines.append(f'{name}{_labels(names, key)} {_number(value)}')
+        return '\n'.join(lines) + '\n'
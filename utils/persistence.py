@@ -0,0 +1,237 @@
+import json
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from utils.schema import apply_schema
+
+
+class DatasetPersistence:
+    """Columnar on-disk copy of every uploaded dataset.
+
+    Each dataset is written once as `<dataset_id>.parquet` next to a
+    `<dataset_id>.json` metadata file holding its version, shape, inferred
+    schema and cached analysis. Reads are memory-mapped and can be restricted to a subset of
+    columns, so a chart touching 2 of 80 columns only decodes those 2.
+
+    With `format='arrow'` datasets are uncompressed Arrow IPC files instead
+    (`<dataset_id>.arrow`). Loading one maps the file and wraps its column
+    buffers without decoding, so every process serving the dataset shares the
+    same pages of the OS cache instead of holding its own copy.
+    """
+
+    EXTENSIONS = {'parquet': '.parquet', 'arrow': '.arrow'}
+
+    def __init__(self, folder, format='parquet'):
+        if format not in self.EXTENSIONS:
+            raise ValueError(f'Unknown dataset format: {format}')
+        self.folder = folder
+        self.format = format
+        os.makedirs(folder, exist_ok=True)
+
+    def data_path(self, dataset_id, format=None):
+        return os.path.join(self.folder, f'{dataset_id}{self.EXTENSIONS[format or self.format]}')
+
+    def stored_format(self, dataset_id):
+        """Format a dataset was written in, which may predate the current setting"""
+        for format in (self.format, *self.EXTENSIONS):
+            if os.path.exists(self.data_path(dataset_id, format)):
+                return format
+        return None
+
+    def meta_path(self, dataset_id):
+        return os.path.join(self.folder, f'{dataset_id}.json')
+
+    def cube_path(self, dataset_id):
+        return os.path.join(self.folder, f'{dataset_id}.cube.json')
+
+    def save(self, dataset_id, df, version=None, analysis=None, schema=None):
+        """Write a whole DataFrame and its metadata"""
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        path = self.data_path(dataset_id)
+        if self.format == 'arrow':
+            # Written aside then renamed, other processes never map a partial file
+            tmp_path = f'{path}.tmp'
+            with pa.ipc.new_file(tmp_path, table.schema) as writer:
+                writer.write_table(table)
+            os.replace(tmp_path, path)
+        else:
+            pq.write_table(table, path)
+        self.save_meta(dataset_id, {
+            'version': version,
+            'rows': len(df),
+            'columns': list(df.columns),
+            'nbytes': int(df.memory_usage(deep=True).sum()),
+            'schema': schema,
+            'analysis': analysis
+        })
+
+    def writer(self, dataset_id):
+        """Incremental writer for chunked ingestion"""
+        return ChunkWriter(self.data_path(dataset_id), self.format)
+
+    def exists(self, dataset_id):
+        return self.stored_format(dataset_id) is not None and os.path.exists(self.meta_path(dataset_id))
+
+    def load(self, dataset_id, columns=None):
+        """Read a dataset back, memory-mapped and restricted to `columns` when given"""
+        format = self.stored_format(dataset_id) or self.format
+        if format == 'arrow':
+            table = pa.ipc.open_file(pa.memory_map(self.data_path(dataset_id, format))).read_all()
+            if columns is not None:
+                table = table.select(columns)
+            # One block per column: numeric columns without nulls stay views on the mapping
+            df = table.to_pandas(split_blocks=True)
+        else:
+            table = pq.read_table(self.data_path(dataset_id, format), columns=columns, memory_map=True)
+            df = table.to_pandas()
+        schema = (self.load_meta(dataset_id) or {}).get('schema')
+        if schema:
+            # Chunked uploads keep text on disk, categories are rebuilt here
+            df = apply_schema(df, schema)
+        return df
+
+    def chunks(self, dataset_id):
+        """Read a dataset back one row group (Arrow: record batch) at a time"""
+        format = self.stored_format(dataset_id) or self.format
+        if format == 'arrow':
+            with pa.memory_map(self.data_path(dataset_id, format)) as source:
+                reader = pa.ipc.open_file(source)
+                for i in range(reader.num_record_batches):
+                    yield reader.get_batch(i).to_pandas()
+        else:
+            source = pq.ParquetFile(self.data_path(dataset_id, format))
+            for i in range(source.num_row_groups):
+                yield source.read_row_group(i).to_pandas()
+            source.close()
+
+    def save_meta(self, dataset_id, meta):
+        path = self.meta_path(dataset_id)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, default=str)
+        os.replace(tmp_path, path)
+
+    def load_meta(self, dataset_id):
+        try:
+            with open(self.meta_path(dataset_id), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save_cube(self, dataset_id, cube):
+        """Write the group-by cube of a dataset, built after it was stored"""
+        path = self.cube_path(dataset_id)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(cube, f)
+        os.replace(tmp_path, path)
+
+    def load_cube(self, dataset_id):
+        try:
+            with open(self.cube_path(dataset_id), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def update_meta(self, dataset_id, **fields):
+        meta = self.load_meta(dataset_id) or {}
+        meta.update(fields)
+        self.save_meta(dataset_id, meta)
+
+    def delete(self, dataset_id):
+        paths = [self.data_path(dataset_id, format) for format in self.EXTENSIONS]
+        for path in paths + [self.meta_path(dataset_id), self.cube_path(dataset_id)]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def list(self):
+        """Persisted dataset IDs, oldest first"""
+        ids = {os.path.splitext(name)[0] for name in os.listdir(self.folder)
+               if os.path.splitext(name)[1] in self.EXTENSIONS.values()}
+        ids = [dataset_id for dataset_id in ids if os.path.exists(self.meta_path(dataset_id))]
+        return sorted(ids, key=self.created)
+
+    def created(self, dataset_id):
+        return os.path.getmtime(self.data_path(dataset_id, self.stored_format(dataset_id)))
+
+
+class ChunkWriter:
+    """Appends DataFrame chunks to one Parquet file (one row group per chunk) or Arrow IPC file.
+
+    The file is written aside and renamed on close. Column types follow the
+    chunks: when a chunk does not fit the types written so far (digits that
+    later hold text, integers that later hold blanks or decimals), integers
+    are widened to float64 and anything else to string, and the row groups
+    already written are rewritten with the wider types.
+    """
+
+    def __init__(self, path, format='parquet'):
+        self.path = path
+        self.format = format
+        self.schema = None
+        self._writer = None
+        self._tmp_path = f'{path}.tmp'
+
+    def write(self, chunk):
+        table = pa.Table.from_pandas(chunk, preserve_index=False)
+        if self._writer is None:
+            # A column that is empty in the first chunk has no type yet: assume text
+            self._open(pa.schema([
+                field.with_type(pa.string()) if pa.types.is_null(field.type) else field
+                for field in table.schema
+            ], metadata=table.schema.metadata))
+        else:
+            schema = widen_schema(self.schema, table.schema)
+            if not schema.equals(self.schema):
+                self._rewrite(schema)
+        self._writer.write_table(table.cast(self.schema))
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            os.replace(self._tmp_path, self.path)
+
+    def _open(self, schema):
+        self.schema = schema
+        if self.format == 'arrow':
+            self._writer = pa.ipc.new_file(self._tmp_path, schema)
+        else:
+            self._writer = pq.ParquetWriter(self._tmp_path, schema)
+
+    def _rewrite(self, schema):
+        """Start the file over with `schema`, copying what was written one row group at a time"""
+        self._writer.close()
+        old_path = f'{self.path}.old'
+        os.replace(self._tmp_path, old_path)
+        self._open(schema)
+        if self.format == 'arrow':
+            with pa.memory_map(old_path) as source:
+                reader = pa.ipc.open_file(source)
+                for i in range(reader.num_record_batches):
+                    self._writer.write_table(pa.Table.from_batches([reader.get_batch(i)]).cast(schema))
+        else:
+            source = pq.ParquetFile(old_path)
+            for i in range(source.num_row_groups):
+                self._writer.write_table(source.read_row_group(i).cast(schema))
+            source.close()
+        os.remove(old_path)
+
+
+def widen_schema(schema, other):
+    """`schema` with every column wide enough for the values of `other` too"""
+    fields = []
+    for field in schema:
+        new = other.field(field.name).type
+        if new == field.type or pa.types.is_null(new):
+            fields.append(field)
+        elif _is_number(field.type) and _is_number(new):
+            fields.append(field.with_type(pa.float64()))
+        else:
+            fields.append(field.with_type(pa.string()))
+    return pa.schema(fields, metadata=schema.metadata)
+
+
+def _is_number(type):
+    return pa.types.is_integer(type) or pa.types.is_floating(type)
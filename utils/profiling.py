@@ -0,0 +1,180 @@
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+# Code whose calls into pandas/numpy are broken down per calling function
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _library(key):
+    filename, _, name = key
+    path = filename.replace('\\', '/')
+    for library in ('pandas', 'numpy', 'pyarrow'):
+        if f'/{library}/' in path or (filename == '~' and library in name):
+            return library
+    return None
+
+
+def _is_app_code(filename):
+    if filename == '~' or filename.startswith('<'):
+        return False
+    path = os.path.abspath(filename)
+    return path.startswith(APP_ROOT + os.sep) and 'site-packages' not in path
+
+
+def _label(key):
+    filename, line, name = key
+    if filename == '~':
+        return name
+    return f'{name} ({_short_path(filename)}:{line})'
+
+
+def _short_path(filename):
+    path = filename.replace('\\', '/')
+    for marker in ('/site-packages/', '/dist-packages/'):
+        if marker in path:
+            return path.split(marker, 1)[1]
+    if path.startswith(APP_ROOT.replace('\\', '/') + '/'):
+        return path[len(APP_ROOT) + 1:]
+    return os.path.basename(path)
+
+
+class RequestProfile:
+    """Deterministic profile and stack samples of the code running on one thread.
+
+    `cProfile` gives exact call counts and times per function, from which the
+    hottest functions and the time spent in each pandas/numpy entry point per
+    calling application function are reported. A sampler thread records the
+    profiled thread's stack every `interval` seconds, as collapsed stacks
+    (`frame;frame;frame count` lines) that flamegraph tools read directly.
+    Only the thread that called `start` is profiled.
+    """
+
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.samples = Counter()
+        self.seconds = None
+        self._profiler = cProfile.Profile()
+        self._stop = threading.Event()
+        self._sampler = None
+        self._thread_id = None
+        self._started = None
+
+    def start(self):
+        self._thread_id = threading.get_ident()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+        self._started = time.perf_counter()
+        self._profiler.enable()
+
+    def stop(self):
+        self._profiler.disable()
+        self.seconds = time.perf_counter() - self._started
+        self._stop.set()
+        self._sampler.join()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        """Collapsed stacks for flamegraph.pl, speedscope or similar"""
+        return ''.join(f'{stack} {count}\n' for stack, count in self.samples.most_common())
+
+    def report(self, top=30):
+        stats = pstats.Stats(self._profiler).stats
+        functions = sorted(stats.items(), key=lambda item: item[1][2], reverse=True)[:top]
+
+        # Time of every pandas/numpy call, by the application function making it
+        operations = {}
+        for key, (_, _, _, _, callers) in stats.items():
+            library = _library(key)
+            if library is None:
+                continue
+            for caller, (_, calls, _, cumtime) in callers.items():
+                if not _is_app_code(caller[0]):
+                    continue
+                entry = operations.setdefault((caller, key), {
+                    'caller': _label(caller),
+                    'operation': _label(key),
+                    'library': library,
+                    'calls': 0,
+                    'cumtime': 0.0
+                })
+                entry['calls'] += calls
+                entry['cumtime'] += cumtime
+
+        return {
+            'wall_seconds': round(self.seconds, 6),
+            'top_functions': [
+                {
+                    'function': _label(key),
+                    'calls': calls,
+                    'tottime': round(tottime, 6),
+                    'cumtime': round(cumtime, 6)
+                }
+                for key, (_, calls, tottime, cumtime, _) in functions
+            ],
+            'dataframe_operations': sorted(
+                ({**entry, 'cumtime': round(entry['cumtime'], 6)} for entry in operations.values()),
+                key=lambda entry: entry['cumtime'], reverse=True
+            )[:top * 2],
+            'samples': sum(self.samples.values()),
+            'sample_interval': self.interval
+        }
+
+
+class ProfileStore:
+    """Profiles of individual requests on disk: `<id>.json` report and `<id>.folded` stacks"""
+
+    def __init__(self, folder, max_profiles=50):
+        self.folder = folder
+        self.max_profiles = max_profiles
+
+    def save(self, profile, request_info):
+        os.makedirs(self.folder, exist_ok=True)
+        profile_id = uuid.uuid4().hex
+        report = dict(profile.report(), request=request_info, created=time.time())
+        with open(self._path(profile_id, 'json'), 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=1)
+        with open(self._path(profile_id, 'folded'), 'w', encoding='utf-8') as f:
+            f.write(profile.collapsed())
+        self._prune()
+        return profile_id
+
+    def load(self, profile_id, kind='json'):
+        if not profile_id.isalnum():
+            return None
+        try:
+            with open(self._path(profile_id, kind), encoding='utf-8') as f:
+                return json.load(f) if kind == 'json' else f.read()
+        except OSError:
+            return None
+
+    def _path(self, profile_id, kind):
+        return os.path.join(self.folder, f'{profile_id}.{kind}')
+
+    def _prune(self):
+        reports = [name for name in os.listdir(self.folder) if name.endswith('.json')]
+        if len(reports) <= self.max_profiles:
+            return
+        reports.sort(key=lambda name: os.path.getmtime(os.path.join(self.folder, name)))
+        for name in reports[:len(reports) - self.max_profiles]:
+            profile_id = name[:-len('.json')]
+            for kind in ('json', 'folded'):
+                path = self._path(profile_id, kind)
+                if os.path.exists(path):
+                    os.remove(path)
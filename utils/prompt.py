@@ -1,19 +1,143 @@
 import google.generativeai as genai
 import json
 import re
-import requests
+from contextlib import nullcontext
+from utils.llm_client import LLMClient
+from utils.prompt_builder import PromptBuilder, estimate_tokens
+from utils.proposal_stream import ProposalStreamParser
 class GeminiService:
-    def __init__(self, api_key, model="openai/gpt-oss-120b"):
+    def __init__(self, api_key, model="openai/gpt-oss-120b", cache=None, client=None, prompt_builder=None,
+                 timer=None, on_usage=None):
         self.api_key = api_key
         self.model = model
         self.endpoint = "https://api.groq.com/openai/v1/chat/completions"
         self.last_raw_response = None
+        self.cache = cache
+        self.prompt_builder = prompt_builder or PromptBuilder()
+        self.client = client or LLMClient(self.endpoint, api_key)
+        # Optional instrumentation: `timer(stage)` is a context manager around each
+        # step of a request, `on_usage(usage)` receives the token usage of completions
+        self.timer = timer or (lambda stage: nullcontext())
+        self.on_usage = on_usage
+
+    def generate_visualization_proposals(self, question, dataset_info, columns, use_cache=True):
+        return self.generate(question, dataset_info, columns, use_cache)['proposals']
+
+    def generate(self, question, dataset_info, columns, use_cache=True):
+        """Proposals for a question, with what this call reported.
+
+        Returns {'proposals', 'error', 'prompt_tokens', 'raw_response'}: `error`
+        is set when the proposals are the default ones, `prompt_tokens` when a
+        prompt was sent. Nothing is kept on the shared service between calls.
+        """
+        outcome, context, payload, cache_key = self._start(question, dataset_info, columns, use_cache)
+        if payload is None:
+            return outcome
+        try:
+            with self.timer('llm'):
+                data = self.client.post_json(payload)
+            self._complete(outcome, data, cache_key)
+        except Exception as e:
+            outcome['proposals'] = self._fallback(e, context)
+            outcome['error'] = str(e)
+        return outcome
+
+    async def agenerate(self, question, dataset_info, columns, use_cache=True):
+        """Asyncio variant of `generate`: the LLM round trip does not block a thread"""
+        outcome, context, payload, cache_key = self._start(question, dataset_info, columns, use_cache)
+        if payload is None:
+            return outcome
+        try:
+            with self.timer('llm'):
+                data = await self.client.apost_json(payload)
+            self._complete(outcome, data, cache_key)
+        except Exception as e:
+            outcome['proposals'] = self._fallback(e, context)
+            outcome['error'] = str(e)
+        return outcome
+
+    def _start(self, question, dataset_info, columns, use_cache):
+        """(outcome, prompt context, payload, cache key) of a call; no payload when answered from the cache"""
+        outcome = {'proposals': None, 'error': None, 'prompt_tokens': None, 'raw_response': None}
+
+        # Same question on the same schema/statistics: answer from the cache.
+        # Bypassing skips the lookup but still refreshes the cached answer.
+        with self.timer('prompt_build'):
+            context = self.prompt_builder.build(question, dataset_info, columns)
+        cache_key = self._cache_key(question, context)
+        with self.timer('cache_lookup'):
+            cached = self.cache.get(cache_key) if cache_key and use_cache else None
+        if cached is not None:
+            outcome['proposals'] = cached
+            return outcome, context, None, cache_key
+
+        with self.timer('prompt_render'):
+            payload, outcome['prompt_tokens'] = self._build_payload(question, context)
+        return outcome, context, payload, cache_key
+
+    def _complete(self, outcome, data, cache_key):
+        self._record_usage(data)
+        outcome['proposals'], outcome['raw_response'] = self._handle_completion(data, cache_key)
+
+    def stream_visualization_proposals(self, question, dataset_info, columns, use_cache=True):
+        """Yield ('proposal', proposal) as soon as the streamed completion contains each proposal.
+
+        The last event is ('done', {'error', 'prompt_tokens'}), with what this
+        call reported, like `generate`.
+        """
+        outcome = {'error': None, 'prompt_tokens': None}
+        with self.timer('prompt_build'):
+            context = self.prompt_builder.build(question, dataset_info, columns)
+        cache_key = self._cache_key(question, context)
+        with self.timer('cache_lookup'):
+            cached = self.cache.get(cache_key) if cache_key and use_cache else None
+        if cached is not None:
+            for proposal in cached:
+                yield 'proposal', proposal
+            yield 'done', outcome
+            return
+
+        with self.timer('prompt_render'):
+            payload, outcome['prompt_tokens'] = self._build_payload(question, context)
+        parser = ProposalStreamParser()
+        emitted = 0
 
-    def generate_visualization_proposals(self, question, dataset_info, columns):
+        try:
+            # Timed up to the end of the generation, proposals are forwarded meanwhile
+            with self.timer('llm'):
+                for delta in self.client.post_stream(payload, on_usage=self.on_usage):
+                    for proposal in parser.feed(delta):
+                        emitted += 1
+                        yield 'proposal', proposal
+
+            # Whole text available now: same checks and caching as the blocking call
+            proposals, _ = self._handle_completion({"choices": [{"message": {"content": parser.text}}]}, cache_key)
+            if not emitted:
+                for proposal in proposals:
+                    yield 'proposal', proposal
+
+        except Exception as e:
+            outcome['error'] = str(e)
+            if emitted:
+                # Cards already sent stay valid, just report why the rest is missing
+                print("Groq error:", e)
+            else:
+                for proposal in self._fallback(e, context):
+                    yield 'proposal', proposal
+        yield 'done', outcome
+
+    def _cache_key(self, question, context):
+        # Hash what the LLM actually sees, not the full analysis
+        if self.cache is None:
+            return None
+        return self.cache.key(question, context, model=self.model)
+
+    def _build_payload(self, question, context):
         
-        # Identify numeric and categorical columns from dataset_info
-        numeric_cols = list(dataset_info.get('statistics', {}).keys())
-        categorical_cols = list(dataset_info.get('categorical_info', {}).keys())
+        # Numeric and categorical columns kept in the token-budgeted context
+        columns = context['columns']
+        numeric_cols = context['numeric']
+        categorical_cols = context['categorical']
         
         prompt = f"""
 Tu es un expert en data visualisation. Analyse la question de l'utilisateur et propose 3 visualisations différentes et pertinentes.
@@ -38,19 +162,20 @@ QUESTION DE L'UTILISATEUR:
 
 INFORMATIONS SUR LE DATASET:
 Colonnes disponibles: {', '.join(columns)}
-Nombre total de colonnes: {len(columns)}
+Nombre total de colonnes: {len(columns) + context['omitted_count']}
+{context['omitted']}
 
 Variables numériques ({len(numeric_cols)}): {', '.join(numeric_cols)}
 Variables catégorielles ({len(categorical_cols)}): {', '.join(categorical_cols)}
 
 Statistiques descriptives des variables numériques:
-{json.dumps(dataset_info.get('statistics', {}), indent=2)}
+{context['statistics']}
 
 Corrélations entre variables numériques:
-{json.dumps(dataset_info.get('correlations', {}), indent=2)}
+{context['correlations']}
 
-Informations sur les variables catégorielles:
-{json.dumps(dataset_info.get('categorical_info', {}), indent=2)}
+Informations sur les variables catégorielles (valeur (effectif)):
+{context['categorical_info']}
 
 INSTRUCTIONS:
 Analyse attentivement le dataset et la question pour proposer exactement 3 visualisations différentes qui répondent précisément à la question posée.
@@ -221,28 +346,25 @@ Assure-toi que:
             ],
             "temperature": 0.2,
         }
+        return payload, estimate_tokens(prompt)
 
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-        }
-
-        try:
-            response = requests.post(self.endpoint, headers=headers, json=payload, timeout=60)
-            response.raise_for_status()
+    def _record_usage(self, data):
+        usage = data.get("usage") if isinstance(data, dict) else None
+        if usage and self.on_usage is not None:
+            self.on_usage(usage)
 
-            data = response.json()
+    def _handle_completion(self, data, cache_key):
+        response_text = data["choices"][0]["message"]["content"].strip()
 
-            response_text = data["choices"][0]["message"]["content"].strip()
+        self.last_raw_response = response_text
 
-            self.last_raw_response = response_text
-
-            print("=" * 80)
-            print("RAW GROQ RESPONSE")
-            print("=" * 80)
-            print(response_text)
-            print("=" * 80)
+        print("=" * 80)
+        print("RAW GROQ RESPONSE")
+        print("=" * 80)
+        print(response_text)
+        print("=" * 80)
 
+        with self.timer('extract'):
             # Robust JSON extraction
             match = re.search(r"\{[\s\S]*\}", response_text)
             if not match:
@@ -251,39 +373,50 @@ Assure-toi que:
             json_str = match.group(0)
             proposals = json.loads(json_str)
 
-            if "propositions" not in proposals:
-                raise ValueError("Missing 'propositions'")
+        if "propositions" not in proposals:
+            raise ValueError("Missing 'propositions'")
 
-            return proposals["propositions"]
+        if cache_key is not None:
+            self.cache.put(cache_key, proposals["propositions"])
 
-        except Exception as e:
-            print("Groq error:", e)
-            return self._get_default_proposals()
+        return proposals["propositions"], response_text
+
+    def _fallback(self, error, context):
+        # Keep the app usable; callers report the error with these default proposals
+        print("Groq error:", error)
+        return self._get_default_proposals(context['numeric'], context['categorical'])
 
     def get_last_raw_response(self):
         return self.last_raw_response
 
-    def _get_default_proposals(self):
-        return [
-            {
-                "id": 1,
+    def _get_default_proposals(self, numeric, categorical):
+        """Generic charts drawn from the dataset's own columns, valid for `validate_proposal`"""
+        proposals = []
+        if len(numeric) >= 2:
+            proposals.append({
+                "id": len(proposals) + 1,
                 "type": "scatter",
                 "title": "Relation entre deux variables principales",
                 "justification": "false",
-                "config": {"x_axis": "auto", "y_axis": "auto"}
-            },
-            {
-                "id": 2,
+                "config": {"x_axis": numeric[0], "y_axis": numeric[1]}
+            })
+        if categorical:
+            config = {"x_axis": categorical[0], "aggregation": "count"}
+            if numeric:
+                config.update(y_axis=numeric[0], aggregation="mean")
+            proposals.append({
+                "id": len(proposals) + 1,
                 "type": "bar",
                 "title": "Comparaison par catégories",
                 "justification": "false",
-                "config": {"aggregation": "mean"}
-            },
-            {
-                "id": 3,
+                "config": config
+            })
+        if len(numeric) >= 2:
+            proposals.append({
+                "id": len(proposals) + 1,
                 "type": "heatmap",
                 "title": "Matrice de corrélation",
                 "justification": "false",
-                "config": {}
-            }
-        ]
\ No newline at end of file
+                "config": {"columns": numeric[:10]}
+            })
+        return proposals
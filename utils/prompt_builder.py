@@ -0,0 +1,129 @@
+import re
+import unicodedata
+
+# Rough size of a token for French/English prose and JSON-ish text
+CHARS_PER_TOKEN = 4
+# Categorical values listed for the most relevant columns, and for the others
+TOP_VALUES = 8
+TOP_VALUES_SHORT = 3
+
+
+def estimate_tokens(text):
+    """Cheap token estimate, no tokenizer needed"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _words(text):
+    text = re.sub(r'([a-z])([A-Z])', r'\1 \2', str(text))
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return [w for w in re.split(r'[^a-z0-9]+', text) if w]
+
+
+def _num(value):
+    return 'NA' if value is None else f'{value:.4g}'
+
+
+class PromptBuilder:
+    """Dataset context for the LLM prompt, sized to a token budget.
+
+    Columns are ranked by relevance to the question (name matches first,
+    then correlation strength) and described compactly, one line each, in
+    that order until `token_budget` is used up. Columns that do not fit are
+    listed by name only, or just counted when even the names do not fit, so
+    the prompt stops growing with the width of the dataset.
+    """
+
+    def __init__(self, token_budget=2000):
+        self.token_budget = token_budget
+
+    def rank_columns(self, question, dataset_info, columns):
+        question_words = set(_words(question))
+        question_text = ' '.join(_words(question))
+
+        strength = {}
+        for corr in dataset_info.get('correlations', []):
+            for col in (corr['var1'], corr['var2']):
+                strength[col] = max(strength.get(col, 0.0), abs(corr['correlation']))
+
+        def score(col):
+            name = 0
+            # The whole name, numbers included, so "groupe 42" is not "groupe 4"
+            if f" {' '.join(_words(col))} " in f' {question_text} ':
+                name += 2
+            words = [w for w in _words(col) if len(w) >= 3]
+            for word in words:
+                # Prefix match so "prix"/"price" still finds "prices", "prix_m2"...
+                if any(q.startswith(word) or word.startswith(q) for q in question_words if len(q) >= 4):
+                    name += 1
+            return name, strength.get(col, 0.0)
+
+        order = {col: i for i, col in enumerate(columns)}
+        ranked = sorted(columns, key=lambda col: (score(col), -order[col]), reverse=True)
+        return ranked, {col: score(col)[0] > 0 for col in columns}
+
+    def build(self, question, dataset_info, columns):
+        """Return the compact context sections plus what was kept and its estimated size"""
+        statistics = dataset_info.get('statistics', {})
+        categorical_info = dataset_info.get('categorical_info', {})
+        ranked, mentioned = self.rank_columns(question, dataset_info, columns)
+
+        # Room for the note counting the columns left out, whatever their number
+        reserved = estimate_tokens(f"{len(columns)} autres colonnes moins pertinentes omises")
+        pairs = [(c['var1'], c['var2'], f"{c['var1']} ~ {c['var2']}: {c['correlation']:.2f}")
+                 for c in dataset_info.get('correlations', [])]
+        used = 0
+        kept = []
+        lines = {}
+        correlations = []
+        for col in ranked:
+            line = self._describe(col, statistics, categorical_info, mentioned[col] or len(kept) < 5)
+            # The same relations, restricted to described columns, in the same compact form
+            relations = [text for a, b, text in pairs
+                         if (a == col and b in lines) or (b == col and a in lines)]
+            cost = sum(estimate_tokens(text) + 1 for text in [line] + relations)
+            if used + cost + reserved > self.token_budget:
+                break
+            lines[col] = line
+            kept.append(col)
+            correlations.extend(relations)
+            used += cost
+
+        kept_set = set(kept)
+        omitted = [col for col in columns if col not in kept_set]
+        if omitted:
+            omitted_text = f"Autres colonnes ({len(omitted)}, sans détail): {', '.join(omitted)}"
+            if used + estimate_tokens(omitted_text) > self.token_budget:
+                omitted_text = f"{len(omitted)} autres colonnes moins pertinentes omises"
+        else:
+            omitted_text = ''
+        used += estimate_tokens(omitted_text)
+
+        kept = [col for col in columns if col in kept_set]
+        return {
+            'columns': kept,
+            'numeric': [col for col in kept if col in statistics],
+            'categorical': [col for col in kept if col in categorical_info],
+            'statistics': '\n'.join(lines[col] for col in kept if col in statistics),
+            'categorical_info': '\n'.join(lines[col] for col in kept if col in categorical_info),
+            'correlations': '\n'.join(correlations),
+            'omitted': omitted_text,
+            'omitted_count': len(omitted),
+            'estimated_tokens': used
+        }
+
+    @staticmethod
+    def _describe(col, statistics, categorical_info, detailed):
+        if col in statistics:
+            s = statistics[col]
+            return (f"{col}: moy={_num(s.get('mean'))} med={_num(s.get('median'))} "
+                    f"min={_num(s.get('min'))} max={_num(s.get('max'))} std={_num(s.get('std'))}")
+        if col in categorical_info:
+            info = categorical_info[col]
+            counts = info.get('value_counts') or info.get('top_20_values') or {}
+            limit = TOP_VALUES if detailed else TOP_VALUES_SHORT
+            values = ', '.join(f'{k} ({v})' for k, v in list(counts.items())[:limit])
+            more = info.get('unique_count', len(counts)) - min(limit, len(counts))
+            suffix = f', +{more} autres' if more > 0 else ''
+            return f"{col} [{info.get('unique_count', len(counts))} valeurs]: {values}{suffix}"
+        return f"{col}"
@@ -0,0 +1,141 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+
+class ProposalCache:
+    """Two-tier cache of LLM visualization proposals.
+
+    Keys combine the normalized question with a hash of the dataset context
+    sent in the prompt, so the same question on the same schema/statistics is
+    answered without calling the LLM. A bounded in-memory LRU sits in front of
+    a JSON-file tier that survives restarts; entries expire after `ttl`
+    seconds. Expired files are deleted when read, and every write prunes the
+    file tier down to at most `max_files` unexpired files.
+    """
+
+    def __init__(self, folder, max_entries=256, ttl=7 * 24 * 3600, max_files=4096):
+        self.folder = folder
+        self.max_entries = max_entries
+        self.max_files = max_files
+        self.ttl = ttl
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        os.makedirs(folder, exist_ok=True)
+        self.prune()
+
+    @staticmethod
+    def normalize_question(question):
+        """Case, accents, punctuation and spacing do not change what is asked"""
+        text = unicodedata.normalize('NFKD', question.lower())
+        text = ''.join(c for c in text if not unicodedata.combining(c))
+        text = re.sub(r'[^\w\s]', ' ', text)
+        return ' '.join(text.split())
+
+    def key(self, question, context, model=None):
+        context_hash = hashlib.sha256(
+            json.dumps(context, sort_keys=True, default=str).encode()
+        ).hexdigest()
+        raw = f'{model}\n{self.normalize_question(question)}\n{context_hash}'
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.folder, f'{key}.json')
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry['created'] <= self.ttl:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry['proposals']
+            self._memory.pop(key, None)
+
+        try:
+            with open(self._path(key), encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            entry = None
+
+        with self._lock:
+            if entry is None or now - entry['created'] > self.ttl:
+                self.misses += 1
+                if entry is not None:
+                    self._remove(key)
+                return None
+            self._remember(key, entry)
+            self.hits += 1
+            self.disk_hits += 1
+            return entry['proposals']
+
+    def put(self, key, proposals):
+        entry = {'created': time.time(), 'proposals': proposals}
+        with self._lock:
+            self._remember(key, entry)
+        path = self._path(key)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        self.prune()
+
+    def prune(self):
+        """Delete expired files, then the oldest ones beyond `max_files`"""
+        now = time.time()
+        files = []
+        for name in os.listdir(self.folder):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.folder, name)
+            try:
+                files.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+        files.sort()
+        expired = sum(1 for created, _ in files if now - created > self.ttl)
+        for _, path in files[:max(expired, len(files) - self.max_files)]:
+            self._remove_file(path)
+
+    def _remove(self, key):
+        self._memory.pop(key, None)
+        self._remove_file(self._path(key))
+
+    @staticmethod
+    def _remove_file(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass  # already removed by another worker
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        for name in os.listdir(self.folder):
+            if name.endswith('.json'):
+                os.remove(os.path.join(self.folder, name))
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else None,
+                'memory_entries': len(self._memory)
+            }
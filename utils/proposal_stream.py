@@ -0,0 +1,106 @@
+import json
+
+# Chart types prepare_visualization_data knows how to build
+PROPOSAL_TYPES = {'scatter', 'bar', 'horizontalBar', 'pie', 'box', 'violin', 'line',
+                  'correlationMatrix', 'heatmap'}
+# Config keys each type cannot do without
+REQUIRED_KEYS = {
+    'scatter': ['x_axis', 'y_axis'],
+    'line': ['x_axis', 'y_axis'],
+    'bar': ['x_axis'],
+    'horizontalBar': ['x_axis'],
+    'pie': ['category'],
+    'box': ['category', 'value'],
+    'violin': ['category', 'value']
+}
+COLUMN_KEYS = ('x_axis', 'y_axis', 'category', 'value', 'color_by')
+
+
+class ProposalStreamParser:
+    """Pull proposals out of a JSON completion while it is still being generated.
+
+    Text is fed as it arrives. Once the `"propositions"` array has started,
+    every top-level object in it is returned by `feed` as soon as its closing
+    brace is seen, without waiting for the rest of the document.
+    """
+
+    def __init__(self):
+        self.text = ''
+        self._pos = 0
+        self._in_array = False
+        self._done = False
+        self._depth = 0
+        self._start = None
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk):
+        self.text += chunk
+        if not self._in_array and not self._find_array():
+            return []
+
+        found = []
+        text = self.text
+        while self._pos < len(text) and not self._done:
+            c = text[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == '\\':
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+            elif c == '"':
+                self._in_string = True
+            elif c == '{':
+                if self._depth == 0:
+                    self._start = self._pos
+                self._depth += 1
+            elif c == '}':
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        found.append(json.loads(text[self._start:self._pos + 1]))
+                    except ValueError:
+                        pass
+            elif c == ']' and self._depth == 0:
+                self._done = True
+            self._pos += 1
+        return found
+
+    def _find_array(self):
+        key = self.text.find('"propositions"')
+        if key < 0:
+            return False
+        bracket = self.text.find('[', key)
+        if bracket < 0:
+            return False
+        self._in_array = True
+        self._pos = bracket + 1
+        return True
+
+
+def validate_proposal(proposal, columns):
+    """Return None for a usable proposal, else the reason it cannot be drawn"""
+    if not isinstance(proposal, dict):
+        return 'Proposition invalide'
+    viz_type = proposal.get('type')
+    if viz_type not in PROPOSAL_TYPES:
+        return f'Type de graphique inconnu: {viz_type}'
+    config = proposal.get('config') or {}
+    if not isinstance(config, dict):
+        return 'Configuration invalide'
+
+    for key in REQUIRED_KEYS.get(viz_type, []):
+        if not config.get(key):
+            return f'Paramètre manquant: {key}'
+
+    available = set(columns)
+    for key in COLUMN_KEYS:
+        column = config.get(key)
+        if column and column != 'auto' and column not in available:
+            return f'Colonne inexistante: {column}'
+    for column in config.get('columns') or []:
+        if column not in available:
+            return f'Colonne inexistante: {column}'
+    return None
@@ -0,0 +1,405 @@
+import threading
+from abc import ABC, abstractmethod
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+try:
+    import polars as pl
+except ImportError:  # optional: only needed for the polars engine
+    pl = None
+
+try:
+    import duckdb
+except ImportError:  # optional: only needed for the duckdb engine
+    duckdb = None
+
+AGGREGATIONS = ('count', 'sum', 'mean', 'min', 'max')
+
+
+class AggregationPlan:
+    """One aggregation per category, then the categories kept and their order.
+
+    With `value=None` the rows of each category are counted, like
+    `value_counts()`; otherwise `aggregation` of `value` is taken over the
+    rows where both columns are present. The `limit` largest groups are kept
+    (smallest with order='asc'), then sorted by value or by category.
+    Engines only run the aggregation; keeping and sorting the groups is done
+    here, on at most a few thousand rows.
+    """
+
+    def __init__(self, key, value=None, aggregation='count', limit=None, order='desc', sort_by='value'):
+        self.key = key
+        self.value = value
+        self.aggregation = aggregation
+        self.limit = limit
+        self.order = order
+        self.sort_by = sort_by
+
+    def cache_key(self):
+        return ('aggregate', self.key, self.value, self.aggregation)
+
+    def select(self, grouped):
+        """The `limit` top groups of an aggregated Series"""
+        if self.limit is not None and len(grouped) > self.limit:
+            if self.order == 'asc':
+                # For "worst", "bottom", "lowest"
+                return grouped.nsmallest(self.limit)
+            # For "top", "best", "highest" (default)
+            return grouped.nlargest(self.limit)
+        return grouped
+
+    def rows(self, grouped, cast=float):
+        """(category label, value) pairs in display order"""
+        rows = [(str(cat), cast(val)) for cat, val in grouped.items()]
+        if self.sort_by == 'value':
+            rows.sort(key=lambda row: row[1], reverse=self.order == 'desc')
+        elif self.sort_by == 'category':
+            rows.sort(key=lambda row: row[0])
+        return rows
+
+
+def compile_plan(viz_type, config, columns, numeric_columns):
+    """Aggregation plan of a bar, horizontalBar or pie config; returns (plan, error)"""
+    order = config.get('order', 'desc')
+    sort_by = config.get('sort_by', 'value')
+    aggregation = config.get('aggregation', 'count')
+
+    if viz_type == 'pie':
+        category = config.get('category')
+        value = config.get('value', None)
+        if not category or category not in columns:
+            return None, f'Column {category} not found in dataset'
+        limit = config.get('limit', 10)
+        if not value or aggregation == 'count':
+            return AggregationPlan(category, None, 'count', limit, order, sort_by), None
+        if value not in columns:
+            return None, f'Column {value} not found in dataset'
+        return AggregationPlan(category, value, 'mean' if aggregation == 'mean' else 'sum',
+                               limit, order, sort_by), None
+
+    x_axis = config.get('x_axis')
+    y_axis = config.get('y_axis')
+    # Use limit if specified, otherwise use max_categories
+    limit = config.get('limit', None) or config.get('max_categories', 15)
+    if not x_axis or x_axis not in columns:
+        return None, f'Column {x_axis} not found in dataset'
+
+    if not y_axis or y_axis not in columns:
+        if aggregation == 'count' or not y_axis:
+            return AggregationPlan(x_axis, None, 'count', limit, order, sort_by), None
+        # Need numeric column for aggregation
+        if not numeric_columns:
+            return None, 'No numeric column found for aggregation'
+        y_axis = numeric_columns[0]
+
+    # Unknown aggregations fall back to the mean
+    method = aggregation if aggregation in AGGREGATIONS else 'mean'
+    return AggregationPlan(x_axis, y_axis, method, limit, order, sort_by), None
+
+
+def _shared(shared, key, compute):
+    if shared is None:
+        return compute()
+    return shared.get(key, compute)
+
+
+class PandasEngine:
+    """Eager pandas on the in-memory frame: the reference every engine matches"""
+
+    name = 'pandas'
+    reads_files = False
+
+    def aggregate(self, df, plan, shared=None, source=None):
+        """`plan`'s aggregation as a Series indexed by category"""
+        key, value = plan.key, plan.value
+        if value is None:
+            return _shared(shared, ('value_counts', key), lambda: df[key].value_counts())
+
+        def group():
+            df_clean = _shared(shared, ('dropna', key, value), lambda: df[[key, value]].dropna())
+            grouped = df_clean.groupby(key, observed=True)[value]
+            # Build the group index now, so threads sharing it only read it
+            grouped.ngroups
+            return grouped
+
+        def aggregate():
+            grouped = _shared(shared, ('groupby', key, value), group)
+            return getattr(grouped, plan.aggregation)()
+
+        return _shared(shared, plan.cache_key(), aggregate)
+
+
+class ColumnarEngine(ABC):
+    """Base of the engines that aggregate Arrow columns outside of pandas.
+
+    The key and value columns are handed over as an Arrow table (`k`, `v`
+    and, when counting rows, the row position `r` whose minimum orders
+    groups like `value_counts()` does), and the per-group results come back
+    as arrays rebuilt into the Series pandas would have returned: same
+    groups, same order, same dtypes. Categorical keys are sent as their
+    integer codes. Columns of other dtypes (datetimes, nullable extension
+    types, mixed objects) are left to pandas, and so are row counts of a
+    categorical, which pandas already does in one bincount of the codes.
+    Float sums and means are only run for the dtypes in `float_sums`, those
+    the engine sums bit for bit like pandas.
+    """
+
+    reads_files = False
+    float_sums = ()
+
+    def __init__(self):
+        self.fallback = PandasEngine()
+
+    def aggregate(self, df, plan, shared=None, source=None):
+        if not self.supports(df, plan):
+            return self.fallback.aggregate(df, plan, shared)
+        return _shared(shared, plan.cache_key(), lambda: self._aggregate(df, plan, shared, source))
+
+    def supports(self, df, plan):
+        key = df[plan.key]
+        if isinstance(key.dtype, pd.CategoricalDtype):
+            if plan.value is None:
+                return False
+        elif key.dtype == object:
+            if pd.api.types.infer_dtype(key, skipna=True) not in ('string', 'empty'):
+                return False
+        elif not (isinstance(key.dtype, np.dtype) and key.dtype.kind in 'biuf'):
+            return False
+
+        if plan.value is None:
+            return True
+        if plan.value == plan.key:
+            # pandas refuses to group a column by itself
+            return False
+        if plan.aggregation == 'count':
+            return True
+        value = df[plan.value].dtype
+        if not (isinstance(value, np.dtype) and value.kind in 'iuf'):
+            return False
+        return value.kind != 'f' or plan.aggregation not in ('sum', 'mean') or value in self.float_sums
+
+    def _aggregate(self, df, plan, shared, source):
+        keys, values, first = self.run(self._table(df, plan), plan)
+        return self._series(df, plan, keys, values, first)
+
+    def _table(self, df, plan):
+        """Arrow table of the plan's columns, with the row positions when they order the result"""
+        key = df[plan.key]
+        if isinstance(key.dtype, pd.CategoricalDtype):
+            codes = key.cat.codes.to_numpy()
+            columns = {'k': pa.array(codes, mask=codes < 0)}
+        else:
+            columns = {'k': pa.array(key, from_pandas=True)}
+        if plan.value is not None:
+            value = df[plan.value]
+            if not (isinstance(value.dtype, np.dtype) and value.dtype.kind in 'iuf'):
+                # Counting only needs to know which values are present
+                value = np.where(value.notna(), 1.0, np.nan)
+            columns['v'] = pa.array(value, from_pandas=True)
+        else:
+            columns['r'] = pa.array(np.arange(len(df), dtype=np.int64))
+        return pa.table(columns)
+
+    @abstractmethod
+    def run(self, table, plan):
+        """(keys, values, first positions) of every group of `table`"""
+
+    def _series(self, df, plan, keys, values, first):
+        column = df[plan.key]
+        categorical = isinstance(column.dtype, pd.CategoricalDtype)
+        if categorical:
+            categories = column.cat.categories
+            codes = np.asarray(keys)
+            if codes.dtype.kind not in 'iu':
+                # Read back from a file as the category values themselves
+                codes = categories.get_indexer(keys)
+                if (codes < 0).any():
+                    raise ValueError(f'Unknown categories in column {plan.key}')
+            codes = codes.astype(np.int64)
+
+        if plan.value is None:
+            # value_counts(): groups by first occurrence, then sorted by count
+            order = np.argsort(first, kind='stable')
+            counts = np.asarray(values, dtype=np.int64)[order]
+            index = pd.Index(self._keys(column, keys)[order], name=plan.key)
+            return pd.Series(counts, index=index, name='count').sort_values(ascending=False)
+
+        # groupby(observed=True): present groups sorted by key
+        if categorical:
+            order = np.argsort(codes, kind='stable')
+            index = pd.CategoricalIndex(pd.Categorical.from_codes(codes[order], dtype=column.dtype),
+                                        name=plan.key)
+        else:
+            index = pd.Index(self._keys(column, keys), name=plan.key)
+            order = index.argsort()
+            index = index[order]
+        values = np.asarray(values)[order].astype(self._dtype(df, plan), copy=False)
+        return pd.Series(values, index=index, name=plan.value)
+
+    def _keys(self, column, keys):
+        keys = np.asarray(keys)
+        if column.dtype == object:
+            return keys.astype(object)
+        return keys.astype(column.dtype)
+
+    def _dtype(self, df, plan):
+        value = df[plan.value].dtype
+        if plan.aggregation == 'count':
+            return np.int64
+        if value.kind == 'f':
+            # Float sums and means keep the column's width, like in pandas
+            return value
+        if plan.aggregation == 'mean':
+            return np.float64
+        if plan.aggregation == 'sum':
+            return np.uint64 if value.kind == 'u' else np.int64
+        return value
+
+
+class PolarsEngine(ColumnarEngine):
+    """Multithreaded Polars group-by over the in-memory columns.
+
+    Keys, counts, minima and maxima are identical to pandas. Polars sums
+    floats without compensation, so float sums and means, which would differ
+    from pandas' in the last bits, are left to pandas.
+    """
+
+    name = 'polars'
+
+    def __init__(self):
+        if pl is None:
+            raise ValueError('The polars query engine needs the polars package')
+        super().__init__()
+
+    def run(self, table, plan):
+        frame = pl.from_arrow(table)
+        present = pl.col('k').is_not_null()
+        if plan.value is not None:
+            present = present & pl.col('v').is_not_null()
+            aggregate = getattr(pl.col('v'), plan.aggregation)().alias('v')
+        else:
+            aggregate = pl.len().alias('v')
+        aggregates = [aggregate]
+        if 'r' in table.column_names:
+            aggregates.append(pl.col('r').min().alias('r'))
+        result = frame.filter(present).group_by('k').agg(aggregates)
+        first = result['r'].to_numpy() if 'r' in result.columns else None
+        return result['k'].to_numpy(), result['v'].to_numpy(), first
+
+
+class DuckDBEngine(ColumnarEngine):
+    """Embedded DuckDB SQL, over the stored dataset file when one is given.
+
+    With a `source` path a dataset is aggregated straight from its Parquet
+    file (or its memory-mapped Arrow file) instead of the in-memory frame,
+    so only the key and value columns are ever scanned. float64 sums and
+    means use DuckDB's compensated `fsum`, which gives pandas' values;
+    pandas sums float32 columns in float32, so those are left to it.
+    """
+
+    name = 'duckdb'
+    reads_files = True
+    float_sums = (np.dtype(np.float64),)
+
+    SQL_AGGREGATES = {
+        'count': 'count(v)',
+        'sum': 'fsum(v)',
+        'mean': 'fsum(v) / count(v)',
+        'min': 'min(v)',
+        'max': 'max(v)'
+    }
+
+    def __init__(self):
+        if duckdb is None:
+            raise ValueError('The duckdb query engine needs the duckdb package')
+        super().__init__()
+        self._connection = duckdb.connect()
+        self._lock = threading.Lock()
+
+    def _aggregate(self, df, plan, shared, source):
+        if source is not None:
+            try:
+                keys, values, first = self._run_file(source, df, plan)
+                return self._series(df, plan, keys, values, first)
+            except (duckdb.Error, OSError, ValueError):
+                # Unreadable or unexpected file: aggregate the frame instead
+                pass
+        return super()._aggregate(df, plan, shared, source)
+
+    def run(self, table, plan, relation='t'):
+        sql = self._sql(plan, table.schema.field('v').type if plan.value else None,
+                        'r' in table.column_names, relation)
+        with self._lock:
+            cursor = self._connection.cursor()
+        try:
+            cursor.register(relation, table)
+            return self._fetch(cursor.execute(sql))
+        finally:
+            cursor.close()
+
+    def _run_file(self, source, df, plan):
+        columns = [plan.key] + ([plan.value] if plan.value is not None else [])
+        if source.endswith('.arrow'):
+            # Mapped, not read: DuckDB scans the OS cache pages directly
+            table = pa.ipc.open_file(pa.memory_map(source)).read_all().select(columns)
+            names = ['k', 'v'][:len(columns)]
+            table = table.rename_columns(names)
+            if plan.value is None:
+                table = table.append_column('r', pa.array(np.arange(len(table), dtype=np.int64)))
+            return self.run(table, plan)
+
+        positions = plan.value is None
+        select = [f'{_quote(plan.key)} AS k']
+        if plan.value is not None:
+            select.append(f'{_quote(plan.value)} AS v')
+        if positions:
+            select.append('file_row_number AS r')
+        scan = f"(SELECT {', '.join(select)} FROM read_parquet($path, file_row_number = true))"
+        value = df[plan.value].dtype if plan.value else None
+        value_type = pa.from_numpy_dtype(value) if isinstance(value, np.dtype) and value.kind in 'iuf' else None
+        with self._lock:
+            cursor = self._connection.cursor()
+        try:
+            return self._fetch(cursor.execute(self._sql(plan, value_type, positions, scan), {'path': source}))
+        finally:
+            cursor.close()
+
+    def _sql(self, plan, value_type, positions, relation):
+        where = 'k IS NOT NULL'
+        if plan.value is None:
+            aggregate = 'count(*)'
+        else:
+            where += ' AND v IS NOT NULL'
+            if plan.aggregation == 'sum' and value_type is not None and pa.types.is_integer(value_type):
+                # Integer sums stay exact integers, like in pandas
+                aggregate = 'CAST(sum(v) AS BIGINT)'
+            else:
+                aggregate = self.SQL_AGGREGATES[plan.aggregation]
+        first = ', min(r) AS r' if positions else ''
+        return f'SELECT k, {aggregate} AS v{first} FROM {relation} WHERE {where} GROUP BY k'
+
+    def _fetch(self, result):
+        table = result.to_arrow_table()
+        first = table['r'].to_numpy() if 'r' in table.column_names else None
+        return (table['k'].to_numpy(zero_copy_only=False), table['v'].to_numpy(zero_copy_only=False),
+                first)
+
+
+def _quote(column):
+    return '"' + str(column).replace('"', '""') + '"'
+
+
+ENGINES = {
+    'pandas': PandasEngine,
+    'polars': PolarsEngine,
+    'duckdb': DuckDBEngine
+}
+
+
+def create_engine(name):
+    """Query engine by name: pandas, polars or duckdb"""
+    if name not in ENGINES:
+        raise ValueError(f'Unknown query engine: {name}')
+    return ENGINES[name]()
@@ -0,0 +1,61 @@
+import json
+import sqlite3
+import time
+
+
+class DatasetRegistry:
+    """Cross-process index of the stored datasets and of upload jobs.
+
+    A small SQLite file next to the datasets, so every worker process of a
+    multi-process server sees the same uploads: whichever worker ingested a
+    dataset, the others find it here and map its files. Upload job states are
+    mirrored too, so progress can be polled from any worker. Each call opens
+    its own short-lived connection, which keeps it safe across threads and
+    forked processes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._query('PRAGMA journal_mode=WAL')
+        self._query('CREATE TABLE IF NOT EXISTS datasets (id TEXT PRIMARY KEY, version TEXT, created REAL)')
+        self._query('CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, state TEXT, updated REAL)')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _query(self, sql, params=()):
+        db = self._connect()
+        try:
+            with db:
+                return db.execute(sql, params).fetchall()
+        finally:
+            db.close()
+
+    def register(self, dataset_id, version, created=None):
+        self._query('INSERT OR REPLACE INTO datasets VALUES (?, ?, ?)',
+                    (dataset_id, version, created or time.time()))
+
+    def remove(self, dataset_id):
+        self._query('DELETE FROM datasets WHERE id = ?', (dataset_id,))
+
+    def exists(self, dataset_id):
+        return bool(self._query('SELECT 1 FROM datasets WHERE id = ?', (dataset_id,)))
+
+    def latest(self):
+        """Most recently registered dataset ID, or None"""
+        rows = self._query('SELECT id FROM datasets ORDER BY created DESC LIMIT 1')
+        return rows[0][0] if rows else None
+
+    def ids(self):
+        return [row[0] for row in self._query('SELECT id FROM datasets ORDER BY created')]
+
+    def save_job(self, job_id, state):
+        self._query('INSERT OR REPLACE INTO jobs VALUES (?, ?, ?)', (job_id, json.dumps(state), time.time()))
+
+    def load_job(self, job_id):
+        rows = self._query('SELECT state FROM jobs WHERE id = ?', (job_id,))
+        return json.loads(rows[0][0]) if rows else None
+
+    def forget_jobs(self, older_than):
+        """Drop job states last updated more than `older_than` seconds ago"""
+        self._query('DELETE FROM jobs WHERE updated < ?', (time.time() - older_than,))
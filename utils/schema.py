@@ -0,0 +1,148 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+# A text column becomes `category` when at most this share of its values are distinct
+CATEGORY_MAX_RATIO = 0.5
+# Share of a sampled text column that must parse as dates to treat it as datetime
+DATETIME_MIN_RATIO = 0.9
+
+
+def infer_schema(df, downcast=True):
+    """Decide a compact dtype and a kind for every column of `df`.
+
+    Kinds are 'numeric', 'boolean', 'datetime', 'categorical' and 'text'.
+    With `downcast`, integers get the smallest width holding their range.
+    Floats stay float64: charts sum and average them, and float32 sums drift
+    from the exact ones (responses are narrowed on the wire instead).
+    Chunked ingestion infers on the first chunk and widens with `fit_schema`,
+    so it passes downcast=False: a later chunk may not fit narrow widths.
+    """
+    schema = {}
+    for col in df.columns:
+        column = df[col]
+        dtype = column.dtype
+
+        if pd.api.types.is_bool_dtype(dtype):
+            schema[col] = {'kind': 'boolean', 'dtype': 'bool'}
+        elif pd.api.types.is_datetime64_any_dtype(dtype):
+            schema[col] = {'kind': 'datetime', 'dtype': 'datetime64[ns]'}
+        elif pd.api.types.is_numeric_dtype(dtype):
+            target = str(dtype)
+            if downcast:
+                target = str(_downcast(column).dtype)
+            schema[col] = {'kind': 'numeric', 'dtype': target}
+        elif isinstance(dtype, pd.CategoricalDtype):
+            schema[col] = {'kind': 'categorical', 'dtype': 'category'}
+        else:
+            values = column.dropna()
+            if len(values) and looks_like_dates(values):
+                schema[col] = {'kind': 'datetime', 'dtype': 'datetime64[ns]'}
+            elif len(values) and values.nunique() <= CATEGORY_MAX_RATIO * len(values):
+                schema[col] = {'kind': 'categorical', 'dtype': 'category'}
+            else:
+                schema[col] = {'kind': 'text', 'dtype': 'object'}
+        schema[col]['source_dtype'] = str(dtype)
+    return schema
+
+
+def fit_schema(chunk, schema):
+    """`schema` widened wherever the values of `chunk` do not fit it.
+
+    Integer columns holding blanks or decimals become float64, and numeric
+    or boolean columns holding text take the kind inferred for the chunk
+    (categorical or text). Returns the schema and the columns whose kind changed.
+    """
+    fitted = dict(schema)
+    changed = []
+    for col, spec in schema.items():
+        if col not in chunk.columns:
+            continue
+        column = chunk[col]
+        if spec['kind'] == 'numeric':
+            values = column if pd.api.types.is_numeric_dtype(column.dtype) else pd.to_numeric(column, errors='coerce')
+            if values.count() == column.count():
+                if pd.api.types.is_integer_dtype(spec['dtype']) and not pd.api.types.is_integer_dtype(values.dtype):
+                    fitted[col] = dict(spec, dtype='float64')
+                continue
+        elif spec['kind'] == 'boolean':
+            if pd.api.types.is_bool_dtype(column.dtype) or pd.api.types.infer_dtype(column, skipna=True) in ('boolean', 'empty'):
+                continue
+        else:
+            continue
+
+        widened = infer_schema(chunk[[col]].astype(object), downcast=False)[col]
+        if widened['kind'] not in ('categorical', 'text'):
+            widened = {'kind': 'text', 'dtype': 'object'}
+        fitted[col] = dict(widened, source_dtype=spec['source_dtype'])
+        changed.append(col)
+    return fitted, changed
+
+
+def apply_schema(df, schema, categories=True):
+    """Convert `df` to the dtypes of `schema`; columns already converted are left alone.
+
+    Chunked ingestion passes categories=False: every chunk would otherwise get
+    its own category set, so text stays text on disk and becomes `category`
+    when the dataset is loaded.
+    """
+    converted = {}
+    for col, spec in schema.items():
+        if col not in df.columns or str(df[col].dtype) == spec['dtype']:
+            continue
+        column = df[col]
+        if spec['kind'] == 'datetime':
+            converted[col] = parse_dates(column)
+        elif spec['kind'] in ('categorical', 'text'):
+            if pd.api.types.is_numeric_dtype(column.dtype):
+                # A chunk of a text column holding only numbers, or one widened to text
+                column = as_text(column)
+                converted[col] = column
+            if categories and spec['kind'] == 'categorical':
+                converted[col] = column.astype('category')
+        elif spec['kind'] == 'numeric':
+            converted[col] = pd.to_numeric(column, errors='coerce').astype(spec['dtype'])
+    if not converted:
+        return df
+    df = df.copy(deep=False)
+    for col, column in converted.items():
+        df[col] = column
+    return df
+
+
+def columns_of_kind(df, schema, *kinds):
+    """Columns of `df` whose schema kind is one of `kinds`, falling back to dtypes without a schema"""
+    if schema is None:
+        if 'numeric' in kinds:
+            return df.select_dtypes(include=[np.number]).columns.tolist()
+        return df.select_dtypes(include=['object', 'category', 'bool']).columns.tolist()
+    return [col for col in df.columns if col in schema and schema[col]['kind'] in kinds]
+
+
+def as_text(column):
+    """Numbers or booleans as strings, formatted like Arrow casts the ones already stored"""
+    text = pa.array(column, from_pandas=True).cast(pa.string())
+    return pd.Series(text.to_numpy(zero_copy_only=False), index=column.index, name=column.name)
+
+
+def _downcast(column):
+    if pd.api.types.is_integer_dtype(column.dtype):
+        return pd.to_numeric(column, downcast='integer')
+    return column
+
+
+def looks_like_dates(values):
+    sample = values.head(100).astype(str)
+    # Plain numbers parse as dates too, they are not what we are after
+    if pd.to_numeric(sample, errors='coerce').notna().mean() >= DATETIME_MIN_RATIO:
+        return False
+    parsed = pd.to_datetime(sample, errors='coerce', format='mixed')
+    return parsed.notna().mean() >= DATETIME_MIN_RATIO
+
+
+def parse_dates(column):
+    # Let pandas infer a single format first: much faster than per-value parsing
+    parsed = pd.to_datetime(column, errors='coerce')
+    if parsed.isna().sum() > column.isna().sum():
+        parsed = pd.to_datetime(column, errors='coerce', format='mixed')
+    return parsed
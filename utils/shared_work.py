@@ -0,0 +1,41 @@
+import threading
+
+
+class SharedWork:
+    """Intermediate results shared by the charts of one batch.
+
+    Charts prepared from the same DataFrame often repeat the same steps
+    (numeric column selection, dropna on a column pair, a groupby key, a
+    correlation matrix). `get` computes each key once, even when several
+    threads ask for it at the same time; the others wait for that result.
+    Cached values are shared, so callers must not modify them in place.
+    """
+
+    def __init__(self):
+        self._values = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, compute):
+        with self._lock:
+            if key in self._values:
+                self.hits += 1
+                return self._values[key]
+            key_lock = self._locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                if key in self._values:
+                    self.hits += 1
+                    return self._values[key]
+            value = compute()
+            with self._lock:
+                self._values[key] = value
+                self.misses += 1
+            return value
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'computed': self.misses}
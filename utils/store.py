@@ -0,0 +1,226 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from utils.cube import GroupCube
+
+
+class DatasetStore:
+    """In-memory datasets keyed by dataset ID, bounded by a RAM budget.
+
+    Every dataset is persisted once through `persistence` (Parquet in the data
+    folder). Entries track the DataFrame's deep memory usage; when the
+    resident total goes over `memory_budget` bytes the least recently used
+    datasets are dropped from memory and transparently reloaded from disk on
+    their next access. Datasets already on disk are picked up at start-up.
+
+    With a `registry` shared by several worker processes, datasets stored by
+    one process are picked up by the others on first use, and removals and
+    the latest upload are seen by all of them. A dataset found in the
+    registry is trusted for `registry_ttl` seconds (or until evicted), so the
+    accessors of one request do not each query it.
+    """
+
+    def __init__(self, persistence, memory_budget=1024 * 1024 * 1024, registry=None, registry_ttl=1.0):
+        self.persistence = persistence
+        self.memory_budget = memory_budget
+        self.registry = registry
+        self.registry_ttl = registry_ttl
+        self._latest_id = None
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self._load_persisted()
+
+    def _load_persisted(self):
+        registered = set(self.registry.ids()) if self.registry is not None else set()
+        for dataset_id in self.persistence.list():
+            meta = self.persistence.load_meta(dataset_id)
+            self._entries[dataset_id] = self._entry(None, meta)
+            self._latest_id = dataset_id
+            if self.registry is not None and dataset_id not in registered:
+                self.registry.register(dataset_id, meta.get('version'), self.persistence.created(dataset_id))
+
+    @property
+    def latest_id(self):
+        if self.registry is not None:
+            return self.registry.latest()
+        return self._latest_id
+
+    def _lookup(self, dataset_id):
+        """Entry of a dataset, picking up one stored by another process; None if unknown"""
+        with self._lock:
+            entry = self._entries.get(dataset_id)
+        if self.registry is None:
+            return entry
+        now = time.time()
+        if entry is not None and now - entry['checked'] < self.registry_ttl:
+            return entry
+        if entry is not None:
+            # Another worker may have built the cube meanwhile
+            entry['cube_missing'] = False
+        if not self.registry.exists(dataset_id):
+            # Removed by another process
+            if entry is not None:
+                with self._lock:
+                    self._entries.pop(dataset_id, None)
+            return None
+        if entry is None:
+            meta = self.persistence.load_meta(dataset_id)
+            if meta is None:
+                return None
+            with self._lock:
+                entry = self._entries.setdefault(dataset_id, self._entry(None, meta))
+        entry['checked'] = now
+        return entry
+
+    @staticmethod
+    def _entry(df, meta):
+        return {
+            'df': df,
+            'version': meta.get('version'),
+            'schema': meta.get('schema'),
+            'columns': meta.get('columns'),
+            'nbytes': meta.get('nbytes', 0),
+            'cube': None,
+            # No cube on disk at the last look: not looked for again until one is put
+            'cube_missing': False,
+            'last_access': time.time(),
+            # When the registry last confirmed the dataset
+            'checked': 0
+        }
+
+    @staticmethod
+    def new_id():
+        return uuid.uuid4().hex
+
+    def put(self, df, version=None, analysis=None, schema=None, dataset_id=None):
+        """Persist and register a new dataset, returning its ID"""
+        dataset_id = dataset_id or self.new_id()
+        self.persistence.save(dataset_id, df, version=version, analysis=analysis, schema=schema)
+        with self._lock:
+            self._entries[dataset_id] = self._entry(df, self.persistence.load_meta(dataset_id))
+            self._latest_id = dataset_id
+            self._evict(keep=dataset_id)
+        if self.registry is not None:
+            self.registry.register(dataset_id, version)
+        return dataset_id
+
+    def add_persisted(self, dataset_id):
+        """Register a dataset that was written to disk directly (chunked ingestion)"""
+        meta = self.persistence.load_meta(dataset_id)
+        with self._lock:
+            self._entries[dataset_id] = self._entry(None, meta)
+            self._latest_id = dataset_id
+        if self.registry is not None:
+            self.registry.register(dataset_id, meta.get('version'))
+        return dataset_id
+
+    def get(self, dataset_id, columns=None):
+        """Return the DataFrame for `dataset_id`.
+
+        A resident dataset is returned as is. Otherwise, when `columns` is
+        given only those columns are read from disk (without making the
+        dataset resident); without `columns` the whole dataset is reloaded.
+        """
+        entry = self._lookup(dataset_id)
+        if entry is None:
+            return None
+        with self._lock:
+            entry['last_access'] = time.time()
+            if dataset_id in self._entries:
+                self._entries.move_to_end(dataset_id)
+            if entry['df'] is not None:
+                return entry['df']
+
+        if columns is not None:
+            return self.persistence.load(dataset_id, columns=list(columns))
+
+        df = self.persistence.load(dataset_id)
+        with self._lock:
+            entry['df'] = df
+            entry['nbytes'] = int(df.memory_usage(deep=True).sum())
+            self._evict(keep=dataset_id)
+        return df
+
+    def columns(self, dataset_id):
+        """Column names of a dataset, without loading it"""
+        entry = self._lookup(dataset_id)
+        if entry is None:
+            return None
+        if entry['df'] is not None:
+            return list(entry['df'].columns)
+        return entry['columns']
+
+    def version(self, dataset_id):
+        entry = self._lookup(dataset_id)
+        return entry['version'] if entry else None
+
+    def schema(self, dataset_id):
+        """Column kinds and compact dtypes inferred at ingestion"""
+        entry = self._lookup(dataset_id)
+        return entry['schema'] if entry else None
+
+    def cube(self, dataset_id):
+        """Group-by cube of a dataset, or None while it has none"""
+        entry = self._lookup(dataset_id)
+        if entry is None or entry['cube_missing']:
+            return None
+        if entry['cube'] is None:
+            # Built after the upload, possibly by another process
+            data = self.persistence.load_cube(dataset_id)
+            if data is None:
+                entry['cube_missing'] = True
+                return None
+            entry['cube'] = GroupCube.from_dict(data)
+        return entry['cube']
+
+    def put_cube(self, dataset_id, cube):
+        self.persistence.save_cube(dataset_id, cube.to_dict())
+        entry = self._lookup(dataset_id)
+        if entry is not None:
+            entry['cube'] = cube
+            entry['cube_missing'] = False
+
+    def __contains__(self, dataset_id):
+        return self._lookup(dataset_id) is not None
+
+    def remove(self, dataset_id):
+        """Forget a dataset and delete its files"""
+        entry = self._lookup(dataset_id)
+        with self._lock:
+            self._entries.pop(dataset_id, None)
+            if entry is None:
+                return None
+            if self._latest_id == dataset_id:
+                self._latest_id = next(reversed(self._entries), None)
+        if self.registry is not None:
+            self.registry.remove(dataset_id)
+        self.persistence.delete(dataset_id)
+        return entry['version']
+
+    def resident_bytes(self):
+        with self._lock:
+            return sum(e['nbytes'] for e in self._entries.values() if e['df'] is not None)
+
+    def _evict(self, keep):
+        """Drop least recently used datasets from memory until the resident total fits the budget"""
+        resident = self.resident_bytes()
+        for dataset_id, entry in self._entries.items():
+            if resident <= self.memory_budget:
+                break
+            if dataset_id == keep or entry['df'] is None:
+                continue
+            # Already persisted at upload time, so nothing to write here
+            entry['df'] = None
+            entry['checked'] = 0
+            resident -= entry['nbytes']
+
+    def stats(self):
+        with self._lock:
+            return {
+                'datasets': len(self._entries),
+                'resident': sum(1 for e in self._entries.values() if e['df'] is not None),
+                'resident_bytes': self.resident_bytes(),
+                'memory_budget': self.memory_budget
+            }
@@ -0,0 +1,293 @@
+import numpy as np
+import pandas as pd
+
+from utils.correlation import top_correlations
+
+
+class QuantileSketch:
+    """Mergeable KLL-style quantile sketch with bounded memory.
+
+    Values enter level 0; whenever a level holds more than `k` items it is
+    sorted and every other item (random offset) is promoted to the next level,
+    where each item weighs twice as much. Rank error is roughly O(1/k).
+    """
+
+    def __init__(self, k=4096, seed=0):
+        self.k = k
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if len(values):
+            self.levels[0] = np.concatenate([self.levels[0], values])
+            self._compress()
+
+    def merge(self, other):
+        for level, items in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self._compress()
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self.k:
+                items = np.sort(items)
+                # An odd item out stays at this level so no weight is lost
+                kept = items[-1:] if len(items) % 2 else items[:0]
+                items = items[:len(items) - len(kept)]
+                promoted = items[self._rng.integers(2)::2]
+                self.levels[level] = kept
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
+
+    def quantile(self, q):
+        values = np.concatenate(self.levels)
+        if len(values) == 0:
+            return None
+        weights = np.concatenate([np.full(len(items), 2.0 ** level) for level, items in enumerate(self.levels)])
+        order = np.argsort(values)
+        cumulative = np.cumsum(weights[order])
+        position = np.searchsorted(cumulative, q * cumulative[-1])
+        return float(values[order][min(position, len(values) - 1)])
+
+
+class HyperLogLog:
+    """Distinct-count estimator over 2**p registers (about 1.04 / sqrt(2**p) relative error)"""
+
+    def __init__(self, p=14):
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype=np.uint8)
+
+    def update(self, values):
+        if len(values) == 0:
+            return
+        hashes = pd.util.hash_array(np.asarray(values, dtype=object))
+        index = (hashes >> np.uint64(64 - self.p)).astype(np.int64)
+        rest = (hashes << np.uint64(self.p)) | np.uint64(1 << (self.p - 1))
+        # Rank = position of the first set bit in the remaining 64 - p bits
+        rank = np.maximum(64 - np.floor(np.log2(rest.astype(float))).astype(np.int64), 1)
+        np.maximum.at(self.registers, index, rank.astype(np.uint8))
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(2.0 ** -self.registers.astype(float))
+        zeros = np.count_nonzero(self.registers == 0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+
+class HeavyHitters:
+    """Space-Saving style frequent-value counter holding at most `capacity` values.
+
+    Counts stay exact while the column has fewer distinct values than the
+    capacity; after that only the heaviest values are kept and their counts
+    may be overestimated by at most `error`.
+    """
+
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.counts = {}
+        self.error = 0
+        self.exact = True
+
+    def update(self, value_counts):
+        for value, count in value_counts.items():
+            self.counts[value] = self.counts.get(value, 0) + int(count)
+        if len(self.counts) > self.capacity:
+            ranked = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)
+            self.error = max(self.error, ranked[self.capacity][1])
+            self.counts = dict(ranked[:self.capacity])
+            self.exact = False
+
+    def top(self, n):
+        return sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:n]
+
+
+class StreamingAnalyzer:
+    """One-pass, bounded-memory equivalent of `DataAnalyzer.analyze_dataset`.
+
+    Chunks are fed with `update`; `result` returns the same schema as
+    `analyze_dataset`. Mean/std/min/max are exact (Chan/Welford merge), the
+    median comes from a quantile sketch, correlations from shifted co-moment
+    sums over pairwise-complete rows, and categorical info from heavy-hitter
+    and HyperLogLog sketches.
+    """
+
+    def __init__(self, sketch_size=4096, heavy_hitters=1000):
+        self.sketch_size = sketch_size
+        self.heavy_hitters = heavy_hitters
+        self.columns = None
+        self.numeric_cols = None
+        self.categorical_cols = None
+        self.total_rows = 0
+
+    def _start(self, chunk):
+        self.columns = list(chunk.columns)
+        self.numeric_cols = chunk.select_dtypes(include=[np.number]).columns.tolist()
+        self.categorical_cols = chunk.select_dtypes(include=['object', 'category', 'bool']).columns.tolist()
+        self.missing = {col: 0 for col in self.columns}
+
+        p = len(self.numeric_cols)
+        self.count = np.zeros(p)
+        self.mean = np.zeros(p)
+        self.m2 = np.zeros(p)
+        self.min = np.full(p, np.inf)
+        self.max = np.full(p, -np.inf)
+        self.sketches = [QuantileSketch(self.sketch_size) for _ in range(p)]
+
+        # Shift for the co-moment sums, keeps them numerically stable
+        self.shift = np.nan_to_num(chunk[self.numeric_cols].mean().to_numpy(dtype=float)) if p else np.zeros(0)
+        self.pair_n = np.zeros((p, p))
+        self.pair_sum = np.zeros((p, p))
+        self.pair_sumsq = np.zeros((p, p))
+        self.pair_cross = np.zeros((p, p))
+
+        self.hitters = {col: HeavyHitters(self.heavy_hitters) for col in self.categorical_cols}
+        self.distinct = {col: HyperLogLog() for col in self.categorical_cols}
+
+    def coerce(self, chunk):
+        """A copy of a chunk with the dtypes decided from the first chunk"""
+        if self.columns is None:
+            self._start(chunk)
+        for col in self.numeric_cols:
+            if not pd.api.types.is_numeric_dtype(chunk[col]):
+                chunk = chunk.copy(deep=False)
+                chunk[col] = pd.to_numeric(chunk[col], errors='coerce')
+        return chunk
+
+    def update(self, chunk):
+        chunk = self.coerce(chunk)
+        self.total_rows += len(chunk)
+        for col, missing in chunk.isnull().sum().items():
+            self.missing[col] += int(missing)
+
+        if self.numeric_cols:
+            self._update_numeric(chunk[self.numeric_cols].to_numpy(dtype=float))
+
+        for col in self.categorical_cols:
+            values = chunk[col].dropna()
+            if chunk[col].dtype == 'bool':
+                values = values.astype(str)
+            self.hitters[col].update(values.value_counts(sort=False))
+            self.distinct[col].update(values.to_numpy())
+        return chunk
+
+    def _update_numeric(self, block):
+        present = ~np.isnan(block)
+        n = present.sum(axis=0).astype(float)
+        filled = np.where(present, block, 0.0)
+
+        # Chan et al. parallel merge of (count, mean, M2)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            chunk_mean = np.where(n > 0, filled.sum(axis=0) / n, 0.0)
+            chunk_m2 = (np.where(present, block - chunk_mean, 0.0) ** 2).sum(axis=0)
+            total = self.count + n
+            delta = chunk_mean - self.mean
+            self.mean = np.where(total > 0, self.mean + delta * n / total, 0.0)
+            self.m2 = np.where(total > 0, self.m2 + chunk_m2 + delta ** 2 * self.count * n / total, 0.0)
+        self.count = total
+        self.min = np.minimum(self.min, np.where(present, block, np.inf).min(axis=0))
+        self.max = np.maximum(self.max, np.where(present, block, -np.inf).max(axis=0))
+
+        for i, sketch in enumerate(self.sketches):
+            sketch.update(block[present[:, i], i])
+
+        shifted = np.where(present, block - self.shift, 0.0)
+        mask = present.astype(float)
+        self.pair_n += mask.T @ mask
+        self.pair_sum += shifted.T @ mask
+        self.pair_sumsq += (shifted ** 2).T @ mask
+        self.pair_cross += shifted.T @ shifted
+
+    def correlation_matrix(self):
+        n = self.pair_n
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cov = n * self.pair_cross - self.pair_sum * self.pair_sum.T
+            var_i = n * self.pair_sumsq - self.pair_sum ** 2
+            corr = cov / np.sqrt(var_i * var_i.T)
+        corr[n < 2] = np.nan
+        return np.clip(corr, -1.0, 1.0)
+
+    def result(self):
+        """Analysis in the same schema as `DataAnalyzer.analyze_dataset`"""
+        if self.columns is None:
+            return None
+
+        analysis = {
+            'statistics': {},
+            'correlations': {},
+            'categorical_info': {},
+            'dataset_summary': {
+                'total_rows': self.total_rows,
+                'total_columns': len(self.columns),
+                'numeric_columns': len(self.numeric_cols),
+                'categorical_columns': len(self.categorical_cols),
+                'missing_values': dict(self.missing)
+            }
+        }
+
+        for i, col in enumerate(self.numeric_cols):
+            if self.count[i] == 0:
+                analysis['statistics'][col] = {'mean': None, 'median': None, 'min': None, 'max': None, 'std': None}
+                continue
+            analysis['statistics'][col] = {
+                'mean': float(self.mean[i]),
+                'median': self.sketches[i].quantile(0.5),
+                'min': float(self.min[i]),
+                'max': float(self.max[i]),
+                'std': float(np.sqrt(self.m2[i] / (self.count[i] - 1))) if self.count[i] > 1 else None
+            }
+
+        if len(self.numeric_cols) > 1:
+            analysis['correlations'] = top_correlations(self.correlation_matrix(), self.numeric_cols, k=10)
+
+        for col in self.categorical_cols:
+            hitters = self.hitters[col]
+            unique_count = len(hitters.counts) if hitters.exact else self.distinct[col].count()
+
+            if unique_count > 20:
+                analysis['categorical_info'][col] = {
+                    'unique_count': unique_count,
+                    'top_20_values': {str(k): int(v) for k, v in hitters.top(20)},
+                    'note': f'Showing top 20 out of {unique_count} unique values'
+                }
+            else:
+                analysis['categorical_info'][col] = {
+                    'unique_count': unique_count,
+                    'unique_values': [str(v) for v in list(hitters.counts)[:50]],
+                    'value_counts': {str(k): int(v) for k, v in hitters.top(unique_count)}
+                }
+
+        return analysis
+
+
+def read_csv_streaming(file, chunksize=100_000, analyzer=None, on_chunk=None, prepare=None):
+    """Read a CSV in chunks, analyzing every chunk as it is parsed.
+
+    `prepare(chunk)` may convert each raw chunk first (e.g. schema dtypes);
+    without it chunks are coerced to the dtypes of the first one.
+    `on_chunk(chunk, rows_so_far)` is called with each converted chunk,
+    e.g. to persist it; the analysis is returned once the file is consumed.
+    """
+    analyzer = analyzer or StreamingAnalyzer()
+    for chunk in pd.read_csv(file, chunksize=chunksize):
+        if prepare is not None:
+            chunk = prepare(chunk)
+            analyzer.update(chunk)
+        else:
+            chunk = analyzer.update(chunk)
+        if on_chunk is not None:
+            on_chunk(chunk, analyzer.total_rows)
+    return analyzer.result()